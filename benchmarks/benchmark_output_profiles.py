@@ -0,0 +1,138 @@
+"""
+Benchmark of the GeoTIFF output profiles used by download_image()
+
+Writes the same raster with every profile in raster_stack.OUTPUT_PROFILES
+and compares:
+1. Write time and file size
+2. Full read throughput (decompressed MB/s)
+3. Random 256x256 window reads per second (patch sampling for training)
+4. Reading a 1/8 resolution preview, which COG overviews serve directly
+
+By default the raster is a synthetic Sentinel-2-like reflectance stack
+(smooth spatial structure plus sensor noise, uint16 0-10000). Pass --input
+to benchmark a real downloaded GeoTIFF instead.
+
+Usage:
+    python benchmarks/benchmark_output_profiles.py
+    python benchmarks/benchmark_output_profiles.py --size 4096 --bands 4
+    python benchmarks/benchmark_output_profiles.py --input ./images/pair_0000_S2.tif
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from raster_stack import OUTPUT_PROFILES, write_raster  # noqa: E402
+
+
+def synthetic_reflectance(bands: int, size: int, seed: int = 0) -> np.ndarray:
+    """Smooth land-cover-like fields with per-pixel noise, as uint16 reflectance."""
+    rng = np.random.default_rng(seed)
+    coarse = rng.uniform(500, 4000, size=(bands, size // 64 + 2, size // 64 + 2))
+    # Bilinear upsampling of the coarse field gives large homogeneous patches
+    positions = np.linspace(0, coarse.shape[1] - 1.001, size)
+    i0 = positions.astype(int)
+    w = (positions - i0)[None, :, None]
+    rows = coarse[:, i0, :] * (1 - w) + coarse[:, i0 + 1, :] * w
+    w = (positions - i0)[None, None, :]
+    field = rows[:, :, i0] * (1 - w) + rows[:, :, i0 + 1] * w
+    noise = rng.normal(0, 25, size=field.shape)
+    return np.clip(field + noise, 0, 10000).astype(np.uint16)
+
+
+def load_input(path: str):
+    import rasterio
+
+    with rasterio.open(path) as src:
+        return src.read(), {'crs': src.crs, 'transform': src.transform, 'nodata': src.nodata}
+
+
+def benchmark_profile(profile: str, array: np.ndarray, meta: dict, directory: str,
+                      windows: int, repeats: int) -> dict:
+    import rasterio
+    from rasterio.windows import Window
+
+    path = os.path.join(directory, f"{profile}.tif")
+
+    start = time.perf_counter()
+    write_raster(array, meta, path, profile=profile)
+    write_seconds = time.perf_counter() - start
+
+    raw_mb = array.nbytes / 1e6
+    full_seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with rasterio.open(path) as src:
+            src.read()
+        full_seconds.append(time.perf_counter() - start)
+
+    rng = np.random.default_rng(1)
+    _, height, width = array.shape
+    patch = min(256, height, width)
+    offsets = [(int(rng.integers(0, height - patch + 1)), int(rng.integers(0, width - patch + 1)))
+               for _ in range(windows)]
+    start = time.perf_counter()
+    with rasterio.open(path) as src:
+        for row, col in offsets:
+            src.read(window=Window(col, row, patch, patch))
+    window_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with rasterio.open(path) as src:
+        src.read(out_shape=(src.count, max(height // 8, 1), max(width // 8, 1)))
+        overviews = len(src.overviews(1))
+    preview_seconds = time.perf_counter() - start
+
+    return {
+        'profile': profile,
+        'size_mb': os.path.getsize(path) / 1e6,
+        'ratio': raw_mb / (os.path.getsize(path) / 1e6),
+        'write_s': write_seconds,
+        'read_mb_s': raw_mb / min(full_seconds),
+        'windows_s': windows / window_seconds,
+        'preview_ms': preview_seconds * 1000,
+        'overviews': overviews
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input', help='Existing GeoTIFF to benchmark instead of synthetic data')
+    parser.add_argument('--size', type=int, default=2048, help='Synthetic raster width/height (default: 2048)')
+    parser.add_argument('--bands', type=int, default=4, help='Synthetic band count (default: 4)')
+    parser.add_argument('--windows', type=int, default=200, help='Random window reads (default: 200)')
+    parser.add_argument('--repeats', type=int, default=3, help='Full read repetitions (default: 3)')
+    args = parser.parse_args()
+
+    from rasterio.crs import CRS
+    from rasterio.transform import from_origin
+
+    if args.input:
+        array, meta = load_input(args.input)
+    else:
+        array = synthetic_reflectance(args.bands, args.size)
+        meta = {'crs': CRS.from_epsg(32629), 'transform': from_origin(500000, 4200000, 10, 10),
+                'nodata': 0}
+
+    print(f"Raster: {array.shape[0]} bands x {array.shape[1]} x {array.shape[2]} "
+          f"{array.dtype} ({array.nbytes / 1e6:.1f} MB uncompressed)")
+    print("-" * 96)
+    print(f"{'profile':<10} {'size MB':>9} {'ratio':>7} {'write s':>8} {'read MB/s':>10} "
+          f"{'windows/s':>10} {'1/8 preview ms':>15} {'overviews':>10}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for profile in OUTPUT_PROFILES:
+            result = benchmark_profile(profile, array, meta, directory, args.windows, args.repeats)
+            print(f"{result['profile']:<10} {result['size_mb']:>9.1f} {result['ratio']:>7.2f} "
+                  f"{result['write_s']:>8.2f} {result['read_mb_s']:>10.0f} {result['windows_s']:>10.0f} "
+                  f"{result['preview_ms']:>15.1f} {result['overviews']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Startup-time benchmark of the dataset modules and the command-line entry point
+
+Runs every case in a fresh interpreter, as a cron-driven worker does, and
+reports:
+1. Median wall time of `import sentinel_dataset_mpc`, `import sentinel_dataset`
+   and `python sentinel_cli.py --help`
+2. Which heavy dependencies (ee, pandas, planetary_computer, pystac_client,
+   pystac, shapely, rasterio) each case loaded
+
+Passing a git revision as --compare runs the same cases on that revision
+(extracted with git archive into a temporary directory), e.g. the commit
+before the lazy imports, and prints the speedup.
+
+Usage:
+    python benchmarks/benchmark_startup.py
+    python benchmarks/benchmark_startup.py --compare HEAD~1 --runs 20
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+HEAVY_MODULES = ('ee', 'pandas', 'planetary_computer', 'pystac_client', 'pystac', 'shapely', 'rasterio')
+
+# Each case imports or runs something and prints the heavy modules it loaded
+CASES = {
+    'import sentinel_dataset_mpc': 'import sentinel_dataset_mpc',
+    'import sentinel_dataset': 'import sentinel_dataset',
+    'sentinel_cli.py --help': ('import contextlib, io, sentinel_cli\n'
+                               'with contextlib.redirect_stdout(io.StringIO()):\n'
+                               '    try:\n'
+                               '        sentinel_cli.main(["--help"])\n'
+                               '    except SystemExit:\n'
+                               '        pass'),
+}
+
+REPORT = ('\nimport json, sys\n'
+          f'print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))')
+
+
+def run_case(source: str, directory: str) -> Optional[Dict]:
+    """Wall time and loaded heavy modules of one fresh interpreter, or None when it fails."""
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, '-c', source + REPORT], cwd=directory,
+                             capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    if process.returncode != 0:
+        return None
+    return {'seconds': seconds, 'loaded': json.loads(process.stdout.strip().splitlines()[-1])}
+
+
+def benchmark(directory: str, runs: int) -> Dict[str, Optional[Dict]]:
+    """Median time and loaded modules of every case, run from directory."""
+    results = {}
+    for name, source in CASES.items():
+        samples = [run_case(source, directory) for _ in range(runs)]
+        if any(sample is None for sample in samples):
+            results[name] = None
+            continue
+        results[name] = {'seconds': statistics.median(sample['seconds'] for sample in samples),
+                         'loaded': samples[0]['loaded']}
+    return results
+
+
+def checkout(revision: str, directory: str):
+    """Extract the tree of a git revision into directory."""
+    archive = os.path.join(directory, 'tree.tar')
+    subprocess.run(['git', 'archive', '--format=tar', '-o', archive, revision], cwd=REPO, check=True)
+    with tarfile.open(archive) as tar:
+        tar.extractall(directory)
+
+
+def print_results(results: Dict[str, Optional[Dict]], baseline: Optional[Dict[str, Optional[Dict]]] = None,
+                  revision: Optional[str] = None):
+    header = f"{'case':<28} {'ms':>8}"
+    if baseline is not None:
+        header += f" {revision + ' ms':>16} {'speedup':>8}"
+    print(header + "  heavy modules loaded")
+    print("-" * 96)
+    for name, result in results.items():
+        if result is None:
+            print(f"{name:<28} {'failed':>8}")
+            continue
+        line = f"{name:<28} {result['seconds'] * 1000:>8.0f}"
+        if baseline is not None:
+            before = baseline.get(name)
+            if before is None:
+                line += f" {'n/a':>16} {'':>8}"
+            else:
+                line += (f" {before['seconds'] * 1000:>16.0f}"
+                         f" {before['seconds'] / result['seconds']:>7.1f}x")
+        print(f"{line}  {', '.join(result['loaded']) or '-'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='Interpreter starts per case, median is kept (default: 10)')
+    parser.add_argument('--compare', metavar='REVISION', help='Also benchmark this git revision, e.g. HEAD~1')
+    parser.add_argument('--output', help='Save results to this JSON file')
+    args = parser.parse_args()
+
+    # Time of a bare interpreter, which no change to this package can reduce
+    bare = statistics.median(run_case('pass', REPO)['seconds'] for _ in range(args.runs))
+    print(f"Python startup: {bare * 1000:.0f} ms ({sys.executable})\n")
+
+    results = benchmark(REPO, args.runs)
+    baseline = None
+    if args.compare:
+        with tempfile.TemporaryDirectory() as directory:
+            checkout(args.compare, directory)
+            baseline = benchmark(directory, args.runs)
+    print_results(results, baseline, args.compare)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python_startup': bare, 'results': results,
+                       'compare': args.compare, 'baseline': baseline}, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+Offline fixtures for the benchmarks: synthetic catalogs, a local STAC client
+and small COG files
+
+This module provides stand-ins for the live services used by
+sentinel_dataset_mpc.py, so its performance can be measured without network
+access:
+1. Synthetic Sentinel-1 / Sentinel-2 scene catalogs with realistic revisit
+   times, as metadata records, SceneCatalog columns (up to 10^6 scenes) or
+   STAC item dictionaries
+2. LocalStacClient, an in-process replacement for pystac_client.Client that
+   answers search() with collection, bbox, datetime, query, sortby and
+   limit paging, with an optional simulated latency per page
+3. Small generated Cloud-Optimized GeoTIFFs with pystac Items pointing at
+   them, for timing download_image() against local files
+"""
+
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from scene_catalog import SceneCatalog  # noqa: E402
+
+BBox = Tuple[float, float, float, float]
+
+# Lisbon area, inside UTM zone 29N
+DEFAULT_BBOX = (-9.3, 38.6, -8.9, 38.9)
+START = datetime(2016, 1, 1, tzinfo=timezone.utc)
+
+# Mean revisit times in days over one area (two satellites, overlapping orbits)
+REVISIT_DAYS = {'s1': 6.0, 's2': 2.5}
+
+
+def synthetic_timestamps(count: int, sensor: str, seed: int = 0) -> np.ndarray:
+    """
+    Sorted acquisition times in epoch milliseconds.
+
+    Scenes arrive with exponential gaps around the sensor's mean revisit time,
+    so the timeline spans about count * revisit days from 2016-01-01; at 10^6
+    scenes it runs centuries ahead, which matching does not care about.
+    """
+    rng = np.random.default_rng(seed)
+    gaps = rng.exponential(REVISIT_DAYS[sensor] * 86_400_000, size=count)
+    start_ms = int(START.timestamp() * 1000)
+    return start_ms + np.cumsum(gaps).astype(np.int64)
+
+
+def synthetic_records(sensor: str, count: int, seed: int = 0) -> List[Dict]:
+    """
+    Scene metadata records as returned by search_sentinel1/2() (without items).
+
+    Args:
+        sensor: 's1' or 's2'
+        count: Number of scenes
+        seed: Random seed (default: 0)
+
+    Returns:
+        List of record dicts with 'id', 'datetime', 'date', 'timestamp',
+        'cloud_cover' or 'orbit_direction', and 'item' set to None
+    """
+    rng = np.random.default_rng(seed + 1)
+    timestamps = synthetic_timestamps(count, sensor, seed)
+    moments = timestamps.astype('datetime64[ms]').astype('datetime64[s]').astype(str)
+    records = []
+    for i, (timestamp, moment) in enumerate(zip(timestamps.tolist(), moments.tolist())):
+        record = {
+            'id': f"{sensor.upper()}_SYNTH_{i:07d}",
+            'datetime': moment.replace('T', ' '),
+            'date': moment[:10],
+            'timestamp': timestamp,
+            'item': None
+        }
+        if sensor == 's2':
+            record['cloud_cover'] = float(rng.uniform(0, 5))
+        else:
+            record['orbit_direction'] = 'ascending' if rng.random() < 0.5 else 'descending'
+        records.append(record)
+    return records
+
+
+def synthetic_catalog(sensor: str, count: int, seed: int = 0,
+                      bbox: BBox = DEFAULT_BBOX) -> SceneCatalog:
+    """
+    Compact SceneCatalog of synthetic scenes, cheap to build at 10^6 scenes.
+
+    Every scene shares one footprint geometry covering bbox.
+    """
+    from shapely.geometry import box
+
+    rng = np.random.default_rng(seed + 1)
+    footprints = np.empty(count, dtype=object)
+    footprints.fill(box(*bbox).buffer(0.5))
+    collection = 'sentinel-2-l2a' if sensor == 's2' else 'sentinel-1-rtc'
+    return SceneCatalog(
+        collection=collection,
+        ids=np.array([f"{sensor.upper()}_SYNTH_{i:07d}" for i in range(count)], dtype=object),
+        timestamps=synthetic_timestamps(count, sensor, seed),
+        cloud_cover=rng.uniform(0, 5, count).astype(np.float32) if sensor == 's2'
+        else np.full(count, np.nan, dtype=np.float32),
+        orbit_codes=rng.integers(0, 2, count).astype(np.int8),
+        orbit_categories=np.array(['ascending', 'descending'], dtype=object),
+        footprints=footprints
+    )
+
+
+def synthetic_item_dicts(sensor: str, count: int, seed: int = 0,
+                         bbox: BBox = DEFAULT_BBOX,
+                         assets: Optional[Dict[str, str]] = None) -> List[Dict]:
+    """
+    STAC item dictionaries in the layout of the Planetary Computer collections.
+
+    Footprints are jittered around bbox so that spatial filters select a
+    realistic share of them.
+
+    Args:
+        sensor: 's1' or 's2'
+        count: Number of items
+        seed: Random seed (default: 0)
+        bbox: Area the footprints are placed around (default: DEFAULT_BBOX)
+        assets: {asset key: href} added to every item (default: None)
+
+    Returns:
+        List of STAC item dicts
+    """
+    rng = np.random.default_rng(seed + 2)
+    records = synthetic_records(sensor, count, seed)
+    collection = 'sentinel-2-l2a' if sensor == 's2' else 'sentinel-1-rtc'
+    min_lon, min_lat, max_lon, max_lat = bbox
+    items = []
+    for record, (dx, dy) in zip(records, rng.uniform(-1.5, 1.5, size=(count, 2)).tolist()):
+        west, south, east, north = min_lon + dx - 0.5, min_lat + dy - 0.5, max_lon + dx + 0.5, max_lat + dy + 0.5
+        properties = {'datetime': record['datetime'].replace(' ', 'T') + 'Z'}
+        if sensor == 's2':
+            properties['eo:cloud_cover'] = record['cloud_cover']
+        else:
+            properties['sat:orbit_state'] = record['orbit_direction']
+        items.append({
+            'type': 'Feature',
+            'stac_version': '1.0.0',
+            'id': record['id'],
+            'collection': collection,
+            'bbox': [west, south, east, north],
+            'geometry': {'type': 'Polygon', 'coordinates': [[
+                [west, south], [east, south], [east, north], [west, north], [west, south]
+            ]]},
+            'properties': properties,
+            'links': [],
+            'assets': {key: {'href': href, 'type': 'image/tiff; application=geotiff; profile=cloud-optimized'}
+                       for key, href in (assets or {}).items()}
+        })
+    return items
+
+
+class LocalItemSearch:
+    """Result of LocalStacClient.search(), mirroring pystac_client.ItemSearch."""
+
+    def __init__(self, client: 'LocalStacClient', features: List[Dict], limit: int,
+                 max_items: Optional[int]):
+        self.client = client
+        self.features = features if max_items is None else features[:max_items]
+        self.limit = limit
+
+    def matched(self) -> int:
+        return len(self.features)
+
+    def pages_as_dicts(self) -> Iterator[Dict]:
+        for start in range(0, len(self.features), self.limit):
+            self.client.pages_served += 1
+            if self.client.page_latency:
+                time.sleep(self.client.page_latency)
+            # Decoded per page, like a response body, so callers may mutate the items
+            yield {'type': 'FeatureCollection',
+                   'features': [json.loads(feature) for feature in self.features[start:start + self.limit]]}
+
+    def items_as_dicts(self) -> Iterator[Dict]:
+        for page in self.pages_as_dicts():
+            yield from page['features']
+
+    def items(self):
+        from pystac import Item
+
+        for feature in self.items_as_dicts():
+            yield Item.from_dict(feature, preserve_dict=False)
+
+
+class LocalStacClient:
+    """
+    In-process stand-in for a STAC API client holding items in memory.
+
+    Supports the search() arguments used by sentinel_dataset_mpc.py. Items
+    are kept serialized and decoded page by page, as from an HTTP response.
+
+    Args:
+        items: STAC item dicts of any collections
+        page_latency: Seconds slept before every page, to model the network (default: 0)
+    """
+
+    def __init__(self, items: List[Dict], page_latency: float = 0.0):
+        self.page_latency = page_latency
+        self.pages_served = 0
+        self.searches = 0
+        self.collections: Dict[str, Dict] = {}
+        for collection in sorted({item['collection'] for item in items}):
+            features = [item for item in items if item['collection'] == collection]
+            self.collections[collection] = {
+                'features': [json.dumps(item) for item in features],
+                'properties': [item['properties'] for item in features],
+                'timestamps': np.array([_parse_ms(item['properties']['datetime']) for item in features],
+                                       dtype=np.int64),
+                'bboxes': np.array([item['bbox'] for item in features], dtype=np.float64).reshape(-1, 4)
+            }
+
+    def search(self, collections: List[str],
+               bbox: Optional[BBox] = None,
+               datetime: Optional[str] = None,
+               query: Optional[Dict] = None,
+               sortby: Optional[List[Dict]] = None,
+               limit: int = 100,
+               max_items: Optional[int] = None) -> LocalItemSearch:
+        self.searches += 1
+        selected = []
+        for collection in collections:
+            data = self.collections.get(collection)
+            if data is None:
+                continue
+            keep = np.ones(len(data['features']), dtype=bool)
+            if bbox is not None:
+                boxes = data['bboxes']
+                keep &= (boxes[:, 0] <= bbox[2]) & (boxes[:, 2] >= bbox[0]) & \
+                        (boxes[:, 1] <= bbox[3]) & (boxes[:, 3] >= bbox[1])
+            if datetime:
+                start, end = datetime.split('/')
+                if start not in ('', '..'):
+                    keep &= data['timestamps'] >= _parse_ms(start)
+                if end not in ('', '..'):
+                    # A bare end date includes the whole day, as in pystac_client
+                    end_ms = _parse_ms(end) + (86_400_000 - 1 if len(end) == 10 else 0)
+                    keep &= data['timestamps'] <= end_ms
+            indices = np.flatnonzero(keep)
+            order = np.argsort(data['timestamps'][indices], kind='stable')
+            if not sortby or sortby[0].get('direction', 'asc') != 'asc':
+                order = order[::-1]
+            selected.extend(data['features'][i] for i in indices[order].tolist()
+                            if _query_matches(data['properties'][i], query))
+        return LocalItemSearch(self, selected, limit, max_items)
+
+
+def _parse_ms(value: str) -> int:
+    """Epoch milliseconds of an ISO date or datetime string (UTC)."""
+    value = value.replace('Z', '+00:00')
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def _query_matches(properties: Dict, query: Optional[Dict]) -> bool:
+    """STAC query extension operators eq, neq, lt, lte, gt, gte."""
+    operators = {
+        'eq': lambda a, b: a == b, 'neq': lambda a, b: a != b,
+        'lt': lambda a, b: a < b, 'lte': lambda a, b: a <= b,
+        'gt': lambda a, b: a > b, 'gte': lambda a, b: a >= b
+    }
+    for field, conditions in (query or {}).items():
+        value = properties.get(field)
+        for operator, expected in conditions.items():
+            if value is None or not operators[operator](value, expected):
+                return False
+    return True
+
+
+def write_cog_fixtures(directory: str, size: int = 1024, seed: int = 0) -> Dict:
+    """
+    Write small S2 and S1 COG assets and pystac Items pointing at them.
+
+    The S2 item has 10 m bands B02/B03/B04/B08 and a 20 m B11; the S1 item
+    has float32 vv/vh backscatter at 10 m. All share a UTM 29N grid.
+
+    Args:
+        directory: Output directory
+        size: Width and height of the 10 m bands in pixels (default: 1024)
+        seed: Random seed (default: 0)
+
+    Returns:
+        Dict with the 's1_item' and 's2_item' pystac Items and the 'bbox'
+        (WGS84) of the central quarter of the rasters
+    """
+    from pystac import Item
+    from rasterio.crs import CRS
+    from rasterio.transform import from_origin
+    from rasterio.warp import transform_bounds
+
+    from benchmark_output_profiles import synthetic_reflectance
+    from raster_stack import write_raster
+
+    os.makedirs(directory, exist_ok=True)
+    crs = CRS.from_epsg(32629)
+    x0, y0 = 480000, 4300000
+    hrefs = {'s1': {}, 's2': {}}
+
+    for i, band in enumerate(['B02', 'B03', 'B04', 'B08']):
+        path = os.path.join(directory, f"S2_{band}.tif")
+        array = synthetic_reflectance(1, size, seed=seed + i)
+        write_raster(array, {'crs': crs, 'transform': from_origin(x0, y0, 10, 10), 'nodata': 0},
+                     path, profile='cog')
+        hrefs['s2'][band] = path
+
+    path = os.path.join(directory, "S2_B11.tif")
+    write_raster(synthetic_reflectance(1, size // 2, seed=seed + 10),
+                 {'crs': crs, 'transform': from_origin(x0, y0, 20, 20), 'nodata': 0}, path, profile='cog')
+    hrefs['s2']['B11'] = path
+
+    rng = np.random.default_rng(seed)
+    for band in ('vv', 'vh'):
+        path = os.path.join(directory, f"S1_{band}.tif")
+        array = rng.gamma(2.0, 0.05, size=(1, size, size)).astype(np.float32)
+        write_raster(array, {'crs': crs, 'transform': from_origin(x0, y0, 10, 10), 'nodata': None},
+                     path, profile='cog')
+        hrefs['s1'][band] = path
+
+    extent = size * 10
+    quarter = (x0 + extent / 4, y0 - 3 * extent / 4, x0 + 3 * extent / 4, y0 - extent / 4)
+    bbox = transform_bounds(crs, 'EPSG:4326', *quarter)
+    outline = transform_bounds(crs, 'EPSG:4326', x0, y0 - extent, x0 + extent, y0)
+
+    fixtures = {'bbox': bbox}
+    for sensor in ('s1', 's2'):
+        item = synthetic_item_dicts(sensor, 1, seed=seed, bbox=outline, assets=hrefs[sensor])[0]
+        fixtures[f'{sensor}_item'] = Item.from_dict(item, preserve_dict=False)
+    return fixtures
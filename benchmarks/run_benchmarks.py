@@ -0,0 +1,260 @@
+"""
+Offline benchmark suite for sentinel_dataset_mpc.py
+
+Times the main code paths against the fixtures in benchmarks/fixtures.py,
+without Planetary Computer or Earth Engine access:
+1. match_temporal_pairs() on synthetic record lists and SceneCatalogs
+   (up to 10^6 Sentinel-2 scenes with --max-scenes 1000000)
+2. Pair metadata serialization: matched_pairs.json versus the indexed
+   matched_pairs.jsonl store (write, load, date query, append)
+3. Search pagination through an in-process STAC client (full pystac Items,
+   compact catalogs, paged iteration), with an optional simulated latency
+4. download_image() on generated local COGs (full scene, bbox window,
+   COG output, stacked bands)
+
+Results are printed as a table and can be saved as JSON. Passing an earlier
+result file as --baseline compares every case and exits with status 1 when
+one got slower than the tolerance, so the suite can gate changes in CI.
+
+Usage:
+    python benchmarks/run_benchmarks.py --quick
+    python benchmarks/run_benchmarks.py --output baseline.json
+    python benchmarks/run_benchmarks.py --baseline baseline.json --tolerance 0.25
+    python benchmarks/run_benchmarks.py --only matching --max-scenes 1000000
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from fixtures import (LocalStacClient, synthetic_catalog, synthetic_item_dicts,  # noqa: E402
+                      synthetic_records, write_cog_fixtures)
+
+SUITES = ('matching', 'metadata', 'search', 'download')
+
+
+def measure(fn: Callable, repeats: int = 3) -> float:
+    """Best wall time of repeats calls, with the module's progress output silenced."""
+    best = float('inf')
+    for _ in range(repeats):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+def result(name: str, seconds: float, count: Optional[float] = None, unit: str = '') -> Dict:
+    return {
+        'name': name,
+        'seconds': seconds,
+        'rate': count / seconds if count is not None and seconds > 0 else None,
+        'unit': unit
+    }
+
+
+def bench_matching(sizes: List[int], max_scenes: int, repeats: int) -> List[Dict]:
+    from sentinel_dataset_mpc import match_temporal_pairs
+
+    results = []
+    for n in sizes:
+        s2 = synthetic_records('s2', n, seed=1)
+        s1 = synthetic_records('s1', max(n * 5 // 12, 1), seed=2)
+        for matching in ('nearest', 'one_to_one'):
+            seconds = measure(lambda: match_temporal_pairs(s1, s2, 3, matching), repeats)
+            results.append(result(f"match/{matching}/records/n={n}", seconds, n, 'S2 scenes/s'))
+
+    for n in sorted(set(sizes) | ({max_scenes} if max_scenes > max(sizes) else set())):
+        s2 = synthetic_catalog('s2', n, seed=1)
+        s1 = synthetic_catalog('s1', max(n * 5 // 12, 1), seed=2)
+        seconds = measure(lambda: match_temporal_pairs(s1, s2, 3, 'nearest'),
+                          repeats if n <= 100_000 else 1)
+        results.append(result(f"match/nearest/catalog/n={n}", seconds, n, 'S2 scenes/s'))
+    return results
+
+
+def bench_metadata(n_pairs: int, repeats: int) -> List[Dict]:
+    from pair_store import PairStore, load_matched_pairs
+    from sentinel_dataset_mpc import _save_metadata, match_temporal_pairs
+
+    s2 = synthetic_records('s2', n_pairs, seed=1)
+    s1 = synthetic_records('s1', n_pairs, seed=2)
+    with contextlib.redirect_stdout(io.StringIO()):
+        pairs = match_temporal_pairs(s1, s2, 3)
+    for pair in pairs:
+        pair['overlap'] = 1.0
+    settings = {'bbox': [0, 0, 1, 1], 'start_date': '2016-01-01', 'end_date': pairs[-1]['s2_date']}
+    middle = pairs[len(pairs) // 2]['s2_date']
+    month_end = str(np.datetime64(middle) + np.timedelta64(30, 'D'))
+    extra = pairs[-100:]
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for metadata_format in ('json', 'jsonl'):
+            seconds = measure(lambda: _save_metadata(directory, pairs, n_pairs, n_pairs, settings,
+                                                     metadata_format), repeats)
+            results.append(result(f"metadata/{metadata_format}/write/n={len(pairs)}", seconds,
+                                  len(pairs), 'pairs/s'))
+
+        path = os.path.join(directory, 'matched_pairs.json')
+        seconds = measure(lambda: load_matched_pairs(path), repeats)
+        results.append(result(f"metadata/json/load/n={len(pairs)}", seconds, len(pairs), 'pairs/s'))
+        seconds = measure(lambda: load_matched_pairs(path, start_date=middle, end_date=month_end), repeats)
+        results.append(result(f"metadata/json/query-month/n={len(pairs)}", seconds))
+
+        store = PairStore(os.path.join(directory, 'matched_pairs.jsonl'))
+        seconds = measure(lambda: store.load(), repeats)
+        results.append(result(f"metadata/jsonl/load/n={len(pairs)}", seconds, len(pairs), 'pairs/s'))
+        seconds = measure(lambda: list(store.query(start_date=middle, end_date=month_end)), repeats)
+        results.append(result(f"metadata/jsonl/query-month/n={len(pairs)}", seconds))
+
+        # Adding 100 pairs: rewrite the JSON file versus append to the store
+        seconds = measure(lambda: _save_metadata(directory, pairs + extra, n_pairs, n_pairs, settings), 1)
+        results.append(result(f"metadata/json/add-100/n={len(pairs)}", seconds))
+        seconds = measure(lambda: store.append(extra), 1)
+        results.append(result(f"metadata/jsonl/add-100/n={len(pairs)}", seconds))
+    return results
+
+
+def bench_search(n_items: int, page_latency: float, repeats: int) -> List[Dict]:
+    from sentinel_dataset_mpc import _run_search, iter_search_pages
+
+    client = LocalStacClient(synthetic_item_dicts('s2', n_items, seed=1) +
+                             synthetic_item_dicts('s1', n_items // 2, seed=2),
+                             page_latency=page_latency)
+    bbox = (-9.3, 38.6, -8.9, 38.9)
+    args = ('sentinel-2-l2a', bbox, '2016-01-01', '2100-12-31', {'eo:cloud_cover': {'lt': 5.0}})
+    found = client.search(['sentinel-2-l2a'], bbox=bbox, datetime='2016-01-01/2100-12-31',
+                          query=args[-1]).matched()
+
+    results = []
+    seconds = measure(lambda: _run_search(client, *args), repeats)
+    results.append(result(f"search/items/n={found}", seconds, found, 'items/s'))
+    seconds = measure(lambda: _run_search(client, *args, as_catalog=True), repeats)
+    results.append(result(f"search/catalog/n={found}", seconds, found, 'items/s'))
+    for page_size in (100, 1000):
+        client.pages_served = 0
+        seconds = measure(lambda: sum(len(page) for page in iter_search_pages(client, *args,
+                                                                              page_size=page_size)),
+                          repeats)
+        results.append(result(f"search/pages/size={page_size}/n={found}", seconds, found, 'items/s'))
+    return results
+
+
+def bench_download(size: int, repeats: int) -> List[Dict]:
+    from sentinel_dataset_mpc import download_image
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        fixtures = write_cog_fixtures(os.path.join(directory, 'assets'), size=size)
+        s2, s1, bbox = fixtures['s2_item'], fixtures['s1_item'], fixtures['bbox']
+        output = os.path.join(directory, 'out.tif')
+        bands = ['B04', 'B03', 'B02']
+        megabytes = len(bands) * size * size * 2 / 1e6
+
+        cases = [
+            ('full', lambda: download_image(s2, output, bands=bands), megabytes),
+            ('bbox', lambda: download_image(s2, output, bands=bands, bbox=bbox), megabytes / 4),
+            ('full-cog', lambda: download_image(s2, output, bands=bands, output_profile='cog'), megabytes),
+            ('stack-bbox', lambda: download_image(s2, output, bands=bands + ['B08', 'B11'], bbox=bbox,
+                                                  stack=True), megabytes / 4 * 5 / 3),
+            ('s1-full', lambda: download_image(s1, output, bands=['vv', 'vh']), 2 * size * size * 4 / 1e6)
+        ]
+        for name, fn, mb in cases:
+            seconds = measure(fn, repeats)
+            results.append(result(f"download/{name}/size={size}", seconds, mb, 'MB/s'))
+    return results
+
+
+def compare(results: List[Dict], baseline_path: str, tolerance: float,
+            min_delta: float = 0.005) -> List[str]:
+    """Names of the cases slower than baseline * (1 + tolerance) by more than min_delta seconds."""
+    with open(baseline_path) as f:
+        baseline = {entry['name']: entry for entry in json.load(f)['results']}
+
+    regressions = []
+    print(f"\nComparison with {baseline_path} (tolerance {tolerance:.0%})")
+    for entry in results:
+        previous = baseline.get(entry['name'])
+        if previous is None:
+            continue
+        change = entry['seconds'] / previous['seconds'] - 1 if previous['seconds'] > 0 else 0.0
+        slower = entry['seconds'] - previous['seconds']
+        flag = 'REGRESSION' if change > tolerance and slower > min_delta else ''
+        print(f"  {entry['name']:<44} {previous['seconds']:>9.4f}s -> {entry['seconds']:>9.4f}s "
+              f"({change:+.0%}) {flag}")
+        if flag:
+            regressions.append(entry['name'])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', choices=SUITES, action='append', help='Run only these suites (repeatable)')
+    parser.add_argument('--quick', action='store_true', help='Small sizes for a fast smoke run')
+    parser.add_argument('--max-scenes', type=int, default=100_000,
+                        help='Largest compact catalog matched, up to 1000000 (default: 100000)')
+    parser.add_argument('--page-latency', type=float, default=0.0,
+                        help='Simulated seconds per search page (default: 0)')
+    parser.add_argument('--raster-size', type=int, default=2048, help='COG fixture size in pixels (default: 2048)')
+    parser.add_argument('--repeats', type=int, default=3, help='Repetitions per case, best is kept (default: 3)')
+    parser.add_argument('--output', help='Save results to this JSON file')
+    parser.add_argument('--baseline', help='Earlier --output file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed slowdown before a case counts as a regression (default: 0.25)')
+    parser.add_argument('--min-delta', type=float, default=0.005,
+                        help='Ignore slowdowns below this many seconds, i.e. timer noise (default: 0.005)')
+    args = parser.parse_args()
+
+    suites = args.only or SUITES
+    sizes = [1_000, 10_000] if args.quick else [1_000, 10_000, 100_000]
+    max_scenes = min(args.max_scenes, 10_000) if args.quick else args.max_scenes
+    raster_size = 512 if args.quick else args.raster_size
+
+    results = []
+    if 'matching' in suites:
+        results += bench_matching(sizes, max_scenes, args.repeats)
+    if 'metadata' in suites:
+        results += bench_metadata(10_000 if args.quick else 100_000, args.repeats)
+    if 'search' in suites:
+        results += bench_search(2_000 if args.quick else 20_000, args.page_latency, args.repeats)
+    if 'download' in suites:
+        results += bench_download(raster_size, args.repeats)
+
+    print(f"{'case':<44} {'seconds':>10} {'throughput':>22}")
+    print("-" * 78)
+    for entry in results:
+        rate = f"{entry['rate']:,.0f} {entry['unit']}" if entry['rate'] is not None else ''
+        print(f"{entry['name']:<44} {entry['seconds']:>10.4f} {rate:>22}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'platform': platform.platform(),
+                'results': results
+            }, f, indent=2)
+        print(f"\nResults saved to: {args.output}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance, args.min_delta)
+        if regressions:
+            print(f"\n{len(regressions)} regressions")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Download Manifest for Resumable Image Exports
+
+This module provides DownloadManifest, the checkpoint file used by
+export_matched_pairs() in sentinel_dataset_mpc.py:
+1. Record every completed scene download, keyed by STAC scene id, with its
+   output path, bands, bbox, output grid, size and SHA-256 checksum
+2. Tell a rerun which scenes are already complete so they are skipped, even
+   when the position-based output file names have changed
+3. Write the manifest and the downloaded files atomically (temp file and
+   rename), so an interrupted run never leaves a half-written file behind
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+MANIFEST_NAME = 'download_manifest.json'
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """Hex SHA-256 digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def temp_path(path: str) -> str:
+    """Temporary sibling of path, renamed onto path once the write has finished."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.part{ext}"
+
+
+def _crs_key(crs) -> Optional[str]:
+    """Requested CRS as stored in the manifest (rasterio CRS objects as strings)."""
+    return None if crs is None else str(crs)
+
+
+class DownloadManifest:
+    """
+    JSON checkpoint of completed scene downloads.
+
+    Entries are keyed by scene id. A scene only counts as complete for a
+    request with the same bands, bbox, output grid (resolution and CRS of
+    resampled stacks) and output profile, and only while its file still
+    exists with the recorded size (and checksum, when verify is set).
+
+    Args:
+        path: Manifest file, usually <output_dir>/download_manifest.json
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f).get('scenes', {})
+
+    def completed_path(self, scene_id: str,
+                       bands: List[str],
+                       bbox: Optional[Tuple[float, float, float, float]] = None,
+                       verify: bool = False,
+                       profile: str = 'gtiff',
+                       resolution: Optional[float] = None,
+                       crs: Optional[str] = None) -> Optional[str]:
+        """
+        Return the file holding a finished download of a scene, if any.
+
+        Args:
+            scene_id: STAC item id
+            bands: Bands requested for the scene
+            bbox: Bbox requested for the scene (default: None)
+            verify: Recompute the SHA-256 checksum instead of trusting the
+                file size alone (default: False)
+            profile: Output profile requested for the scene (default: 'gtiff')
+            resolution: Pixel size requested for a resampled stack (default: None)
+            crs: CRS requested for a resampled stack (default: None)
+
+        Returns:
+            Path of the completed file, or None if the scene must be downloaded
+        """
+        entry = self.entries.get(scene_id)
+        if entry is None or entry['bands'] != list(bands):
+            return None
+        if entry['bbox'] != (list(bbox) if bbox is not None else None):
+            return None
+        if entry.get('profile', 'gtiff') != profile:
+            return None
+        if entry.get('resolution') != resolution or entry.get('crs') != _crs_key(crs):
+            return None
+
+        path = entry['path']
+        if not os.path.exists(path) or os.path.getsize(path) != entry['size']:
+            return None
+        if verify and file_sha256(path) != entry['sha256']:
+            return None
+        return path
+
+    def record(self, scene_id: str,
+               path: str,
+               bands: List[str],
+               bbox: Optional[Tuple[float, float, float, float]] = None,
+               profile: str = 'gtiff',
+               resolution: Optional[float] = None,
+               crs: Optional[str] = None):
+        """
+        Mark a scene as downloaded and save the manifest.
+
+        Args:
+            scene_id: STAC item id
+            path: Completed output file
+            bands: Bands written to the file
+            bbox: Bbox the file was clipped to (default: None)
+            profile: Output profile the file was written with (default: 'gtiff')
+            resolution: Pixel size the file was resampled to (default: None)
+            crs: CRS the file was resampled to (default: None)
+        """
+        entry = {
+            'path': path,
+            'bands': list(bands),
+            'bbox': list(bbox) if bbox is not None else None,
+            'profile': profile,
+            'resolution': resolution,
+            'crs': _crs_key(crs),
+            'size': os.path.getsize(path),
+            'sha256': file_sha256(path),
+            'completed_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+        }
+        with self._lock:
+            self.entries[scene_id] = entry
+            self.save()
+
+    def save(self):
+        """Write the manifest atomically."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        partial = temp_path(self.path)
+        with open(partial, 'w') as f:
+            json.dump({'scenes': self.entries}, f, indent=2)
+        os.replace(partial, self.path)
@@ -0,0 +1,282 @@
+"""
+Earth Engine Export Task Scheduler
+
+This module provides ExportScheduler, used by export_matched_images() in
+sentinel_dataset.py to run large numbers of export tasks:
+1. Keep at most max_running tasks submitted at a time, so long exports stay
+   within Earth Engine's concurrent task limits
+2. Poll the state of all tasks in one Task.list() request per cycle (asking
+   single tasks for their status when the list misses them), resubmit failed
+   tasks with exponential backoff and give up on tasks running too long
+3. Persist job states and task ids in a JSON file, so an interrupted export
+   resumes where it stopped instead of submitting everything again
+
+The ee.batch module is injected (batch argument) and export_matched_images()
+builds its tasks with the same module, so the scheduler can run against a
+mocked batch layer without Earth Engine credentials.
+"""
+
+import json
+import os
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from run_report import log, timings
+
+PENDING = 'PENDING'
+RUNNING = 'RUNNING'
+COMPLETED = 'COMPLETED'
+FAILED = 'FAILED'
+
+# Earth Engine task states (legacy and Cloud API names)
+ACTIVE_STATES = ('UNSUBMITTED', 'READY', 'PENDING', 'RUNNING', 'CANCELLING', 'CANCEL_REQUESTED')
+SUCCESS_STATES = ('COMPLETED', 'SUCCEEDED')
+CANCELLED_STATES = ('CANCELLED',)
+
+
+class ExportScheduler:
+    """
+    Throttled, restartable runner of Earth Engine export tasks.
+
+    Jobs are given as {name: factory}, where factory() builds an unstarted
+    ee.batch.Task. Factories are cheap and deterministic, so after a restart
+    the caller passes the same jobs again and the scheduler reattaches to
+    the tasks recorded in the state file.
+
+    Args:
+        state_path: JSON file holding job states (default: './ee_export_state.json')
+        max_running: Maximum number of tasks submitted at the same time (default: 10)
+        poll_interval: Seconds between status polls (default: 30)
+        max_attempts: Submissions per job before it is marked failed (default: 3)
+        backoff: Delay before the first resubmission in seconds, doubled after
+            each failure (default: 60)
+        max_wait: Seconds a task may stay submitted before its job is marked
+            failed; None waits indefinitely (default: 86400, one day)
+        batch: ee.batch module or a mock with Task (list(), status()) and
+            Export (default: ee.batch)
+    """
+
+    def __init__(self, state_path: str = './ee_export_state.json',
+                 max_running: int = 10,
+                 poll_interval: float = 30,
+                 max_attempts: int = 3,
+                 backoff: float = 60,
+                 max_wait: Optional[float] = 86400,
+                 batch=None):
+        if max_running < 1:
+            raise ValueError("max_running must be at least 1")
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+
+        if batch is None:
+            import ee
+            batch = ee.batch
+
+        self.state_path = state_path
+        self.max_running = max_running
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_wait = max_wait
+        self.batch = batch
+        self.jobs: Dict[str, Dict] = {}
+        # Tasks started by this process, by job name
+        self._tasks: Dict[str, object] = {}
+
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                self.jobs = json.load(f).get('jobs', {})
+
+    def _save(self):
+        """Write the job states atomically."""
+        directory = os.path.dirname(os.path.abspath(self.state_path))
+        os.makedirs(directory, exist_ok=True)
+        partial = f"{self.state_path}.part"
+        with open(partial, 'w') as f:
+            json.dump({'jobs': self.jobs}, f, indent=2)
+        os.replace(partial, self.state_path)
+
+    def _job(self, name: str) -> Dict:
+        return self.jobs.setdefault(name, {
+            'status': PENDING,
+            'task_id': None,
+            'attempts': 0,
+            'not_before': 0.0,
+            'error': None
+        })
+
+    def counts(self, names: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """
+        Number of jobs in every status.
+
+        Args:
+            names: Only count these jobs (default: None, every job in the state file)
+        """
+        counts = {PENDING: 0, RUNNING: 0, COMPLETED: 0, FAILED: 0}
+        for name in self.jobs if names is None else names:
+            counts[self.jobs[name]['status']] += 1
+        return counts
+
+    def poll(self):
+        """
+        Update running jobs from one Task.list() request.
+
+        Tasks missing from the list (it only holds recent tasks of the current
+        project) are asked for their status one by one. Jobs whose task stays
+        active longer than max_wait are marked failed.
+        """
+        running = {job['task_id']: name for name, job in self.jobs.items()
+                   if job['status'] == RUNNING and job['task_id']}
+        if not running:
+            return
+
+        with timings.span('task_poll', items=len(running)):
+            tasks = self.batch.Task.list()
+
+        for task in tasks:
+            name = running.pop(task.id, None)
+            if name is not None:
+                self._update(name, task.state, task)
+
+        for name in running.values():
+            try:
+                with timings.span('task_status', task=name):
+                    state = self._task(name).status().get('state')
+            except Exception as e:
+                log(f"  Status of {name} unavailable: {e}")
+                state = None
+            self._update(name, state)
+
+        if self.max_wait is None:
+            return
+        now = time.time()
+        for name, job in self.jobs.items():
+            if job['status'] != RUNNING:
+                continue
+            # State files written before submitted_at was recorded start the clock now
+            submitted = job.setdefault('submitted_at', now)
+            if now - submitted > self.max_wait:
+                self._fail(name, f"still running after {self.max_wait:.0f}s", retry=False)
+
+    def _task(self, name: str):
+        """Task object of a running job, rebuilt from the state file after a restart."""
+        task = self._tasks.get(name)
+        if task is None:
+            job = self.jobs[name]
+            task = self.batch.Task(job['task_id'], None, None, name=job.get('operation'))
+        return task
+
+    def _update(self, name: str, state, task=None):
+        """Apply a task state to its running job; None (unknown) keeps it running."""
+        if state is None:
+            return
+        state = str(state).split('.')[-1].upper()
+
+        if state in SUCCESS_STATES:
+            self.jobs[name]['status'] = COMPLETED
+            self._tasks.pop(name, None)
+            log(f"  Completed: {name}")
+        elif state not in ACTIVE_STATES:
+            try:
+                error = (task or self._task(name)).status().get('error_message', state)
+            except Exception:
+                error = state
+            self._fail(name, error, retry=state not in CANCELLED_STATES)
+
+    def _fail(self, name: str, error: str, retry: bool = True):
+        job = self.jobs[name]
+        job['error'] = error
+        job['task_id'] = None
+        self._tasks.pop(name, None)
+        if retry and job['attempts'] < self.max_attempts:
+            delay = self.backoff * 2 ** (job['attempts'] - 1)
+            job['status'] = PENDING
+            job['not_before'] = time.time() + delay
+            log(f"  Failed: {name} ({error}); resubmitting in {delay:.0f}s "
+                f"[{job['attempts']}/{self.max_attempts}]")
+        else:
+            job['status'] = FAILED
+            log(f"  Failed: {name} ({error}); giving up")
+
+    def submit(self, factories: Dict[str, Callable]):
+        """Start pending jobs until max_running tasks are submitted."""
+        # Tasks of other job sets sharing the state file also take up slots
+        free = self.max_running - self.counts()[RUNNING]
+        now = time.time()
+        for name, factory in factories.items():
+            if free <= 0:
+                break
+            job = self._job(name)
+            if job['status'] != PENDING or job['not_before'] > now:
+                continue
+
+            job['attempts'] += 1
+            try:
+                with timings.span('task_submit', task=name):
+                    task = factory()
+                    task.start()
+            except Exception as e:
+                self._fail(name, str(e))
+                continue
+
+            job['status'] = RUNNING
+            job['task_id'] = task.id
+            # Operation name, needed to ask for the status of a single task
+            operation = getattr(task, 'name', None)
+            job['operation'] = operation if isinstance(operation, str) else None
+            job['submitted_at'] = time.time()
+            self._tasks[name] = task
+            free -= 1
+            log(f"  Submitted: {name} (attempt {job['attempts']})")
+
+    def step(self, factories: Dict[str, Callable]) -> Dict[str, int]:
+        """
+        Run one scheduling cycle: poll, submit, save.
+
+        Args:
+            factories: {job name: callable returning an unstarted ee.batch.Task}
+
+        Returns:
+            Counts per status of the jobs in factories
+        """
+        for name in factories:
+            self._job(name)
+        self.poll()
+        self.submit(factories)
+        self._save()
+        return self.counts(factories)
+
+    def run(self, factories: Dict[str, Callable], wait: bool = True) -> Dict:
+        """
+        Run jobs until all of them completed or failed.
+
+        Args:
+            factories: {job name: callable returning an unstarted ee.batch.Task}
+            wait: Keep polling until every job is finished; with False only one
+                cycle is run and the state file is left for a later call (default: True)
+
+        Returns:
+            Dict with the job counts per status and a 'failures' list of
+            {'name', 'error'} for jobs that failed permanently
+        """
+        while True:
+            counts = self.step(factories)
+            active = sum(1 for name in factories
+                         if self.jobs[name]['status'] in (PENDING, RUNNING))
+            log(f"Export status: {counts[RUNNING]} running, {counts[PENDING]} pending, "
+                f"{counts[COMPLETED]} completed, {counts[FAILED]} failed")
+            if not wait or active == 0:
+                break
+            time.sleep(self.poll_interval)
+
+        summary = dict(counts)
+        summary['failures'] = [{'name': name, 'error': self.jobs[name]['error']}
+                               for name in factories if self.jobs[name]['status'] == FAILED]
+        return summary
+
+    def reset_failed(self, names: Optional[List[str]] = None):
+        """Mark failed jobs as pending again, e.g. after fixing a quota problem."""
+        for name, job in self.jobs.items():
+            if job['status'] == FAILED and (names is None or name in names):
+                job.update({'status': PENDING, 'attempts': 0, 'not_before': 0.0})
+        self._save()
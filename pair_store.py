@@ -0,0 +1,338 @@
+"""
+Append-Friendly Indexed Store for Matched Pair Metadata
+
+This module provides PairStore, an alternative to the single indented
+matched_pairs.json written by create_dataset() in sentinel_dataset.py and
+sentinel_dataset_mpc.py:
+1. Keep one compact JSON line per pair in matched_pairs.jsonl, so adding
+   pairs appends to the file instead of rewriting the whole dataset
+2. Keep a small sidecar index (matched_pairs.index.json) with the dataset
+   settings and, for every block of pairs, its byte range and the range of
+   its timestamps, orbits and cloud cover (like Parquet row-group statistics)
+3. Answer queries by date range, orbit and cloud cover by reading only the
+   blocks whose statistics can match, and convert to and from the legacy
+   matched_pairs.json format
+
+Only the index is rewritten on every append, and it stays small (one entry
+per block). Bytes appended after the size recorded in the index (from an
+interrupted append) are ignored and overwritten by the next append.
+
+Usage as a converter:
+
+    python pair_store.py ./sentinel_dataset_mpc/matched_pairs.json
+"""
+
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+STORE_NAME = 'matched_pairs.jsonl'
+JSON_NAME = 'matched_pairs.json'
+
+# Per-block statistics: numeric fields get a [min, max] range
+RANGE_FIELDS = ('s1_timestamp', 's2_timestamp', 's2_cloud_cover')
+
+
+def index_path(path: str) -> str:
+    """Sidecar index of a .jsonl store."""
+    root, _ = os.path.splitext(path)
+    return f"{root}.index.json"
+
+
+def _date_to_ms(day: str, end_of_day: bool = False) -> int:
+    """Epoch milliseconds of a 'YYYY-MM-DD' date (its end when end_of_day is set)."""
+    moment = datetime.strptime(day, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    if end_of_day:
+        moment += timedelta(days=1)
+    return int(moment.timestamp() * 1000) - (1 if end_of_day else 0)
+
+
+class PairStore:
+    """
+    JSON Lines store of matched pairs with a block index.
+
+    Args:
+        path: Store file, usually <output_dir>/matched_pairs.jsonl
+        block_size: Pairs per index block (default: 1024)
+    """
+
+    def __init__(self, path: str, block_size: int = 1024):
+        if block_size <= 0:
+            raise ValueError("block_size must be positive")
+        self.path = path
+        self.index_file = index_path(path)
+        if os.path.exists(self.index_file):
+            with open(self.index_file) as f:
+                self.index = json.load(f)
+        else:
+            self.index = {'version': 1, 'block_size': block_size, 'size': 0, 'count': 0,
+                          'metadata': {}, 'blocks': []}
+
+    @classmethod
+    def from_json(cls, json_path: str,
+                  path: Optional[str] = None,
+                  block_size: int = 1024) -> 'PairStore':
+        """
+        Convert a legacy matched_pairs.json into a store.
+
+        Args:
+            json_path: matched_pairs.json written by create_dataset()
+            path: Store file (default: None, next to json_path with a .jsonl extension)
+            block_size: Pairs per index block (default: 1024)
+
+        Returns:
+            PairStore holding the same pairs and settings
+        """
+        with open(json_path) as f:
+            data = json.load(f)
+        if path is None:
+            path = f"{os.path.splitext(json_path)[0]}.jsonl"
+
+        store = cls(path, block_size=block_size)
+        store.clear()
+        store.append(data.pop('matched_pairs', []))
+        data.pop('matched_pairs_count', None)
+        store.update_metadata(data)
+        return store
+
+    def __len__(self) -> int:
+        return self.index['count']
+
+    @property
+    def metadata(self) -> Dict:
+        """Dataset settings and totals (the legacy JSON without its pairs)."""
+        return dict(self.index['metadata'])
+
+    def _save_index(self):
+        """Write the index atomically."""
+        directory = os.path.dirname(os.path.abspath(self.index_file))
+        os.makedirs(directory, exist_ok=True)
+        partial = f"{self.index_file}.part"
+        with open(partial, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(partial, self.index_file)
+
+    def update_metadata(self, metadata: Dict):
+        """Merge dataset settings into the index and save it."""
+        self.index['metadata'].update(metadata)
+        self._save_index()
+
+    def clear(self):
+        """Remove every pair and the metadata, before the store is rewritten."""
+        self.index.update({'size': 0, 'count': 0, 'blocks': [], 'metadata': {}})
+        if os.path.exists(self.path):
+            os.truncate(self.path, 0)
+        self._save_index()
+
+    def append(self, pairs: Iterable[Dict]):
+        """
+        Append pairs and update the index.
+
+        Args:
+            pairs: Pair metadata dictionaries (JSON-serializable)
+        """
+        blocks = self.index['blocks']
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+
+        with open(self.path, 'r+b' if os.path.exists(self.path) else 'wb') as f:
+            # Drop anything written after the last completed append
+            f.truncate(self.index['size'])
+            f.seek(self.index['size'])
+            for pair in pairs:
+                if not blocks or blocks[-1]['count'] >= self.index['block_size']:
+                    blocks.append({'offset': f.tell(), 'length': 0, 'count': 0,
+                                   'ranges': {}, 'orbits': []})
+                block = blocks[-1]
+                line = (json.dumps(pair, separators=(',', ':')) + '\n').encode()
+                f.write(line)
+                block['length'] += len(line)
+                block['count'] += 1
+                self.index['count'] += 1
+                _widen(block, pair)
+            f.flush()
+            os.fsync(f.fileno())
+            self.index['size'] = f.tell()
+
+        self._save_index()
+
+    def truncate(self, s2_from_ms: int) -> int:
+        """
+        Remove the pairs whose S2 scene was taken at or after s2_from_ms.
+
+        Used by incremental updates to drop the pairs that are rematched.
+        The file is rewritten from the first block holding such a pair, which
+        for pairs appended in date order is only the tail.
+
+        Args:
+            s2_from_ms: Epoch milliseconds
+
+        Returns:
+            Number of removed pairs
+        """
+        blocks = self.index['blocks']
+        first = next((i for i, block in enumerate(blocks)
+                      if block['ranges'].get('s2_timestamp', [None, s2_from_ms])[1] >= s2_from_ms), None)
+        if first is None:
+            return 0
+
+        tail = [pair for i in range(first, len(blocks)) for pair in self._read_block(blocks[i])]
+        kept = [pair for pair in tail if pair.get('s2_timestamp', s2_from_ms) < s2_from_ms]
+
+        self.index['size'] = blocks[first]['offset']
+        self.index['count'] -= len(tail)
+        del blocks[first:]
+        self.append(kept)
+        return len(tail) - len(kept)
+
+    def _read_block(self, block: Dict) -> List[Dict]:
+        with open(self.path, 'rb') as f:
+            f.seek(block['offset'])
+            data = f.read(block['length'])
+        return [json.loads(line) for line in data.splitlines()]
+
+    def query(self, start_date: Optional[str] = None,
+              end_date: Optional[str] = None,
+              orbit: Optional[str] = None,
+              max_cloud_cover: Optional[float] = None,
+              sensor: str = 's2') -> Iterator[Dict]:
+        """
+        Iterate over the pairs matching every given filter.
+
+        Blocks whose statistics exclude a match are not read.
+
+        Args:
+            start_date: First acquisition date in 'YYYY-MM-DD' format (default: None)
+            end_date: Last acquisition date in 'YYYY-MM-DD' format, inclusive (default: None)
+            orbit: Sentinel-1 orbit direction ('ascending'/'descending') (default: None)
+            max_cloud_cover: Maximum Sentinel-2 cloud cover percentage (default: None)
+            sensor: Scene whose date is filtered, 's1' or 's2' (default: 's2')
+
+        Yields:
+            Pair metadata dictionaries, in stored order
+        """
+        matches = pair_filter(start_date, end_date, orbit, max_cloud_cover, sensor)
+        time_key = f'{sensor}_timestamp'
+        start_ms = _date_to_ms(start_date) if start_date else None
+        end_ms = _date_to_ms(end_date, end_of_day=True) if end_date else None
+
+        for block in self.index['blocks']:
+            ranges = block['ranges']
+            if time_key in ranges:
+                low, high = ranges[time_key]
+                if (start_ms is not None and high < start_ms) or (end_ms is not None and low > end_ms):
+                    continue
+            if orbit is not None and orbit not in block['orbits']:
+                continue
+            if max_cloud_cover is not None and \
+                    ranges.get('s2_cloud_cover', [float('inf')])[0] > max_cloud_cover:
+                continue
+
+            for pair in self._read_block(block):
+                if matches(pair):
+                    yield pair
+
+    def load(self) -> List[Dict]:
+        """Read every pair."""
+        return list(self.query())
+
+    def to_json(self, json_path: str):
+        """Write the store in the legacy matched_pairs.json format."""
+        pairs = self.load()
+        data = self.metadata
+        data.update({'matched_pairs_count': len(pairs), 'matched_pairs': pairs})
+        with open(json_path, 'w') as f:
+            json.dump(data, f, indent=2)
+
+
+def _widen(block: Dict, pair: Dict):
+    """Extend a block's statistics with one pair."""
+    ranges = block['ranges']
+    for key in RANGE_FIELDS:
+        value = pair.get(key)
+        if value is None:
+            continue
+        if key in ranges:
+            ranges[key] = [min(ranges[key][0], value), max(ranges[key][1], value)]
+        else:
+            ranges[key] = [value, value]
+    orbit = pair.get('s1_orbit')
+    if orbit is not None and orbit not in block['orbits']:
+        block['orbits'].append(orbit)
+
+
+def load_matched_pairs(path: str, **filters) -> Dict:
+    """
+    Load dataset metadata from a store or a legacy matched_pairs.json.
+
+    Args:
+        path: matched_pairs.jsonl, matched_pairs.json, or a dataset directory
+            holding either (the store is preferred)
+        **filters: PairStore.query() filters (start_date, end_date, orbit,
+            max_cloud_cover, sensor); applied after a full load for JSON files
+
+    Returns:
+        Dict in the matched_pairs.json layout: settings, totals,
+        'matched_pairs_count' and the (filtered) 'matched_pairs'
+    """
+    if os.path.isdir(path):
+        store_file = os.path.join(path, STORE_NAME)
+        path = store_file if os.path.exists(index_path(store_file)) else os.path.join(path, JSON_NAME)
+
+    if path.endswith('.jsonl'):
+        store = PairStore(path)
+        data = store.metadata
+        pairs = list(store.query(**filters))
+    else:
+        with open(path) as f:
+            data = json.load(f)
+        pairs = data.pop('matched_pairs', [])
+        if filters:
+            matches = pair_filter(**filters)
+            pairs = [pair for pair in pairs if matches(pair)]
+
+    data.update({'matched_pairs_count': len(pairs), 'matched_pairs': pairs})
+    return data
+
+
+def pair_filter(start_date: Optional[str] = None,
+                end_date: Optional[str] = None,
+                orbit: Optional[str] = None,
+                max_cloud_cover: Optional[float] = None,
+                sensor: str = 's2') -> Callable[[Dict], bool]:
+    """Predicate implementing the PairStore.query() filters for a single pair."""
+    if sensor not in ('s1', 's2'):
+        raise ValueError("sensor must be 's1' or 's2'")
+    time_key = f'{sensor}_timestamp'
+    start_ms = _date_to_ms(start_date) if start_date else None
+    end_ms = _date_to_ms(end_date, end_of_day=True) if end_date else None
+
+    def matches(pair: Dict) -> bool:
+        timestamp = pair.get(time_key)
+        if start_ms is not None and (timestamp is None or timestamp < start_ms):
+            return False
+        if end_ms is not None and (timestamp is None or timestamp > end_ms):
+            return False
+        if orbit is not None and pair.get('s1_orbit') != orbit:
+            return False
+        if max_cloud_cover is not None and pair.get('s2_cloud_cover', float('inf')) > max_cloud_cover:
+            return False
+        return True
+
+    return matches
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python pair_store.py <matched_pairs.json | matched_pairs.jsonl>")
+        sys.exit(1)
+
+    source = sys.argv[1]
+    if source.endswith('.jsonl'):
+        target = f"{os.path.splitext(source)[0]}.json"
+        PairStore(source).to_json(target)
+    else:
+        target = PairStore.from_json(source).path
+    print(f"Converted {source} -> {target}")
@@ -0,0 +1,318 @@
+"""
+Patch Sampler for ML Training over Downloaded Sentinel-1 / Sentinel-2 Pairs
+
+This module provides PatchSampler, which reads the images written by
+export_matched_pairs() in sentinel_dataset_mpc.py back as training patches:
+1. Index every valid co-registered S1/S2 window of every downloaded pair,
+   using decimated validity masks so no scene is read at full resolution
+2. Serve patches by index (a map-style dataset usable from a PyTorch
+   DataLoader) or as a stream with a shuffle buffer and multi-threaded
+   prefetch of windowed reads
+3. Align separate S1/S2 files on the fly by reading S1 through a WarpedVRT
+   on the S2 grid; stacked files (export_matched_pairs(stack=True)) are
+   already co-registered and read directly
+
+Only the requested windows are read from disk, so an epoch over thousands
+of pairs never holds a full scene in memory.
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from run_report import log
+
+# pair_0012_diff_0.42d_S2_2023-05-01.tif, pair_0012_diff_0.42d_STACK_2023-05-01.tif
+PAIR_FILE_PATTERN = re.compile(r'^(pair_\d+_diff_[\d.]+d)_(S1|S2|STACK)_.*\.tif$')
+
+
+def find_pairs(images_dir: str) -> List[Dict]:
+    """
+    Find downloaded pairs in an export_matched_pairs() output directory.
+
+    Args:
+        images_dir: Directory with pair_XXXX_..._S1/S2/STACK_<date>.tif files
+
+    Returns:
+        List of dicts with 'name' and either 'stack' or both 's1' and 's2'
+        file paths, sorted by pair name. Pairs missing one sensor are left out.
+    """
+    pairs = {}
+    for filename in sorted(os.listdir(images_dir)):
+        match = PAIR_FILE_PATTERN.match(filename)
+        if match:
+            name, kind = match.groups()
+            pairs.setdefault(name, {'name': name})[kind.lower()] = os.path.join(images_dir, filename)
+
+    return [pair for name, pair in sorted(pairs.items())
+            if 'stack' in pair or ('s1' in pair and 's2' in pair)]
+
+
+class PatchSampler:
+    """
+    Index of valid patch windows across downloaded pairs.
+
+    A window is valid when at least min_valid of its pixels carry data in
+    every band of both sensors, estimated from masks read at 1/decimation
+    of the full resolution.
+
+    Args:
+        pairs: Output of find_pairs()
+        patch_size: Patch width and height in pixels (default: 256)
+        stride: Step between windows (default: patch_size, non-overlapping)
+        min_valid: Minimum fraction of valid pixels in a window (default: 0.9)
+        s2_count: Number of leading S2 bands in stacked files (default: None,
+            taken from the 'S2_' band descriptions)
+        max_open: Open datasets kept per reading thread (default: 16)
+    """
+
+    def __init__(self, pairs: List[Dict],
+                 patch_size: int = 256,
+                 stride: Optional[int] = None,
+                 min_valid: float = 0.9,
+                 s2_count: Optional[int] = None,
+                 max_open: int = 16):
+        if patch_size <= 0:
+            raise ValueError("patch_size must be positive")
+        if not 0.0 <= min_valid <= 1.0:
+            raise ValueError("min_valid must be between 0 and 1")
+
+        self.pairs = pairs
+        self.patch_size = patch_size
+        self.stride = stride or patch_size
+        self.min_valid = min_valid
+        self.s2_count = s2_count
+        self.max_open = max_open
+        self._local = threading.local()
+        self._caches = []
+        self._lock = threading.Lock()
+
+        pair_index, rows, cols = [], [], []
+        for i, pair in enumerate(pairs):
+            pair_rows, pair_cols = self._valid_windows(pair)
+            pair_index.append(np.full(len(pair_rows), i, dtype=np.int32))
+            rows.append(pair_rows)
+            cols.append(pair_cols)
+
+        # Three flat int32 columns: 12 bytes per window
+        self.pair_index = np.concatenate(pair_index) if pair_index else np.zeros(0, np.int32)
+        self.rows = np.concatenate(rows) if rows else np.zeros(0, np.int32)
+        self.cols = np.concatenate(cols) if cols else np.zeros(0, np.int32)
+
+        log(f"Indexed {len(self)} valid {patch_size}x{patch_size} patches in {len(pairs)} pairs")
+
+    @classmethod
+    def from_directory(cls, images_dir: str, **kwargs) -> 'PatchSampler':
+        """
+        Index every pair in an export_matched_pairs() output directory.
+
+        Args:
+            images_dir: Directory of downloaded pairs
+            **kwargs: Passed to PatchSampler
+
+        Returns:
+            PatchSampler
+        """
+        return cls(find_pairs(images_dir), **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.pair_index)
+
+    def _valid_windows(self, pair: Dict):
+        """Top-left corners of the valid windows of one pair."""
+        import rasterio
+        from rasterio.vrt import WarpedVRT
+
+        reference = pair.get('stack', pair.get('s2'))
+        with rasterio.open(reference) as src:
+            height, width = src.height, src.width
+            if height < self.patch_size or width < self.patch_size:
+                return np.zeros(0, np.int32), np.zeros(0, np.int32)
+
+            decimation = max(self.patch_size // 8, 1)
+            shape = (max(height // decimation, 1), max(width // decimation, 1))
+            valid = src.dataset_mask(out_shape=shape) > 0
+
+            if 'stack' not in pair:
+                with rasterio.open(pair['s1']) as s1, \
+                        WarpedVRT(s1, crs=src.crs, transform=src.transform,
+                                  width=width, height=height) as vrt:
+                    valid &= vrt.dataset_mask(out_shape=shape) > 0
+
+        rows = np.arange(0, height - self.patch_size + 1, self.stride)
+        cols = np.arange(0, width - self.patch_size + 1, self.stride)
+        grid_rows, grid_cols = np.meshgrid(rows, cols, indexing='ij')
+        grid_rows, grid_cols = grid_rows.ravel(), grid_cols.ravel()
+
+        # Fraction of valid mask cells inside every window, via a summed-area table
+        table = np.pad(valid.astype(np.int32).cumsum(0).cumsum(1), ((1, 0), (1, 0)))
+        scale_y, scale_x = shape[0] / height, shape[1] / width
+        r0 = np.floor(grid_rows * scale_y).astype(int)
+        c0 = np.floor(grid_cols * scale_x).astype(int)
+        r1 = np.maximum(np.ceil((grid_rows + self.patch_size) * scale_y).astype(int), r0 + 1)
+        c1 = np.maximum(np.ceil((grid_cols + self.patch_size) * scale_x).astype(int), c0 + 1)
+        r1, c1 = np.minimum(r1, shape[0]), np.minimum(c1, shape[1])
+        counts = table[r1, c1] - table[r0, c1] - table[r1, c0] + table[r0, c0]
+        fraction = counts / ((r1 - r0) * (c1 - c0))
+
+        keep = fraction >= self.min_valid
+        return grid_rows[keep].astype(np.int32), grid_cols[keep].astype(np.int32)
+
+    def _open(self, path: str, reference: Optional[str] = None):
+        """Per-thread LRU cache of open datasets (rasterio handles are not thread-safe)."""
+        import rasterio
+        from rasterio.vrt import WarpedVRT
+
+        cache = getattr(self._local, 'datasets', None)
+        if cache is None:
+            cache = self._new_cache()
+
+        key = (path, reference)
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key][-1]
+
+        handles = [rasterio.open(path)]
+        if reference is not None:
+            # S1 read through a virtual warp onto the S2 grid of the pair
+            with rasterio.open(reference) as ref:
+                handles.append(WarpedVRT(handles[0], crs=ref.crs, transform=ref.transform,
+                                         width=ref.width, height=ref.height))
+        cache[key] = handles
+        while len(cache) > self.max_open:
+            for handle in reversed(cache.popitem(last=False)[1]):
+                handle.close()
+        return handles[-1]
+
+    def _new_cache(self, group: Optional[List] = None) -> OrderedDict:
+        """Create the calling thread's dataset cache, also adding it to group."""
+        cache = self._local.datasets = OrderedDict()
+        with self._lock:
+            self._caches.append(cache)
+            if group is not None:
+                group.append(cache)
+        return cache
+
+    def _close_caches(self, caches: List[OrderedDict]):
+        """Close the datasets of some thread caches and forget those caches."""
+        closing = {id(cache) for cache in caches}
+        with self._lock:
+            for cache in caches:
+                while cache:
+                    for handle in reversed(cache.popitem()[1]):
+                        handle.close()
+            self._caches = [cache for cache in self._caches if id(cache) not in closing]
+
+    def close(self):
+        """Close the datasets opened by every reading thread."""
+        self._close_caches(list(self._caches))
+
+    def __getstate__(self):
+        # Open datasets stay in the process that opened them (e.g. DataLoader workers)
+        state = self.__dict__.copy()
+        for key in ('_local', '_caches', '_lock'):
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+        self._caches = []
+        self._lock = threading.Lock()
+
+    def __getitem__(self, index: int) -> Dict:
+        """
+        Read one patch.
+
+        Args:
+            index: Patch position in the index
+
+        Returns:
+            Dict with 's2' and 's1' (bands, patch_size, patch_size) arrays,
+            the 'pair' name and the 'row'/'col' window offset
+        """
+        from rasterio.windows import Window
+
+        pair = self.pairs[self.pair_index[index]]
+        row, col = int(self.rows[index]), int(self.cols[index])
+        window = Window(col, row, self.patch_size, self.patch_size)
+
+        if 'stack' in pair:
+            src = self._open(pair['stack'])
+            data = src.read(window=window)
+            s2_count = self.s2_count
+            if s2_count is None:
+                s2_count = sum(1 for name in src.descriptions if name and name.startswith('S2_'))
+            s2, s1 = data[:s2_count], data[s2_count:]
+        else:
+            s2 = self._open(pair['s2']).read(window=window)
+            s1 = self._open(pair['s1'], reference=pair['s2']).read(window=window)
+
+        return {'s2': s2, 's1': s1, 'pair': pair['name'], 'row': row, 'col': col}
+
+    def iter_patches(self, shuffle: bool = True,
+                     shuffle_buffer: int = 1024,
+                     num_workers: int = 4,
+                     prefetch: int = 16,
+                     seed: Optional[int] = None) -> Iterator[Dict]:
+        """
+        Stream every indexed patch once (one epoch).
+
+        With shuffle=True, pairs are visited in random order and the windows
+        of each pair in random order, so consecutive reads hit the same file;
+        the shuffle buffer then mixes patches of up to shuffle_buffer reads.
+
+        Args:
+            shuffle: Randomize the order (default: True)
+            shuffle_buffer: Patches held for shuffling (default: 1024)
+            num_workers: Threads reading windows in parallel (default: 4)
+            prefetch: Reads in flight ahead of the consumer (default: 16)
+            seed: Random seed (default: None)
+
+        Yields:
+            Patch dicts as returned by __getitem__
+        """
+        rng = np.random.default_rng(seed)
+        order = np.arange(len(self))
+        if shuffle:
+            pair_order = rng.permutation(len(self.pairs))
+            # Sort windows by (random pair rank, random tie-breaker)
+            order = np.lexsort((rng.random(len(self)), pair_order[self.pair_index]))
+
+        buffer = []
+        # The pool's threads end with the epoch, so their datasets are closed with it
+        epoch_caches = []
+        try:
+            with ThreadPoolExecutor(max_workers=num_workers, initializer=self._new_cache,
+                                    initargs=(epoch_caches,)) as pool:
+                in_flight = deque()
+                for index in order:
+                    in_flight.append(pool.submit(self.__getitem__, int(index)))
+                    if len(in_flight) < max(prefetch, 1):
+                        continue
+                    patch = in_flight.popleft().result()
+                    if not shuffle:
+                        yield patch
+                        continue
+                    buffer.append(patch)
+                    if len(buffer) >= shuffle_buffer:
+                        swap = rng.integers(len(buffer))
+                        buffer[swap], buffer[-1] = buffer[-1], buffer[swap]
+                        yield buffer.pop()
+
+                while in_flight:
+                    patch = in_flight.popleft().result()
+                    if shuffle:
+                        buffer.append(patch)
+                    else:
+                        yield patch
+        finally:
+            self._close_caches(epoch_caches)
+
+        rng.shuffle(buffer)
+        yield from buffer
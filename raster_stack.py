@@ -0,0 +1,260 @@
+"""
+Co-Registered Band Stacking for Sentinel-1 / Sentinel-2 Assets
+
+This module provides the raster helpers used by the download functions in
+sentinel_dataset_mpc.py:
+1. Open remote Cloud-Optimized GeoTIFF assets concurrently
+2. Define one target grid (CRS, transform, resolution) for a set of assets,
+   optionally clipped to a WGS84 bbox
+3. Resample every band onto that grid through a WarpedVRT, so bands of
+   different resolutions (10 m / 20 m Sentinel-2, Sentinel-1) end up in one
+   aligned multi-band GeoTIFF after a single read of each source
+4. Write outputs atomically with a choice of profiles, from the legacy plain
+   GeoTIFF to tiled, compressed Cloud-Optimized GeoTIFFs with overviews
+
+rasterio is imported inside the functions, like in download_image(), so
+searching and matching work without it.
+"""
+
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from download_manifest import temp_path
+
+# Classification bands must not be interpolated
+CATEGORICAL_BANDS = ('SCL',)
+
+# Creation options of every output profile. The COG profiles are written with
+# GDAL's COG driver: 512x512 tiles, internal overviews and a predictor chosen
+# from the data type (horizontal differencing for integers, floating point
+# predictor for floats).
+OUTPUT_PROFILES = {
+    'gtiff': {'driver': 'GTiff'},
+    'cog': {
+        'driver': 'COG',
+        'compress': 'DEFLATE',
+        'level': 6,
+        'predictor': 'YES',
+        'blocksize': 512,
+        'overviews': 'AUTO',
+        'overview_resampling': 'AVERAGE',
+        'bigtiff': 'IF_SAFER'
+    },
+    'cog-zstd': {
+        'driver': 'COG',
+        'compress': 'ZSTD',
+        'level': 9,
+        'predictor': 'YES',
+        'blocksize': 512,
+        'overviews': 'AUTO',
+        'overview_resampling': 'AVERAGE',
+        'bigtiff': 'IF_SAFER'
+    }
+}
+
+
+class Grid(NamedTuple):
+    """Target raster grid: CRS, affine transform and shape."""
+    crs: object
+    transform: object
+    width: int
+    height: int
+
+
+def open_assets(hrefs: List[str]) -> List:
+    """
+    Open raster assets concurrently (opening a remote COG is latency bound).
+
+    Args:
+        hrefs: Asset URLs or paths
+
+    Returns:
+        List of open rasterio datasets in the order of hrefs. If any asset
+        fails to open, the others are closed and the error is raised.
+    """
+    import rasterio
+
+    with ThreadPoolExecutor(max_workers=max(len(hrefs), 1)) as pool:
+        opened = [pool.submit(rasterio.open, href) for href in hrefs]
+
+    datasets = [future.result() for future in opened if future.exception() is None]
+    for future in opened:
+        if future.exception() is not None:
+            for dataset in datasets:
+                dataset.close()
+            raise future.exception()
+    return datasets
+
+
+def write_raster(array: np.ndarray, meta: Dict, output_path: str,
+                 descriptions: Optional[List[str]] = None,
+                 profile: str = 'gtiff'):
+    """
+    Write a (bands, rows, cols) array to a GeoTIFF atomically.
+
+    The file is written next to the target and renamed, so an interrupted
+    download never leaves a partial file under the final name.
+
+    Args:
+        array: Raster data
+        meta: rasterio profile (crs, transform, dtype, nodata, ...)
+        output_path: Destination file
+        descriptions: Band names stored in the file (default: None)
+        profile: Output profile from OUTPUT_PROFILES: 'gtiff' (plain GeoTIFF),
+            'cog' (DEFLATE COG) or 'cog-zstd' (ZSTD COG) (default: 'gtiff')
+    """
+    import rasterio
+    from rasterio.io import MemoryFile
+    from rasterio.shutil import copy as copy_raster
+
+    if profile not in OUTPUT_PROFILES:
+        raise ValueError(f"Unknown output profile {profile!r}; "
+                         f"expected one of {sorted(OUTPUT_PROFILES)}")
+    options = dict(OUTPUT_PROFILES[profile])
+    driver = options.pop('driver')
+
+    # Keep georeferencing only; block layout and compression come from the profile
+    meta = {key: meta[key] for key in ('crs', 'transform', 'nodata') if key in meta}
+    meta.update({
+        "driver": "GTiff",
+        "count": array.shape[0],
+        "height": array.shape[1],
+        "width": array.shape[2],
+        "dtype": array.dtype
+    })
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    partial = temp_path(output_path)
+    try:
+        if driver == 'GTiff':
+            with rasterio.open(partial, "w", **meta, **options) as dest:
+                _write_bands(dest, array, descriptions)
+        else:
+            # The COG driver only supports creating a copy of a finished dataset
+            with MemoryFile() as memfile:
+                with memfile.open(**meta) as staging:
+                    _write_bands(staging, array, descriptions)
+                with memfile.open() as staging:
+                    copy_raster(staging, partial, driver=driver, **options)
+        os.replace(partial, output_path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+
+def _write_bands(dest, array: np.ndarray, descriptions: Optional[List[str]]):
+    dest.write(array)
+    for band, description in enumerate(descriptions or [], start=1):
+        dest.set_band_description(band, description)
+
+
+def target_grid(datasets: List,
+                bbox: Optional[Tuple[float, float, float, float]] = None,
+                crs=None,
+                resolution: Optional[float] = None) -> Grid:
+    """
+    Define the common grid all bands are resampled onto.
+
+    Args:
+        datasets: Open rasterio datasets to stack
+        bbox: Clip to (min_lon, min_lat, max_lon, max_lat) in WGS84 (default:
+            None, the union of the dataset extents)
+        crs: Target CRS (default: CRS of the first dataset)
+        resolution: Pixel size in target CRS units (default: finest resolution
+            among the datasets already in the target CRS)
+
+    Returns:
+        Grid whose origin is aligned to a multiple of the resolution
+    """
+    from rasterio.crs import CRS
+    from rasterio.transform import from_origin
+    from rasterio.warp import transform_bounds
+
+    crs = CRS.from_user_input(crs) if crs is not None else datasets[0].crs
+    if crs is None:
+        raise ValueError("Assets have no CRS; pass crs to define the target grid")
+
+    if resolution is None:
+        native = [abs(dataset.res[0]) for dataset in datasets if dataset.crs == crs]
+        if not native:
+            raise ValueError("No asset is in the target CRS; pass resolution explicitly")
+        resolution = min(native)
+    if resolution <= 0:
+        raise ValueError("resolution must be positive")
+
+    if bbox is not None:
+        left, bottom, right, top = transform_bounds('EPSG:4326', crs, *bbox, densify_pts=21)
+    else:
+        extents = np.array([transform_bounds(dataset.crs, crs, *dataset.bounds, densify_pts=21)
+                            for dataset in datasets])
+        left, bottom = extents[:, 0].min(), extents[:, 1].min()
+        right, top = extents[:, 2].max(), extents[:, 3].max()
+
+    # Snap outwards to whole pixels so repeated exports of an ROI line up
+    left = math.floor(left / resolution) * resolution
+    bottom = math.floor(bottom / resolution) * resolution
+    right = math.ceil(right / resolution) * resolution
+    top = math.ceil(top / resolution) * resolution
+
+    return Grid(
+        crs=crs,
+        transform=from_origin(left, top, resolution, resolution),
+        width=max(int(round((right - left) / resolution)), 1),
+        height=max(int(round((top - bottom) / resolution)), 1)
+    )
+
+
+def stack_assets(datasets: List,
+                 names: List[str],
+                 grid: Grid,
+                 resampling: str = 'bilinear') -> np.ndarray:
+    """
+    Resample the first band of every dataset onto a grid and stack them.
+
+    Each source is wrapped in a WarpedVRT, so only the source pixels that
+    fall on the grid are read and the resampling happens in that one read.
+
+    Args:
+        datasets: Open rasterio datasets, one per band
+        names: Band name of every dataset; bands listed in CATEGORICAL_BANDS
+            always use nearest-neighbour resampling
+        grid: Target grid from target_grid()
+        resampling: rasterio Resampling method name for continuous bands
+            (default: 'bilinear')
+
+    Returns:
+        np.ndarray: (bands, height, width) array in the common dtype of the sources
+    """
+    from rasterio.enums import Resampling
+    from rasterio.vrt import WarpedVRT
+
+    dtype = np.result_type(*[dataset.dtypes[0] for dataset in datasets])
+    stack = np.zeros((len(datasets), grid.height, grid.width), dtype=dtype)
+
+    for band, (dataset, name) in enumerate(zip(datasets, names)):
+        method = 'nearest' if name.split('_')[-1] in CATEGORICAL_BANDS else resampling
+        with WarpedVRT(dataset,
+                       crs=grid.crs,
+                       transform=grid.transform,
+                       width=grid.width,
+                       height=grid.height,
+                       resampling=Resampling[method]) as vrt:
+            stack[band] = vrt.read(1)
+
+    return stack
+
+
+def stack_meta(datasets: List, grid: Grid) -> Dict:
+    """rasterio profile for a stack on grid, keeping nodata if all sources agree."""
+    nodata = {dataset.nodata for dataset in datasets}
+    return {
+        "crs": grid.crs,
+        "transform": grid.transform,
+        "nodata": nodata.pop() if len(nodata) == 1 else None
+    }
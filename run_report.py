@@ -0,0 +1,262 @@
+"""
+Stage Timings and Run Reports
+
+This module provides the instrumentation shared by sentinel_dataset.py and
+sentinel_dataset_mpc.py:
+1. Record timed spans for every stage of a run (client initialization, each
+   search page or Earth Engine request, matching, metadata writes, each
+   scene download with its decoded and written byte counts)
+2. Summarize the spans of a run per stage (count, time, items, bytes)
+   into a JSON run report, or into Prometheus text format for a
+   node_exporter textfile collector or a Pushgateway
+3. Route console output through log(), which quiet mode silences for batch
+   jobs that only need the report
+
+Spans are only recorded while a run is active, i.e. inside reporting().
+create_dataset(), create_batch_dataset(), export_matched_pairs() and
+export_matched_images() open their own run; wrap custom workflows in reporting() to time them the same way.
+Runs in concurrent threads share one span list, so their reports overlap.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# Numeric span attributes that are summed per stage
+SUMMED_FIELDS = ('items', 'pairs', 'decoded_bytes', 'file_bytes')
+
+_quiet = False
+
+
+def log(*args, **kwargs):
+    """print(), unless quiet mode is on."""
+    if not _quiet:
+        print(*args, **kwargs)
+
+
+def set_quiet(quiet: bool = True):
+    """Silence (or restore) the console output of every module using log()."""
+    global _quiet
+    _quiet = quiet
+
+
+class Timings:
+    """Thread-safe list of timed spans, recorded while at least one run is active."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = 0
+        self.spans: List[Dict] = []
+        self.last_report: Optional[Dict] = None
+
+    def record(self, stage: str, seconds: float, **attributes):
+        """Add a span that ended now and took seconds."""
+        if not self._active:
+            return
+        span = {'stage': stage, 'end': time.time(), 'seconds': seconds}
+        span.update(attributes)
+        with self._lock:
+            self.spans.append(span)
+
+    @contextmanager
+    def span(self, stage: str, **attributes) -> Iterator[Dict]:
+        """
+        Time a block as one span of a stage.
+
+        Yields the span attributes, so the block can add results such as
+        'items' or 'file_bytes'. A block that raises is recorded with its 'error'.
+        """
+        start = time.perf_counter()
+        try:
+            yield attributes
+        except BaseException as e:
+            attributes['error'] = str(e) or type(e).__name__
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - start, **attributes)
+
+
+# Every instrumented stage in this package goes through this instance
+timings = Timings()
+
+
+def timed_pages(pages: Iterable[Dict], **attributes) -> Iterator[Dict]:
+    """
+    Yield STAC result pages (feature collection dicts), timing each fetch.
+
+    Args:
+        pages: e.g. ItemSearch.pages_as_dicts(), which requests lazily
+        **attributes: Added to every 'search_page' span, e.g. collection
+
+    Yields:
+        The pages, unchanged
+    """
+    pages = iter(pages)
+    while True:
+        start = time.perf_counter()
+        page = next(pages, None)
+        if page is None:
+            return
+        timings.record('search_page', time.perf_counter() - start,
+                       items=len(page.get('features', [])), **attributes)
+        yield page
+
+
+def summarize(spans: List[Dict]) -> Dict[str, Dict]:
+    """
+    Per-stage totals of a list of spans.
+
+    Returns:
+        {stage: {'count', 'seconds', 'mean_seconds', 'max_seconds', 'errors'}},
+        plus the sum of every SUMMED_FIELDS attribute present
+    """
+    stages = {}
+    for span in spans:
+        stage = stages.setdefault(span['stage'], {'count': 0, 'seconds': 0.0,
+                                                  'max_seconds': 0.0, 'errors': 0})
+        stage['count'] += 1
+        stage['seconds'] += span['seconds']
+        stage['max_seconds'] = max(stage['max_seconds'], span['seconds'])
+        stage['errors'] += 'error' in span
+        for field in SUMMED_FIELDS:
+            if field in span:
+                stage[field] = stage.get(field, 0) + span[field]
+
+    for stage in stages.values():
+        stage['mean_seconds'] = stage['seconds'] / stage['count']
+    return stages
+
+
+def to_prometheus(report: Dict, prefix: str = 'sentinel_dataset') -> str:
+    """
+    Render a run report in the Prometheus text exposition format.
+
+    Args:
+        report: Report built by reporting()
+        prefix: Metric name prefix (default: 'sentinel_dataset')
+
+    Returns:
+        Text with one gauge per run and per stage metric, labelled with the run name
+    """
+    run = report['run']
+    lines = [
+        f"# HELP {prefix}_run_seconds Wall time of the run.",
+        f"# TYPE {prefix}_run_seconds gauge",
+        f'{prefix}_run_seconds{{run="{run}"}} {report["seconds"]:.6f}',
+        f"# HELP {prefix}_run_success Whether the run finished without an exception.",
+        f"# TYPE {prefix}_run_success gauge",
+        f'{prefix}_run_success{{run="{run}"}} {0 if "error" in report else 1}',
+    ]
+
+    metrics = [('seconds', 'Time spent in the stage, summed over its spans.'),
+               ('count', 'Number of spans of the stage.'),
+               ('errors', 'Number of spans of the stage that raised.'),
+               ('items', 'Items handled by the stage (search results, scenes matched, tasks polled).'),
+               ('pairs', 'Pairs produced by the stage.'),
+               ('decoded_bytes', 'Uncompressed pixel bytes decoded by the stage.'),
+               ('file_bytes', 'Bytes written to disk by the stage.')]
+    for field, description in metrics:
+        values = [(stage, totals[field]) for stage, totals in sorted(report['stages'].items())
+                  if field in totals]
+        if not values:
+            continue
+        name = f"{prefix}_stage_{field}"
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(f'{name}{{run="{run}",stage="{stage}"}} {round(value, 6)}' for stage, value in values)
+    return '\n'.join(lines) + '\n'
+
+
+def write_report(report: Dict, path: str):
+    """Write a report atomically: Prometheus text for a .prom path, JSON otherwise."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    partial = f"{path}.part"
+    with open(partial, 'w') as f:
+        if path.endswith('.prom'):
+            f.write(to_prometheus(report))
+        else:
+            json.dump(report, f, indent=2)
+    os.replace(partial, path)
+
+
+@contextmanager
+def reporting(run: str,
+              report_path: Optional[str] = None,
+              quiet: bool = False) -> Iterator[Dict]:
+    """
+    Collect the spans of a run and build its report on exit.
+
+    Args:
+        run: Run name, e.g. 'create_dataset'
+        report_path: File the report is written to; a .prom extension selects
+            the Prometheus text format (default: None, not written)
+        quiet: Silence log() output during the run (default: False)
+
+    Yields:
+        Dict of run results (counts, paths) the caller fills in; it becomes
+        the report's 'result'. The full report is kept in timings.last_report
+        and its stage totals are logged at the end of the run.
+    """
+    global _quiet
+    previous_quiet = _quiet
+    _quiet = _quiet or quiet
+    with timings._lock:
+        timings._active += 1
+        mark = len(timings.spans)
+
+    started = time.time()
+    start = time.perf_counter()
+    result = {}
+    report = {'run': run,
+              'started': datetime.fromtimestamp(started, tz=timezone.utc).isoformat()}
+    try:
+        yield result
+    except BaseException as e:
+        report['error'] = str(e) or type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        with timings._lock:
+            spans = timings.spans[mark:]
+            timings._active -= 1
+            if not timings._active:
+                # Nothing is listening any more; keep memory flat across runs
+                timings.spans.clear()
+
+        # Span start relative to the run start, listed after the stage name
+        spans = [dict({'stage': span['stage'], 'start': round(span['end'] - span['seconds'] - started, 6)},
+                      **{key: value for key, value in span.items() if key not in ('stage', 'end')})
+                 for span in spans]
+        report.update({'seconds': seconds, 'result': result,
+                       'stages': summarize(spans), 'spans': spans})
+        timings.last_report = report
+
+        _log_stages(report)
+        if report_path:
+            write_report(report, report_path)
+            log(f"Run report saved to: {report_path}")
+        _quiet = previous_quiet
+
+
+def _log_stages(report: Dict):
+    """Log a table of the per-stage totals of a report."""
+    stages = report['stages']
+    if not stages:
+        return
+    log(f"\nStage timings ({report['seconds']:.1f}s total):")
+    for stage, totals in sorted(stages.items(), key=lambda item: -item[1]['seconds']):
+        line = f"  {stage:<16} {totals['count']:>6} x  {totals['seconds']:>8.2f}s"
+        if 'decoded_bytes' in totals:
+            # Decoded pixels, not network traffic: COG reads fetch compressed tiles
+            line += (f"  {totals['decoded_bytes'] / 1e6:>9.1f} MB decoded"
+                     f"  {totals.get('file_bytes', 0) / 1e6:>9.1f} MB written")
+        elif 'items' in totals:
+            line += f"  {totals['items']:>9} items"
+        if totals['errors']:
+            line += f"  ({totals['errors']} failed)"
+        log(line)
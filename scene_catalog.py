@@ -0,0 +1,316 @@
+"""
+Compact Columnar Scene Catalog for STAC Search Results
+
+This module provides SceneCatalog, an array-backed alternative to the
+List[Dict] of full pystac Items returned by the search functions in
+sentinel_dataset_mpc.py:
+1. Keep one NumPy column per field (int64 timestamps, float32 cloud cover,
+   categorical orbit direction, ids and footprints) instead of one dict and
+   one pystac.Item per scene
+2. Load full STAC items, with their signed asset hrefs, lazily and in
+   batches only when a scene is actually downloaded
+3. Expose legacy record dictionaries on indexing, so existing functions can
+   consume a catalog where they used to take a list of items
+"""
+
+import numpy as np
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+
+if TYPE_CHECKING:
+    import shapely
+
+# Cloud cover of items without eo:cloud_cover, as in the legacy records
+MISSING_CLOUD_COVER = 0.0
+
+
+class ItemRef:
+    """
+    Lightweight stand-in for a pystac.Item stored in a SceneCatalog.
+
+    Exposes the item id and footprint without loading the item. The full
+    STAC item (with asset hrefs) is only fetched by resolve().
+    """
+
+    __slots__ = ('catalog', 'index')
+
+    def __init__(self, catalog: 'SceneCatalog', index: int):
+        self.catalog = catalog
+        self.index = index
+
+    @property
+    def id(self) -> str:
+        return self.catalog.ids[self.index]
+
+    @property
+    def footprint(self) -> 'shapely.Geometry':
+        return self.catalog.footprints[self.index]
+
+    @property
+    def geometry(self) -> Optional[Dict]:
+        from shapely.geometry import mapping
+
+        return None if self.footprint.is_empty else mapping(self.footprint)
+
+    def resolve(self):
+        """Fetch the full STAC item from the catalog's client."""
+        return self.catalog.load_items([self.index])[0]
+
+    def __repr__(self):
+        return f"ItemRef({self.catalog.collection!r}, {self.id!r})"
+
+
+@dataclass
+class SceneCatalog:
+    """
+    Array-backed catalog of STAC scenes from a single collection.
+
+    Attributes:
+        collection: STAC collection id (e.g. 'sentinel-2-l2a')
+        ids: Item ids (object array of str)
+        timestamps: Acquisition times in epoch milliseconds (int64)
+        cloud_cover: eo:cloud_cover percentage, MISSING_CLOUD_COVER when absent (float32)
+        orbit_codes: Index into orbit_categories for every scene (int8)
+        orbit_categories: Distinct sat:orbit_state values
+        footprints: Item footprints as shapely geometries
+        roi_coverage: Fraction of the ROI covered by each footprint, once computed
+        client: STAC client used to load full items on demand
+    """
+    collection: str
+    ids: np.ndarray
+    timestamps: np.ndarray
+    cloud_cover: np.ndarray
+    orbit_codes: np.ndarray
+    orbit_categories: np.ndarray
+    footprints: np.ndarray
+    roi_coverage: Optional[np.ndarray] = None
+    client: object = field(default=None, repr=False)
+    _item_cache: Dict[int, object] = field(default_factory=dict, init=False, repr=False)
+
+    @classmethod
+    def from_item_dicts(cls, collection: str,
+                        item_dicts: Iterable[Dict],
+                        client=None) -> 'SceneCatalog':
+        """
+        Build a catalog from STAC item JSON dictionaries.
+
+        Pairs well with ItemSearch.items_as_dicts(), which avoids creating
+        pystac.Item objects altogether.
+
+        Args:
+            collection: STAC collection id
+            item_dicts: Iterable of STAC item dictionaries
+            client: STAC client used to load full items on demand (default: None)
+
+        Returns:
+            SceneCatalog
+        """
+        import shapely
+        from shapely.geometry import shape
+
+        ids, datetimes, cloud_cover, orbits, footprints = [], [], [], [], []
+        for item in item_dicts:
+            properties = item.get('properties', {})
+            ids.append(item['id'])
+            datetimes.append(properties['datetime'])
+            cloud_cover.append(properties.get('eo:cloud_cover', MISSING_CLOUD_COVER))
+            orbits.append(properties.get('sat:orbit_state', 'unknown'))
+            geometry = item.get('geometry')
+            footprints.append(shape(geometry) if geometry else shapely.Polygon())
+
+        return cls._from_columns(collection, ids, datetimes, cloud_cover, orbits, footprints, client)
+
+    @classmethod
+    def from_items(cls, collection: str, items: Iterable, client=None) -> 'SceneCatalog':
+        """
+        Build a catalog from pystac.Item objects.
+
+        Args:
+            collection: STAC collection id
+            items: Iterable of pystac.Item objects
+            client: STAC client used to load full items on demand (default: None)
+
+        Returns:
+            SceneCatalog
+        """
+        return cls.from_item_dicts(collection, (item.to_dict() for item in items), client)
+
+    @classmethod
+    def _from_columns(cls, collection, ids, datetimes, cloud_cover, orbits, footprints, client):
+        import pandas as pd
+
+        parsed = pd.to_datetime(datetimes, utc=True, format='ISO8601').tz_localize(None)
+        orbit_categories, orbit_codes = np.unique(np.asarray(orbits, dtype=object).astype(str),
+                                                  return_inverse=True)
+        return cls(
+            collection=collection,
+            ids=np.asarray(ids, dtype=object),
+            timestamps=np.asarray(parsed, dtype='datetime64[ms]').astype(np.int64),
+            cloud_cover=np.asarray(cloud_cover, dtype=np.float32),
+            orbit_codes=orbit_codes.astype(np.int8),
+            orbit_categories=orbit_categories.astype(object),
+            footprints=np.asarray(footprints, dtype=object),
+            client=client
+        )
+
+    @classmethod
+    def concatenate(cls, catalogs: List['SceneCatalog']) -> 'SceneCatalog':
+        """
+        Merge catalogs of the same collection, keeping their order.
+
+        Args:
+            catalogs: Non-empty list of SceneCatalog objects
+
+        Returns:
+            SceneCatalog with the rows of every input catalog
+        """
+        categories = np.unique(
+            np.concatenate([catalog.orbit_categories for catalog in catalogs]).astype(str)
+        )
+        orbit_codes = [
+            np.searchsorted(categories, catalog.orbit_categories.astype(str))[catalog.orbit_codes]
+            for catalog in catalogs
+        ]
+        has_coverage = all(catalog.roi_coverage is not None for catalog in catalogs)
+
+        return cls(
+            collection=catalogs[0].collection,
+            ids=np.concatenate([catalog.ids for catalog in catalogs]),
+            timestamps=np.concatenate([catalog.timestamps for catalog in catalogs]),
+            cloud_cover=np.concatenate([catalog.cloud_cover for catalog in catalogs]),
+            orbit_codes=np.concatenate(orbit_codes).astype(np.int8),
+            orbit_categories=categories.astype(object),
+            footprints=np.concatenate([catalog.footprints for catalog in catalogs]),
+            roi_coverage=(np.concatenate([catalog.roi_coverage for catalog in catalogs])
+                          if has_coverage else None),
+            client=catalogs[0].client
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __repr__(self):
+        return f"SceneCatalog({self.collection!r}, {len(self)} scenes)"
+
+    def __getitem__(self, index: int) -> Dict:
+        """Return the legacy record dictionary for one scene."""
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        index = int(index) % len(self)
+        dt = datetime.fromtimestamp(self.timestamps[index] / 1000, tz=timezone.utc)
+        record = {
+            'id': self.ids[index],
+            'datetime': dt.strftime('%Y-%m-%d %H:%M:%S'),
+            'date': dt.strftime('%Y-%m-%d'),
+            'timestamp': int(self.timestamps[index]),
+            'cloud_cover': float(self.cloud_cover[index]),
+            'orbit_direction': self.orbit_categories[self.orbit_codes[index]],
+            'item': ItemRef(self, index)
+        }
+        if self.roi_coverage is not None:
+            record['roi_coverage'] = float(self.roi_coverage[index])
+        return record
+
+    def column(self, key: str) -> np.ndarray:
+        """
+        Return a legacy record field for every scene as an array.
+
+        Args:
+            key: Record key ('id', 'datetime', 'date', 'timestamp', 'cloud_cover',
+                'orbit_direction' or 'roi_coverage')
+
+        Returns:
+            np.ndarray: Column values in catalog order
+        """
+        if key == 'id':
+            return self.ids
+        if key == 'timestamp':
+            return self.timestamps
+        if key == 'cloud_cover':
+            return self.cloud_cover
+        if key == 'orbit_direction':
+            return self.orbit_categories[self.orbit_codes]
+        if key == 'roi_coverage' and self.roi_coverage is not None:
+            return self.roi_coverage
+        if key in ('datetime', 'date'):
+            import pandas as pd
+
+            fmt = '%Y-%m-%d %H:%M:%S' if key == 'datetime' else '%Y-%m-%d'
+            return np.asarray(pd.to_datetime(self.timestamps, unit='ms').strftime(fmt), dtype=object)
+        raise KeyError(key)
+
+    def subset(self, indices: np.ndarray) -> 'SceneCatalog':
+        """
+        Return a new catalog with the selected scenes.
+
+        Args:
+            indices: Integer positions or a boolean mask
+
+        Returns:
+            SceneCatalog sharing the same client
+        """
+        return SceneCatalog(
+            collection=self.collection,
+            ids=self.ids[indices],
+            timestamps=self.timestamps[indices],
+            cloud_cover=self.cloud_cover[indices],
+            orbit_codes=self.orbit_codes[indices],
+            orbit_categories=self.orbit_categories,
+            footprints=self.footprints[indices],
+            roi_coverage=None if self.roi_coverage is None else self.roi_coverage[indices],
+            client=self.client
+        )
+
+    def load_items(self, indices: List[int]) -> List:
+        """
+        Fetch full STAC items (with signed asset hrefs) for the given scenes.
+
+        Items that are not cached yet are requested in one search by id.
+
+        Args:
+            indices: Positions of the scenes to load
+
+        Returns:
+            List of pystac.Item objects in the order of indices
+        """
+        missing = sorted({int(i) for i in indices} - self._item_cache.keys())
+        if missing:
+            if self.client is None:
+                raise ValueError("SceneCatalog has no STAC client to load items from")
+            positions = {self.ids[i]: i for i in missing}
+            search = self.client.search(collections=[self.collection], ids=list(positions))
+            for item in search.items():
+                self._item_cache[positions[item.id]] = item
+            not_found = [self.ids[i] for i in missing if i not in self._item_cache]
+            if not_found:
+                raise KeyError(f"Items not found in {self.collection}: {not_found}")
+
+        return [self._item_cache[int(i)] for i in indices]
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory used by the numeric columns."""
+        return sum(column.nbytes for column in (self.timestamps, self.cloud_cover, self.orbit_codes))
+
+
+def resolve_items(items: List) -> List:
+    """
+    Replace ItemRef entries with full STAC items, loading each catalog's
+    missing items in one batched request.
+
+    Args:
+        items: List of pystac.Item and/or ItemRef objects
+
+    Returns:
+        List of pystac.Item objects in the same order
+    """
+    by_catalog = {}
+    for item in items:
+        if isinstance(item, ItemRef):
+            by_catalog.setdefault(id(item.catalog), (item.catalog, []))[1].append(item.index)
+
+    for catalog, indices in by_catalog.values():
+        catalog.load_items(indices)
+
+    return [item.resolve() if isinstance(item, ItemRef) else item for item in items]
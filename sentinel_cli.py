@@ -0,0 +1,328 @@
+"""
+Command-line entry point for the Sentinel-1/Sentinel-2 dataset tools
+
+This module provides four subcommands:
+1. search: count (and optionally save) the Sentinel-1 and Sentinel-2 scenes
+   of a region and date range
+2. match: create the temporally-aligned dataset metadata (create_dataset())
+3. download / export: fetch the images of a saved dataset, from Microsoft
+   Planetary Computer (download) or through Google Earth Engine export tasks
+   (export)
+
+Only the standard library and raster_stack (for the output profile names) are
+imported at startup; each subcommand imports the backend module it needs, and those modules import ee, pandas,
+planetary_computer, pystac_client and shapely only in the code paths that use
+them. `--help` and argument errors therefore return immediately, and a
+download job never loads Earth Engine.
+
+Usage:
+    python sentinel_cli.py search --bbox -9.3 38.6 -8.9 38.9 --start 2023-01-01 --end 2023-03-31
+    python sentinel_cli.py match --bbox -9.3 38.6 -8.9 38.9 --start 2023-01-01 --output-dir ./lisbon
+    python sentinel_cli.py download --output-dir ./lisbon --max-pairs 10 --clip --quiet
+    python sentinel_cli.py match --backend gee --bbox -9.3 38.6 -8.9 38.9 --output-dir ./lisbon_gee
+    python sentinel_cli.py export --output-dir ./lisbon_gee --mode stacked --state ./lisbon_gee/export_state.json
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import Dict, List, Optional
+
+BACKENDS = ('mpc', 'gee')
+
+DEFAULT_OUTPUT_DIRS = {'mpc': './sentinel_dataset_mpc', 'gee': './sentinel_dataset'}
+
+
+def _gee_orbit(orbit: Optional[str]) -> Optional[str]:
+    """Earth Engine spells orbit directions in upper case."""
+    return orbit.upper() if orbit else None
+
+
+def _gee_collections(roi, start_date: str, end_date: Optional[str],
+                     cloud_percentage: float, orbit: Optional[str]):
+    """Sentinel-1 and Sentinel-2 collections of a region, after initializing Earth Engine."""
+    import sentinel_dataset as gee
+
+    gee.initialize_earth_engine()
+    s1_collection = gee.get_sentinel1_collection(roi, start_date, end_date, orbit=orbit)
+    s2_collection = gee.get_sentinel2_collection(roi, start_date, end_date, cloud_percentage)
+    return s1_collection, s2_collection
+
+
+def _scene_records(items) -> List[Dict]:
+    """SceneCatalog rows as JSON-serializable records (without items or NaN cloud cover)."""
+    records = (items[i] for i in range(len(items)))
+    return [{key: value for key, value in record.items() if key != 'item' and value == value}
+            for record in records]
+
+
+def search(args: argparse.Namespace) -> Dict:
+    """Count the scenes of both sensors; save their records with --output."""
+    from run_report import log, reporting
+
+    with reporting('search', args.report, args.quiet) as run:
+        if args.backend == 'gee':
+            import ee
+            import sentinel_dataset as gee
+
+            roi = ee.Geometry.Rectangle(list(args.bbox))
+            s1_collection, s2_collection = _gee_collections(roi, args.start, args.end, args.cloud,
+                                                            _gee_orbit(args.orbit))
+            info = gee.fetch_collection_info(s1_collection, s2_collection, roi)
+            s1_records, s2_records = info['s1_dates'], info['s2_dates']
+        else:
+            import sentinel_dataset_mpc as mpc
+            from stac_cache import StacSearchCache
+
+            client = mpc.get_planetary_computer_client()
+            cache = StacSearchCache(args.cache) if args.cache else None
+            s1_records = _scene_records(mpc.search_sentinel1(
+                client, tuple(args.bbox), args.start, args.end, args.orbit,
+                as_catalog=True, cache=cache, shard_days=args.shard_days))
+            s2_records = _scene_records(mpc.search_sentinel2(
+                client, tuple(args.bbox), args.start, args.end, args.cloud,
+                as_catalog=True, cache=cache, shard_days=args.shard_days))
+
+        for sensor, records in (('Sentinel-1', s1_records), ('Sentinel-2', s2_records)):
+            dates = sorted(record['date'] for record in records)
+            span = f" ({dates[0]} to {dates[-1]})" if dates else ""
+            log(f"{sensor}: {len(records)} scenes{span}")
+
+        run.update(total_s1_images=len(s1_records), total_s2_images=len(s2_records))
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump({'s1': s1_records, 's2': s2_records}, f, indent=2)
+            run['output'] = args.output
+            log(f"Scene records saved to: {args.output}")
+        return run
+
+
+def match(args: argparse.Namespace) -> Dict:
+    """Create the dataset metadata in --output-dir."""
+    if args.backend == 'gee':
+        import ee
+        import sentinel_dataset as gee
+
+        gee.initialize_earth_engine()
+        _, _, matched_pairs = gee.create_dataset(
+            ee.Geometry.Rectangle(list(args.bbox)), args.start, args.end, args.cloud,
+            args.max_days, args.output_dir, _gee_orbit(args.orbit), args.matching,
+            server_side=args.server_side, metadata_format=args.metadata_format,
+            report_path=args.report, quiet=args.quiet
+        )
+    else:
+        import sentinel_dataset_mpc as mpc
+        from stac_cache import StacSearchCache
+
+        _, _, matched_pairs = mpc.create_dataset(
+            tuple(args.bbox), args.start, args.end, args.cloud, args.max_days,
+            args.output_dir, args.orbit,
+            matching=args.matching,
+            compact=True,
+            cache=StacSearchCache(args.cache) if args.cache else None,
+            shard_days=args.shard_days,
+            incremental=args.incremental,
+            metadata_format=args.metadata_format,
+            report_path=args.report, quiet=args.quiet
+        )
+    return {'matched_pairs': len(matched_pairs)}
+
+
+def _load_dataset(args: argparse.Namespace) -> Dict:
+    """Saved dataset of --output-dir (or --metadata), restricted to --start/--end."""
+    from pair_store import load_matched_pairs
+
+    return load_matched_pairs(args.metadata or args.output_dir,
+                              start_date=args.start, end_date=args.end)
+
+
+def download(args: argparse.Namespace) -> Dict:
+    """Download the pairs of a Planetary Computer dataset."""
+    import sentinel_dataset_mpc as mpc
+
+    dataset = _load_dataset(args)
+    pairs = dataset['matched_pairs'][:args.max_pairs] if args.max_pairs else dataset['matched_pairs']
+    mpc.attach_item_refs(pairs)
+    return mpc.export_matched_pairs(
+        pairs,
+        output_dir=args.images_dir or os.path.join(args.output_dir, 'images'),
+        s2_bands=args.s2_bands,
+        s1_bands=args.s1_bands,
+        max_workers=args.workers,
+        retries=args.retries,
+        bbox=tuple(dataset['bbox']) if args.clip else None,
+        stack=args.stack,
+        output_profile=args.profile,
+        report_path=args.report,
+        quiet=args.quiet
+    )
+
+
+def export(args: argparse.Namespace):
+    """Start Earth Engine export tasks for the pairs of an Earth Engine dataset."""
+    import ee
+    import sentinel_dataset as gee
+    from ee_export_scheduler import ExportScheduler
+
+    dataset = _load_dataset(args)
+    pairs = dataset['matched_pairs'][:args.max_pairs] if args.max_pairs else dataset['matched_pairs']
+    roi = ee.Geometry(dataset['roi'])
+    # Rebuild the collections the pairs were matched in
+    s1_collection, s2_collection = _gee_collections(
+        roi, dataset['start_date'], dataset['end_date'],
+        dataset['cloud_percentage_threshold'], dataset['s1_orbit']
+    )
+    joined = None
+    if dataset.get('server_side'):
+        joined = gee.join_temporal_pairs(s1_collection, s2_collection, dataset['max_time_diff_days'])
+
+    scheduler = None
+    if args.state:
+        scheduler = ExportScheduler(args.state, max_running=args.max_running)
+    return gee.export_matched_images(
+        pairs, s1_collection, s2_collection, roi,
+        output_folder=args.folder,
+        scale=args.scale,
+        export_to=args.export_to,
+        scheduler=scheduler,
+        wait=not args.no_wait,
+        joined=joined,
+        mode=args.mode,
+        s1_bands=args.s1_bands,
+        s2_bands=args.s2_bands,
+        report_path=args.report,
+        quiet=args.quiet
+    )
+
+
+def _check_args(args: argparse.Namespace) -> Optional[str]:
+    """Error message for options the parser cannot reject on its own, or None."""
+    # Options of one backend only; download and export do not define them
+    mpc_only = {'--incremental': 'incremental', '--cache': 'cache', '--shard-days': 'shard_days'}
+    if args.backend == 'gee':
+        given = [option for option, name in mpc_only.items() if getattr(args, name, None)]
+        if given:
+            return f"{', '.join(given)}: only supported with --backend mpc"
+    elif getattr(args, 'server_side', False):
+        return "--server-side: only supported with --backend gee"
+    if args.command in ('download', 'export'):
+        from pair_store import JSON_NAME, STORE_NAME, index_path
+
+        if args.metadata:
+            if not os.path.exists(args.metadata):
+                return f"--metadata: {args.metadata} does not exist"
+        elif not (os.path.exists(os.path.join(args.output_dir, JSON_NAME)) or
+                  os.path.exists(index_path(os.path.join(args.output_dir, STORE_NAME)))):
+            return f"no dataset in {args.output_dir}; run the match subcommand first or pass --metadata"
+    return None
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Argument parser with the search, match, download and export subcommands."""
+    from raster_stack import OUTPUT_PROFILES
+
+    parser = argparse.ArgumentParser(prog='sentinel_cli.py', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--output-dir',
+                        help="Dataset directory (default: './sentinel_dataset_mpc', "
+                             "or './sentinel_dataset' with --backend gee)")
+    common.add_argument('--report', help='Write a run report here (.json, or .prom for Prometheus text)')
+    common.add_argument('--quiet', action='store_true', help='Silence progress output')
+
+    region = argparse.ArgumentParser(add_help=False)
+    region.add_argument('--backend', choices=BACKENDS, default='mpc',
+                        help='Planetary Computer or Google Earth Engine (default: mpc)')
+    region.add_argument('--bbox', type=float, nargs=4, required=True,
+                        metavar=('MIN_LON', 'MIN_LAT', 'MAX_LON', 'MAX_LAT'), help='Region of interest')
+    region.add_argument('--start', default='2016-01-01', help="Start date, 'YYYY-MM-DD' (default: 2016-01-01)")
+    region.add_argument('--end', help="End date, 'YYYY-MM-DD' (default: today)")
+    region.add_argument('--cloud', type=float, default=5.0,
+                        help='Maximum Sentinel-2 cloud cover in percent (default: 5.0)')
+    region.add_argument('--orbit', choices=('ascending', 'descending'),
+                        help='Sentinel-1 orbit direction (default: both)')
+    region.add_argument('--cache', help='STAC search cache file, mpc only (default: no cache)')
+    region.add_argument('--shard-days', type=int,
+                        help='Search date shards of this many days in parallel, mpc only')
+
+    p = subparsers.add_parser('search', parents=[region, common], help='Count the scenes of a region')
+    p.add_argument('--output', help='Save the scene records (id, date, cloud cover, orbit) to this JSON file')
+    p.set_defaults(handler=search)
+
+    p = subparsers.add_parser('match', parents=[region, common], help='Create the dataset metadata')
+    p.add_argument('--max-days', type=int, default=3, help='Maximum S1/S2 time difference in days (default: 3)')
+    p.add_argument('--matching', choices=('nearest', 'one_to_one'), default='nearest',
+                   help='Pairing strategy (default: nearest)')
+    p.add_argument('--metadata-format', choices=('json', 'jsonl'), default='json',
+                   help='matched_pairs.json or the indexed matched_pairs.jsonl store (default: json)')
+    p.add_argument('--incremental', action='store_true',
+                   help='Update the dataset in --output-dir instead of rebuilding it, mpc only')
+    p.add_argument('--server-side', action='store_true', help='Pair images with ee.Join, gee only')
+    p.set_defaults(handler=match)
+
+    # download and export read the dataset saved by match
+    saved = argparse.ArgumentParser(add_help=False)
+    saved.add_argument('--metadata', help='matched_pairs.json(l) to read (default: the one in --output-dir)')
+    saved.add_argument('--start', help="Only pairs with S2 scenes from this date, 'YYYY-MM-DD'")
+    saved.add_argument('--end', help="Only pairs with S2 scenes up to this date, 'YYYY-MM-DD'")
+    saved.add_argument('--max-pairs', type=int, help='Maximum number of pairs (default: all)')
+    saved.add_argument('--s2-bands', nargs='+', help='Sentinel-2 bands')
+    saved.add_argument('--s1-bands', nargs='+', help='Sentinel-1 bands')
+
+    p = subparsers.add_parser('download', parents=[saved, common],
+                              help='Download the pairs of a Planetary Computer dataset')
+    p.add_argument('--images-dir', help='Image directory (default: <output-dir>/images)')
+    p.add_argument('--stack', action='store_true', help='Write one S2+S1 stack per pair')
+    p.add_argument('--profile', choices=sorted(OUTPUT_PROFILES), default='gtiff',
+                   help='Output file profile (default: gtiff)')
+    p.add_argument('--clip', action='store_true', help="Only read the dataset's bbox from every scene")
+    p.add_argument('--workers', type=int, default=4, help='Concurrent scene downloads (default: 4)')
+    p.add_argument('--retries', type=int, default=3, help='Retries per scene (default: 3)')
+    p.set_defaults(handler=download, backend='mpc')
+
+    p = subparsers.add_parser('export', parents=[saved, common],
+                              help='Export the pairs of an Earth Engine dataset')
+    p.add_argument('--mode', choices=('separate', 'stacked', 'tfrecord'), default='separate',
+                   help='Files per pair (default: separate)')
+    p.add_argument('--export-to', choices=('drive', 'cloud'), default='drive',
+                   help='Export destination (default: drive)')
+    p.add_argument('--folder', default='sentinel_dataset',
+                   help='Drive folder or bucket prefix (default: sentinel_dataset)')
+    p.add_argument('--scale', type=int, default=10, help='Export scale in meters (default: 10)')
+    p.add_argument('--state', help='Throttle tasks with an ExportScheduler saving its state to this file')
+    p.add_argument('--max-running', type=int, default=10,
+                   help='Tasks running at a time with --state (default: 10)')
+    p.add_argument('--no-wait', action='store_true',
+                   help='With --state, submit the first batch and exit; rerun to continue')
+    p.set_defaults(handler=export, backend='gee')
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run a subcommand; returns the process exit status."""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.output_dir is None:
+        args.output_dir = DEFAULT_OUTPUT_DIRS[args.backend]
+    if args.quiet:
+        # Also covers output outside the reporting() run, e.g. client setup
+        from run_report import set_quiet
+        set_quiet()
+
+    error = _check_args(args)
+    if error:
+        parser.error(error)
+
+    result = args.handler(args)
+    # Download, append and scheduled export summaries all list their failures
+    if isinstance(result, dict) and result.get('failures'):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,26 +5,71 @@ This module provides functions to:
 1. Acquire Sentinel-1 (SAR) and Sentinel-2 (optical) imagery
 2. Filter images based on cloud coverage and temporal criteria
 3. Create temporally-aligned multi-modal satellite datasets
+
+ee and pandas are imported inside the functions that use them, so importing
+this module (e.g. for a rematch job) stays fast.
 """
 
-import ee
-import pandas as pd
-from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Optional
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Dict, List, Tuple, Optional, Union
 import os
 import json
+import time
+from functools import partial
+from ee_export_scheduler import ExportScheduler
+from pair_store import JSON_NAME, STORE_NAME, PairStore
+from run_report import log, reporting, timings
+from temporal_matching import MS_PER_DAY, candidates_frame, match_indices, timestamps_from_records, topk_matches
+
+if TYPE_CHECKING:
+    import ee
+    import pandas as pd
+
+
+class RoundTripCounter:
+    """Counts blocking Earth Engine requests (getInfo calls) and their total latency."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def get_info(self, obj):
+        """Evaluate an Earth Engine object on the server, counting the request."""
+        start = time.perf_counter()
+        try:
+            return obj.getInfo()
+        finally:
+            seconds = time.perf_counter() - start
+            self.count += 1
+            self.seconds += seconds
+            timings.record('ee_request', seconds)
+
+    def __repr__(self):
+        return f"RoundTripCounter({self.count} requests, {self.seconds:.2f}s)"
+
+
+# Every getInfo() in this module goes through this counter
+round_trips = RoundTripCounter()
 
 
 def initialize_earth_engine():
     """Initialize Google Earth Engine API."""
-    try:
-        ee.Initialize()
-        print("Earth Engine initialized successfully")
-    except Exception as e:
-        print(f"Error initializing Earth Engine: {e}")
-        print("Attempting to authenticate...")
-        ee.Authenticate()
-        ee.Initialize()
+    import ee
+
+    with timings.span('client_init'):
+        try:
+            ee.Initialize()
+            log("Earth Engine initialized successfully")
+        except Exception as e:
+            log(f"Error initializing Earth Engine: {e}")
+            log("Attempting to authenticate...")
+            ee.Authenticate()
+            ee.Initialize()
 
 
 def get_sentinel2_collection(roi: ee.Geometry,
@@ -43,6 +88,8 @@ def get_sentinel2_collection(roi: ee.Geometry,
     Returns:
         ee.ImageCollection: Filtered Sentinel-2 image collection
     """
+    import ee
+
     if end_date is None:
         end_date = datetime.now().strftime('%Y-%m-%d')
 
@@ -72,6 +119,8 @@ def get_sentinel1_collection(roi: ee.Geometry,
     Returns:
         ee.ImageCollection: Filtered Sentinel-1 image collection
     """
+    import ee
+
     if end_date is None:
         end_date = datetime.now().strftime('%Y-%m-%d')
 
@@ -86,32 +135,84 @@ def get_sentinel1_collection(roi: ee.Geometry,
     return collection
 
 
+def _date_records(ids: List[str], timestamps: List[int]) -> List[Dict]:
+    """Image metadata records from system:index and system:time_start arrays."""
+    return [{
+        'system_index': system_index,
+        'date': datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc).strftime('%Y-%m-%d'),
+        'timestamp': timestamp
+    } for system_index, timestamp in zip(ids, timestamps)]
+
+
 def get_image_dates(collection: ee.ImageCollection) -> List[Dict]:
     """
     Extract image dates and metadata from a collection.
 
+    Only the system:index and system:time_start arrays are requested (with
+    aggregate_array), in a single request; dates are formatted locally.
+
     Args:
         collection: Earth Engine ImageCollection
 
     Returns:
         List of dictionaries containing image metadata
     """
-    def extract_info(img):
-        return ee.Feature(None, {
-            'system_index': img.get('system:index'),
-            'date': ee.Date(img.get('system:time_start')).format('YYYY-MM-dd'),
-            'timestamp': img.get('system:time_start')
-        })
+    import ee
 
-    features = collection.map(extract_info)
-    info_list = features.getInfo()['features']
+    info = round_trips.get_info(ee.Dictionary({
+        'ids': collection.aggregate_array('system:index'),
+        'timestamps': collection.aggregate_array('system:time_start')
+    }))
+    return _date_records(info['ids'], info['timestamps'])
 
-    return [feat['properties'] for feat in info_list]
+
+def fetch_collection_info(s1_collection: ee.ImageCollection,
+                          s2_collection: ee.ImageCollection,
+                          roi: ee.Geometry,
+                          joined: Optional[ee.ImageCollection] = None) -> Dict:
+    """
+    Fetch everything create_dataset() needs from the server in one request.
+
+    Args:
+        s1_collection: Sentinel-1 image collection
+        s2_collection: Sentinel-2 image collection
+        roi: Region of Interest
+        joined: Joined collection from join_temporal_pairs(); when given, only
+            the collection sizes are requested instead of the image dates
+            (default: None)
+
+    Returns:
+        Dict with 's1_count', 's2_count' and 'roi' (GeoJSON), plus 's1_dates'
+        and 's2_dates' (get_image_dates() records), or 'joined_count' when
+        joined is given
+    """
+    import ee
+
+    request = {'roi': roi}
+    if joined is None:
+        for sensor, collection in (('s1', s1_collection), ('s2', s2_collection)):
+            request[f'{sensor}_ids'] = collection.aggregate_array('system:index')
+            request[f'{sensor}_timestamps'] = collection.aggregate_array('system:time_start')
+    else:
+        request['s1_count'] = s1_collection.size()
+        request['s2_count'] = s2_collection.size()
+        request['joined_count'] = joined.size()
+
+    info = round_trips.get_info(ee.Dictionary(request))
+
+    if joined is None:
+        for sensor in ('s1', 's2'):
+            info[f'{sensor}_dates'] = _date_records(info.pop(f'{sensor}_ids'),
+                                                    info.pop(f'{sensor}_timestamps'))
+            info[f'{sensor}_count'] = len(info[f'{sensor}_dates'])
+    return info
 
 
 def match_temporal_pairs(s1_dates: List[Dict],
                         s2_dates: List[Dict],
-                        max_time_diff_days: int = 3) -> List[Dict]:
+                        max_time_diff_days: int = 3,
+                        matching: str = 'nearest',
+                        top_k: Optional[int] = None) -> Union[List[Dict], pd.DataFrame]:
     """
     Match Sentinel-1 and Sentinel-2 images that are within max_time_diff_days.
 
@@ -119,52 +220,168 @@ def match_temporal_pairs(s1_dates: List[Dict],
         s1_dates: List of Sentinel-1 image metadata
         s2_dates: List of Sentinel-2 image metadata
         max_time_diff_days: Maximum time difference in days (default: 3)
+        matching: Pairing strategy (default: 'nearest')
+            - 'nearest': closest Sentinel-1 image for every Sentinel-2 image;
+              one Sentinel-1 image may appear in several pairs
+            - 'one_to_one': every image is used at most once, maximizing the
+              number of pairs and minimizing the total time difference
+        top_k: Return up to top_k closest Sentinel-1 candidates per Sentinel-2
+            image as a DataFrame instead of a list of pairs (default: None).
+            Only supported with matching='nearest'.
 
     Returns:
-        List of matched image pairs with metadata
+        List of matched image pairs with metadata, or a DataFrame with one row
+        per candidate when top_k is set. The 's1_position'/'s2_position'
+        columns index back into the input lists.
     """
+    if top_k is not None and matching != 'nearest':
+        raise ValueError("top_k candidates are only supported with matching='nearest'")
+
     matched_pairs = []
 
-    # Convert to pandas DataFrames for easier manipulation
-    s1_df = pd.DataFrame(s1_dates)
-    s2_df = pd.DataFrame(s2_dates)
+    if not s1_dates or not s2_dates:
+        log("Warning: One or both collections are empty")
+        if top_k is None:
+            return matched_pairs
+
+    start = time.perf_counter()
+    # Earth Engine dates are compared at whole-day resolution
+    s1_times = timestamps_from_records(s1_dates, resolution_ms=MS_PER_DAY)
+    s2_times = timestamps_from_records(s2_dates, resolution_ms=MS_PER_DAY)
+
+    if top_k is not None:
+        s2_indices, s1_indices, time_diffs, ranks = topk_matches(
+            s1_times, s2_times, max_time_diff_days, top_k
+        )
+        candidates = candidates_frame(
+            s1_dates, s2_dates, s2_indices, s1_indices, time_diffs, ranks,
+            s1_columns={'s1_index': 'system_index', 's1_date': 'date', 's1_timestamp': 'timestamp'},
+            s2_columns={'s2_index': 'system_index', 's2_date': 'date', 's2_timestamp': 'timestamp'}
+        )
+        timings.record('matching', time.perf_counter() - start,
+                       items=len(s1_times) + len(s2_times), pairs=len(candidates))
+        log(f"Found {len(candidates)} candidates for {candidates['s2_position'].nunique()} "
+            f"Sentinel-2 images within {max_time_diff_days} days")
+        return candidates
+
+    s2_indices, s1_indices, time_diffs = match_indices(
+        s1_times, s2_times, max_time_diff_days, matching
+    )
 
-    if s1_df.empty or s2_df.empty:
-        print("Warning: One or both collections are empty")
-        return matched_pairs
+    for s2_idx, s1_idx, time_diff in zip(s2_indices.tolist(), s1_indices.tolist(), time_diffs.tolist()):
+        s1_row = s1_dates[s1_idx]
+        s2_row = s2_dates[s2_idx]
+
+        matched_pairs.append({
+            's1_index': s1_row['system_index'],
+            's1_date': s1_row['date'],
+            's1_timestamp': int(s1_row['timestamp']),
+            's2_index': s2_row['system_index'],
+            's2_date': s2_row['date'],
+            's2_timestamp': int(s2_row['timestamp']),
+            'time_diff_days': time_diff
+        })
 
-    s1_df['datetime'] = pd.to_datetime(s1_df['date'])
-    s2_df['datetime'] = pd.to_datetime(s2_df['date'])
+    timings.record('matching', time.perf_counter() - start,
+                   items=len(s1_times) + len(s2_times), pairs=len(matched_pairs))
+    log(f"Found {len(matched_pairs)} matched pairs within {max_time_diff_days} days")
+    return matched_pairs
 
-    # Sort by date
-    s1_df = s1_df.sort_values('datetime').reset_index(drop=True)
-    s2_df = s2_df.sort_values('datetime').reset_index(drop=True)
 
-    # For each Sentinel-2 image, find the closest Sentinel-1 image
-    for idx, s2_row in s2_df.iterrows():
-        s2_date = s2_row['datetime']
+def _with_day(collection: ee.ImageCollection) -> ee.ImageCollection:
+    """Add a whole-day 'day' property, the resolution the client-side matcher uses."""
+    import ee
 
-        # Calculate time differences
-        s1_df['time_diff'] = abs((s1_df['datetime'] - s2_date).dt.total_seconds() / 86400)
+    return collection.map(lambda img: img.set(
+        'day', ee.Number(img.get('system:time_start')).divide(MS_PER_DAY).floor()
+    ))
 
-        # Find images within the time threshold
-        valid_matches = s1_df[s1_df['time_diff'] <= max_time_diff_days]
 
-        if not valid_matches.empty:
-            # Get the closest match
-            closest_match = valid_matches.loc[valid_matches['time_diff'].idxmin()]
+def join_temporal_pairs(s1_collection: ee.ImageCollection,
+                        s2_collection: ee.ImageCollection,
+                        max_time_diff_days: int = 3) -> ee.ImageCollection:
+    """
+    Pair every Sentinel-2 image with its closest Sentinel-1 image on the server.
 
-            matched_pairs.append({
-                's1_index': closest_match['system_index'],
-                's1_date': closest_match['date'],
-                's1_timestamp': int(closest_match['timestamp']),
-                's2_index': s2_row['system_index'],
-                's2_date': s2_row['date'],
-                's2_timestamp': int(s2_row['timestamp']),
-                'time_diff_days': float(closest_match['time_diff'])
-            })
+    Uses ee.Join.saveBest with a maxDifference filter on whole acquisition
+    days, i.e. the same rule as match_temporal_pairs(matching='nearest'),
+    without downloading any image dates.
 
-    print(f"Found {len(matched_pairs)} matched pairs within {max_time_diff_days} days")
+    Args:
+        s1_collection: Sentinel-1 image collection
+        s2_collection: Sentinel-2 image collection
+        max_time_diff_days: Maximum time difference in days (default: 3)
+
+    Returns:
+        ee.ImageCollection of the matched Sentinel-2 images, sorted by time,
+        with the paired Sentinel-1 image in the 's1_match' property and the
+        difference in days in 'time_diff_days'
+    """
+    import ee
+
+    time_filter = ee.Filter.maxDifference(
+        difference=max_time_diff_days,
+        leftField='day',
+        rightField='day'
+    )
+    join = ee.Join.saveBest(matchKey='s1_match', measureKey='time_diff_days')
+    joined = join.apply(_with_day(s2_collection), _with_day(s1_collection), time_filter)
+    return ee.ImageCollection(joined).sort('system:time_start')
+
+
+def _joined_pair_info(img) -> ee.Dictionary:
+    """Pair metadata of one joined Sentinel-2 image, in the match_temporal_pairs() format."""
+    import ee
+
+    s2 = ee.Image(img)
+    s1 = ee.Image(s2.get('s1_match'))
+    return ee.Dictionary({
+        's1_index': s1.get('system:index'),
+        's1_date': ee.Date(s1.get('system:time_start')).format('YYYY-MM-dd'),
+        's1_timestamp': s1.get('system:time_start'),
+        's2_index': s2.get('system:index'),
+        's2_date': ee.Date(s2.get('system:time_start')).format('YYYY-MM-dd'),
+        's2_timestamp': s2.get('system:time_start'),
+        'time_diff_days': s2.get('time_diff_days')
+    })
+
+
+def fetch_joined_pairs(joined: ee.ImageCollection,
+                       page_size: int = 1000,
+                       total: Optional[int] = None) -> List[Dict]:
+    """
+    Download the pair metadata of a joined collection in pages.
+
+    Each page is one getInfo() request of at most page_size pairs, which
+    keeps every request under Earth Engine's 5000-element limit.
+
+    Args:
+        joined: Result of join_temporal_pairs()
+        page_size: Pairs per request, at most 5000 (default: 1000)
+        total: Size of joined if already known, saving one request (default: None)
+
+    Returns:
+        List of matched pairs in the same format as match_temporal_pairs()
+    """
+    if not 0 < page_size <= 5000:
+        raise ValueError("page_size must be between 1 and 5000")
+
+    if total is None:
+        total = round_trips.get_info(joined.size())
+    matched_pairs = []
+    for offset in range(0, total, page_size):
+        page = round_trips.get_info(joined.toList(page_size, offset).map(_joined_pair_info))
+        for pair in page:
+            pair['s1_timestamp'] = int(pair['s1_timestamp'])
+            pair['s2_timestamp'] = int(pair['s2_timestamp'])
+            pair['time_diff_days'] = float(pair['time_diff_days'])
+        # Keep the key order of match_temporal_pairs()
+        matched_pairs.extend({key: pair[key] for key in (
+            's1_index', 's1_date', 's1_timestamp', 's2_index', 's2_date', 's2_timestamp',
+            'time_diff_days')} for pair in page)
+
+    log(f"Found {len(matched_pairs)} matched pairs (server-side join, "
+        f"{-(-total // page_size)} page(s))")
     return matched_pairs
 
 
@@ -174,7 +391,12 @@ def create_dataset(roi: ee.Geometry,
                   cloud_percentage: float = 5.0,
                   max_time_diff_days: int = 3,
                   output_dir: str = './sentinel_dataset',
-                  s1_orbit: Optional[str] = None) -> Tuple[ee.ImageCollection, ee.ImageCollection, List[Dict]]:
+                  s1_orbit: Optional[str] = None,
+                  matching: str = 'nearest',
+                  server_side: bool = False,
+                  metadata_format: str = 'json',
+                  report_path: Optional[str] = None,
+                  quiet: bool = False) -> Tuple[ee.ImageCollection, ee.ImageCollection, List[Dict]]:
     """
     Create a temporally-aligned dataset of Sentinel-1 and Sentinel-2 images.
 
@@ -186,76 +408,182 @@ def create_dataset(roi: ee.Geometry,
         max_time_diff_days: Maximum time difference for pairing (default: 3 days)
         output_dir: Directory to save dataset metadata (default: './sentinel_dataset')
         s1_orbit: Sentinel-1 orbit direction ('ASCENDING'/'DESCENDING'/None)
+        matching: Pairing strategy, 'nearest' or 'one_to_one' (default: 'nearest')
+        server_side: Pair images with ee.Join on the server instead of
+            downloading all image dates; only supports matching='nearest'
+            (default: False)
+        metadata_format: 'json' (matched_pairs.json) or 'jsonl' (an indexed
+            pair_store.PairStore in matched_pairs.jsonl) (default: 'json')
+        report_path: Write a run report with per-stage timings (Earth Engine
+            requests, matching, metadata write) to this file, as JSON or, for
+            a .prom path, Prometheus text (default: None)
+        quiet: Silence the console output, e.g. in batch jobs (default: False)
 
     Returns:
-        Tuple of (s1_collection, s2_collection, matched_pairs)
+        Tuple of (s1_collection, s2_collection, matched_pairs). With
+        server_side=True, s2_collection is the joined collection of matched
+        Sentinel-2 images (pass it as joined= to export_matched_images()).
     """
-    print("=" * 80)
-    print("CREATING SENTINEL-1 & SENTINEL-2 TEMPORAL DATASET")
-    print("=" * 80)
-    print(f"Start Date: {start_date}")
-    print(f"End Date: {end_date or 'today'}")
-    print(f"Cloud Coverage Threshold: {cloud_percentage}%")
-    print(f"Max Temporal Difference: {max_time_diff_days} days")
-    print(f"Sentinel-1 Orbit: {s1_orbit or 'Both'}")
-    print("-" * 80)
-
-    # Get Sentinel-2 collection
-    print("\n[1/4] Fetching Sentinel-2 images...")
-    s2_collection = get_sentinel2_collection(roi, start_date, end_date, cloud_percentage)
-    s2_count = s2_collection.size().getInfo()
-    print(f"Found {s2_count} Sentinel-2 images with <{cloud_percentage}% cloud coverage")
-
-    # Get Sentinel-1 collection
-    print("\n[2/4] Fetching Sentinel-1 images...")
-    s1_collection = get_sentinel1_collection(roi, start_date, end_date, orbit=s1_orbit)
-    s1_count = s1_collection.size().getInfo()
-    print(f"Found {s1_count} Sentinel-1 images")
-
-    if s1_count == 0 or s2_count == 0:
-        print("\nWarning: No images found in one or both collections!")
-        return s1_collection, s2_collection, []
-
-    # Extract dates
-    print("\n[3/4] Extracting image dates...")
-    s1_dates = get_image_dates(s1_collection)
-    s2_dates = get_image_dates(s2_collection)
-    print(f"Extracted {len(s1_dates)} S1 dates and {len(s2_dates)} S2 dates")
-
-    # Match temporal pairs
-    print(f"\n[4/4] Matching temporal pairs (max {max_time_diff_days} days apart)...")
-    matched_pairs = match_temporal_pairs(s1_dates, s2_dates, max_time_diff_days)
-
-    # Save metadata
-    os.makedirs(output_dir, exist_ok=True)
-    metadata_file = os.path.join(output_dir, 'matched_pairs.json')
-
-    metadata = {
-        'roi': roi.getInfo(),
-        'start_date': start_date,
-        'end_date': end_date or datetime.now().strftime('%Y-%m-%d'),
-        'cloud_percentage_threshold': cloud_percentage,
-        'max_time_diff_days': max_time_diff_days,
-        's1_orbit': s1_orbit,
-        'total_s1_images': s1_count,
-        'total_s2_images': s2_count,
-        'matched_pairs_count': len(matched_pairs),
-        'matched_pairs': matched_pairs
-    }
+    if server_side and matching != 'nearest':
+        raise ValueError("server_side pairing only supports matching='nearest'")
+    if metadata_format not in ('json', 'jsonl'):
+        raise ValueError(f"Unknown metadata_format '{metadata_format}'; expected 'json' or 'jsonl'")
+
+    with reporting('create_dataset', report_path, quiet) as run:
+        log("=" * 80)
+        log("CREATING SENTINEL-1 & SENTINEL-2 TEMPORAL DATASET")
+        log("=" * 80)
+        log(f"Start Date: {start_date}")
+        log(f"End Date: {end_date or 'today'}")
+        log(f"Cloud Coverage Threshold: {cloud_percentage}%")
+        log(f"Max Temporal Difference: {max_time_diff_days} days")
+        log(f"Sentinel-1 Orbit: {s1_orbit or 'Both'}")
+        log(f"Matching: {matching}")
+        log("-" * 80)
+
+        requests_before = round_trips.count
+        seconds_before = round_trips.seconds
+
+        # Build both collections; nothing is sent to the server yet
+        log("\n[1/3] Defining Sentinel-2 and Sentinel-1 collections...")
+        s2_collection = get_sentinel2_collection(roi, start_date, end_date, cloud_percentage)
+        s1_collection = get_sentinel1_collection(roi, start_date, end_date, orbit=s1_orbit)
+        joined = None
+        if server_side:
+            log(f"Joining temporal pairs on the server (max {max_time_diff_days} days apart)")
+            joined = join_temporal_pairs(s1_collection, s2_collection, max_time_diff_days)
+
+        # Counts, image dates and the ROI in a single request
+        log("\n[2/3] Fetching collection metadata...")
+        info = fetch_collection_info(s1_collection, s2_collection, roi, joined)
+        s1_count, s2_count = info['s1_count'], info['s2_count']
+        log(f"Found {s2_count} Sentinel-2 images with <{cloud_percentage}% cloud coverage")
+        log(f"Found {s1_count} Sentinel-1 images")
+
+        if s1_count == 0 or s2_count == 0:
+            log("\nWarning: No images found in one or both collections!")
+            return s1_collection, s2_collection, []
+
+        if server_side:
+            s2_collection = joined
+            log("\n[3/3] Fetching matched pairs...")
+            matched_pairs = fetch_joined_pairs(joined, total=info['joined_count'])
+        else:
+            log(f"\n[3/3] Matching temporal pairs (max {max_time_diff_days} days apart)...")
+            matched_pairs = match_temporal_pairs(info['s1_dates'], info['s2_dates'],
+                                                 max_time_diff_days, matching)
+
+        requests = round_trips.count - requests_before
+        request_seconds = round_trips.seconds - seconds_before
+
+        # Save metadata
+        os.makedirs(output_dir, exist_ok=True)
+        metadata_file = os.path.join(output_dir, JSON_NAME)
+
+        metadata = {
+            'roi': info['roi'],
+            'start_date': start_date,
+            'end_date': end_date or datetime.now().strftime('%Y-%m-%d'),
+            'cloud_percentage_threshold': cloud_percentage,
+            'max_time_diff_days': max_time_diff_days,
+            's1_orbit': s1_orbit,
+            'matching': matching,
+            'server_side': server_side,
+            'total_s1_images': s1_count,
+            'total_s2_images': s2_count
+        }
+
+        with timings.span('metadata_write', pairs=len(matched_pairs)) as span:
+            if metadata_format == 'jsonl':
+                store = PairStore(os.path.join(output_dir, STORE_NAME))
+                store.clear()
+                store.append(matched_pairs)
+                store.update_metadata(metadata)
+                metadata_file = store.path
+            else:
+                metadata.update({
+                    'matched_pairs_count': len(matched_pairs),
+                    'matched_pairs': matched_pairs
+                })
+                with open(metadata_file, 'w') as f:
+                    json.dump(metadata, f, indent=2)
+            span['file_bytes'] = os.path.getsize(metadata_file)
+        run.update(total_s1_images=s1_count, total_s2_images=s2_count,
+                   matched_pairs=len(matched_pairs), ee_requests=requests,
+                   metadata_file=metadata_file)
+
+        log(f"\n{'=' * 80}")
+        log("DATASET SUMMARY")
+        log(f"{'=' * 80}")
+        log(f"Total Sentinel-1 images: {s1_count}")
+        log(f"Total Sentinel-2 images: {s2_count}")
+        log(f"Matched pairs: {len(matched_pairs)}")
+        log(f"Earth Engine round trips: {requests} ({request_seconds:.1f}s)")
+        log(f"\nMetadata saved to: {metadata_file}")
+        log(f"{'=' * 80}\n")
+
+        return s1_collection, s2_collection, matched_pairs
+
+
+# 'separate': one S1 and one S2 GeoTIFF per pair; 'stacked': one multi-band
+# GeoTIFF per pair; 'tfrecord': one TFRecord file of training patches per pair
+EXPORT_MODES = ('separate', 'stacked', 'tfrecord')
+
+
+def stack_pair_images(s1_image: ee.Image,
+                      s2_image: ee.Image,
+                      s1_bands: Optional[List[str]] = None,
+                      s2_bands: Optional[List[str]] = None) -> ee.Image:
+    """
+    Stack the bands of one matched pair into a single float32 image.
 
-    with open(metadata_file, 'w') as f:
-        json.dump(metadata, f, indent=2)
+    Bands are prefixed with the sensor ('S2_B4', 'S1_VV'), S2 bands first, as in
+    the stacked files of sentinel_dataset_mpc.py. The export reprojects both
+    sensors onto one grid.
 
-    print(f"\n{'=' * 80}")
-    print("DATASET SUMMARY")
-    print(f"{'=' * 80}")
-    print(f"Total Sentinel-1 images: {s1_count}")
-    print(f"Total Sentinel-2 images: {s2_count}")
-    print(f"Matched pairs: {len(matched_pairs)}")
-    print(f"\nMetadata saved to: {metadata_file}")
-    print(f"{'=' * 80}\n")
+    Args:
+        s1_image: Sentinel-1 image
+        s2_image: Sentinel-2 image
+        s1_bands: S1 bands to keep (default: None, all bands)
+        s2_bands: S2 bands to keep (default: None, all bands)
 
-    return s1_collection, s2_collection, matched_pairs
+    Returns:
+        ee.Image: Stacked image
+    """
+    s2 = (s2_image.select(s2_bands) if s2_bands else s2_image).regexpRename('^', 'S2_')
+    s1 = (s1_image.select(s1_bands) if s1_bands else s1_image).regexpRename('^', 'S1_')
+    # S2 reflectance is uint16 and S1 backscatter float; one file needs one type
+    return s2.toFloat().addBands(s1.toFloat())
+
+
+def _export_task(image: ee.Image,
+                 description: str,
+                 roi: ee.Geometry,
+                 output_folder: str,
+                 scale: int,
+                 export_to: str,
+                 file_format: str = 'GeoTIFF',
+                 format_options: Optional[Dict] = None,
+                 batch=None):
+    """Build an unstarted image export task to Google Drive or Cloud Storage."""
+    if batch is None:
+        import ee
+        batch = ee.batch
+
+    params = {
+        'image': image.clip(roi),
+        'description': description,
+        'scale': scale,
+        'region': roi,
+        'fileFormat': file_format,
+        'maxPixels': 1e13
+    }
+    if format_options:
+        params['formatOptions'] = format_options
+
+    if export_to == 'drive':
+        return batch.Export.image.toDrive(folder=output_folder, **params)
+    return batch.Export.image.toCloudStorage(bucket=output_folder, **params)
 
 
 def export_matched_images(matched_pairs: List[Dict],
@@ -264,10 +592,29 @@ def export_matched_images(matched_pairs: List[Dict],
                          roi: ee.Geometry,
                          output_folder: str = 'sentinel_dataset',
                          scale: int = 10,
-                         export_to: str = 'drive'):
+                         export_to: str = 'drive',
+                         scheduler: Optional[ExportScheduler] = None,
+                         wait: bool = True,
+                         joined: Optional[ee.ImageCollection] = None,
+                         mode: str = 'separate',
+                         s1_bands: Optional[List[str]] = None,
+                         s2_bands: Optional[List[str]] = None,
+                         patch_size: int = 256,
+                         report_path: Optional[str] = None,
+                         quiet: bool = False):
     """
     Export matched image pairs to Google Drive or Cloud Storage.
 
+    The 'stacked' and 'tfrecord' modes export each pair as one task instead of
+    two, halving the number of queued tasks. 'tfrecord' writes gzipped
+    TFRecord files of patch_size x patch_size patches with one float feature
+    per stacked band, ready for tf.data.
+
+    Without a scheduler every task is started immediately. With one, at most
+    scheduler.max_running tasks run at a time, failed tasks are resubmitted
+    and progress is saved to the scheduler's state file, so calling this
+    again with the same pairs resumes the export.
+
     Args:
         matched_pairs: List of matched image pairs
         s1_collection: Sentinel-1 image collection
@@ -276,89 +623,129 @@ def export_matched_images(matched_pairs: List[Dict],
         output_folder: Output folder name (default: 'sentinel_dataset')
         scale: Export scale in meters (default: 10m for S2 resolution)
         export_to: Export destination ('drive' or 'cloud') (default: 'drive')
-    """
-    print(f"\n{'=' * 80}")
-    print(f"EXPORTING {len(matched_pairs)} MATCHED IMAGE PAIRS")
-    print(f"{'=' * 80}")
-    print(f"Export destination: Google {export_to.upper()}")
-    print(f"Resolution: {scale}m")
-    print(f"Output folder: {output_folder}")
-    print("-" * 80)
-
-    tasks = []
-
-    for i, pair in enumerate(matched_pairs):
-        pair_name = f"pair_{i:04d}_diff_{pair['time_diff_days']:.2f}d"
-
-        # Get Sentinel-1 image
-        s1_img = s1_collection.filter(
-            ee.Filter.eq('system:index', pair['s1_index'])
-        ).first()
-
-        # Get Sentinel-2 image
-        s2_img = s2_collection.filter(
-            ee.Filter.eq('system:index', pair['s2_index'])
-        ).first()
-
-        # Export Sentinel-1
-        s1_export_name = f"{pair_name}_S1_{pair['s1_date']}"
-        if export_to == 'drive':
-            task_s1 = ee.batch.Export.image.toDrive(
-                image=s1_img.clip(roi),
-                description=s1_export_name,
-                folder=output_folder,
-                scale=scale,
-                region=roi,
-                maxPixels=1e13
-            )
-        else:
-            task_s1 = ee.batch.Export.image.toCloudStorage(
-                image=s1_img.clip(roi),
-                description=s1_export_name,
-                bucket=output_folder,
-                scale=scale,
-                region=roi,
-                maxPixels=1e13
-            )
-
-        # Export Sentinel-2
-        s2_export_name = f"{pair_name}_S2_{pair['s2_date']}"
-        if export_to == 'drive':
-            task_s2 = ee.batch.Export.image.toDrive(
-                image=s2_img.clip(roi),
-                description=s2_export_name,
-                folder=output_folder,
-                scale=scale,
-                region=roi,
-                maxPixels=1e13
-            )
-        else:
-            task_s2 = ee.batch.Export.image.toCloudStorage(
-                image=s2_img.clip(roi),
-                description=s2_export_name,
-                bucket=output_folder,
-                scale=scale,
-                region=roi,
-                maxPixels=1e13
-            )
-
-        task_s1.start()
-        task_s2.start()
-
-        tasks.append({
-            'pair': pair_name,
-            's1_task': task_s1,
-            's2_task': task_s2
-        })
-
-        print(f"[{i+1}/{len(matched_pairs)}] Submitted: {pair_name}")
+        scheduler: ExportScheduler to throttle and track the tasks (default: None)
+        wait: With a scheduler, block until all tasks finished; False submits
+            the first batch and returns (default: True)
+        joined: Joined collection from join_temporal_pairs() / create_dataset(
+            server_side=True). S1 images are then taken from each S2 image's
+            's1_match' property instead of filtering s1_collection (default: None)
+        mode: 'separate' (S1 and S2 GeoTIFFs), 'stacked' (one GeoTIFF per pair)
+            or 'tfrecord' (training patches, Cloud Storage only) (default: 'separate')
+        s1_bands: S1 bands to export (default: None, all bands)
+        s2_bands: S2 bands to export (default: None, all bands)
+        patch_size: Patch width and height in pixels for 'tfrecord' (default: 256)
+        report_path: Write a run report with the time of every task submission
+            (and scheduler poll) to this file, as JSON or, for a .prom path,
+            Prometheus text (default: None)
+        quiet: Silence the console output, e.g. in batch jobs (default: False)
 
-    print(f"\n{'=' * 80}")
-    print(f"All {len(matched_pairs)} pairs submitted for export!")
-    print("Check your Google Drive or Cloud Storage for the exported images.")
-    print(f"{'=' * 80}\n")
-
-    return tasks
+    Returns:
+        List of {'pair', 's1_task', 's2_task'} task handles ({'pair', 'task'}
+        for 'stacked' and 'tfrecord'), or the scheduler summary (job counts
+        and failures) when a scheduler is used
+    """
+    import ee
+
+    if mode not in EXPORT_MODES:
+        raise ValueError(f"Unknown export mode '{mode}'; expected one of {EXPORT_MODES}")
+    if mode == 'tfrecord' and export_to != 'cloud':
+        raise ValueError("TFRecord patches are exported to Cloud Storage; use export_to='cloud'")
+    if patch_size <= 0:
+        raise ValueError("patch_size must be positive")
+
+    with reporting('export_matched_images', report_path, quiet) as run:
+        log(f"\n{'=' * 80}")
+        log(f"EXPORTING {len(matched_pairs)} MATCHED IMAGE PAIRS")
+        log(f"{'=' * 80}")
+        log(f"Export destination: Google {export_to.upper()}")
+        log(f"Resolution: {scale}m")
+        log(f"Export mode: {mode}")
+        log(f"Output folder: {output_folder}")
+        log("-" * 80)
+
+        def pair_images(pair: Dict):
+            source = joined if joined is not None else s2_collection
+            s2_img = ee.Image(source.filter(ee.Filter.eq('system:index', pair['s2_index'])).first())
+            if joined is not None:
+                s1_img = ee.Image(s2_img.get('s1_match'))
+            else:
+                s1_img = ee.Image(s1_collection.filter(ee.Filter.eq('system:index', pair['s1_index'])).first())
+            return s1_img, s2_img
+
+        # Tasks come from the scheduler's (possibly mocked) batch module
+        batch = scheduler.batch if scheduler is not None else ee.batch
+
+        def pair_task(pair: Dict, kind: str, description: str):
+            s1_img, s2_img = pair_images(pair)
+            if kind == 'S1':
+                image = s1_img.select(s1_bands) if s1_bands else s1_img
+            elif kind == 'S2':
+                image = s2_img.select(s2_bands) if s2_bands else s2_img
+            else:
+                image = stack_pair_images(s1_img, s2_img, s1_bands, s2_bands)
+
+            if kind == 'PATCHES':
+                return _export_task(image, description, roi, output_folder, scale, export_to,
+                                    file_format='TFRecord',
+                                    format_options={'patchDimensions': [patch_size, patch_size],
+                                                    'compressed': True},
+                                    batch=batch)
+            return _export_task(image, description, roi, output_folder, scale, export_to, batch=batch)
+
+        kinds = {'separate': ('S1', 'S2'), 'stacked': ('STACK',), 'tfrecord': ('PATCHES',)}[mode]
+
+        # (pair name, {export name: task factory}) for every pair
+        exports = []
+        for i, pair in enumerate(matched_pairs):
+            pair_name = f"pair_{i:04d}_diff_{pair['time_diff_days']:.2f}d"
+            pair_exports = {}
+            for kind in kinds:
+                date = pair['s1_date'] if kind == 'S1' else pair['s2_date']
+                export_name = f"{pair_name}_{kind}_{date}"
+                pair_exports[export_name] = partial(pair_task, pair, kind, export_name)
+            exports.append((pair_name, pair_exports))
+
+        if scheduler is not None:
+            factories = {name: factory for _, pair_exports in exports
+                         for name, factory in pair_exports.items()}
+            summary = scheduler.run(factories, wait=wait)
+            run.update(summary)
+
+            log(f"\n{'=' * 80}")
+            log(f"{summary['COMPLETED']}/{len(factories)} export tasks completed, "
+                f"{summary['FAILED']} failed")
+            log(f"State saved to: {scheduler.state_path}")
+            log(f"{'=' * 80}\n")
+            return summary
+
+        tasks = []
+
+        for i, (pair_name, pair_exports) in enumerate(exports):
+            pair_tasks = []
+            for export_name, factory in pair_exports.items():
+                with timings.span('task_submit', task=export_name):
+                    task = factory()
+                    task.start()
+                pair_tasks.append(task)
+
+            if mode == 'separate':
+                tasks.append({
+                    'pair': pair_name,
+                    's1_task': pair_tasks[0],
+                    's2_task': pair_tasks[1]
+                })
+            else:
+                tasks.append({'pair': pair_name, 'task': pair_tasks[0]})
+
+            log(f"[{i+1}/{len(matched_pairs)}] Submitted: {pair_name}")
+
+        run.update(pairs=len(matched_pairs), tasks=sum(len(pair_exports) for _, pair_exports in exports))
+        log(f"\n{'=' * 80}")
+        log(f"All {len(matched_pairs)} pairs submitted for export!")
+        log("Check your Google Drive or Cloud Storage for the exported images.")
+        log(f"{'=' * 80}\n")
+
+        return tasks
 
 
 def get_sample_roi_geometry() -> ee.Geometry:
@@ -368,6 +755,8 @@ def get_sample_roi_geometry() -> ee.Geometry:
     Returns:
         ee.Geometry: Sample region of interest
     """
+    import ee
+
     return ee.Geometry.Rectangle([-122.5, 37.5, -122.0, 38.0])
 
 
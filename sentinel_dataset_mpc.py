@@ -5,19 +5,94 @@ This module provides functions to:
 1. Acquire Sentinel-1 (SAR) and Sentinel-2 (optical) imagery from Microsoft Planetary Computer
 2. Filter images based on cloud coverage and temporal criteria
 3. Create temporally-aligned multi-modal satellite datasets
+
+planetary_computer, pystac_client, pandas and shapely are imported inside
+the functions that use them, so importing this module (e.g. for a download
+or rematch job) stays fast.
 """
 
-import planetary_computer as pc
-from pystac_client import Client
-import pandas as pd
-from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Optional
+from __future__ import annotations
+
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, replace
+from datetime import date, datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Tuple, Optional, Union
 import os
 import json
-from shapely.geometry import box, Point, Polygon, mapping
+import queue
+import shutil
+import threading
+import time
+from download_manifest import MANIFEST_NAME, DownloadManifest, temp_path
+from pair_store import JSON_NAME, STORE_NAME, PairStore, index_path
+from raster_stack import Grid, open_assets, stack_assets, stack_meta, target_grid, write_raster
+from run_report import log, reporting, timed_pages, timings
+from scene_catalog import MISSING_CLOUD_COVER, ItemRef, SceneCatalog, resolve_items
+from stac_cache import StacSearchCache
+from temporal_matching import StreamingMatcher, candidates_frame, match_indices, timestamps_from_records, topk_matches
+from zarr_cube import ZarrCubeWriter
 import warnings
 warnings.filterwarnings('ignore')
 
+if TYPE_CHECKING:
+    import pandas as pd
+    from pystac import Item
+    from pystac_client import Client
+
+# HTTP status codes worth retrying when downloading assets
+TRANSIENT_HTTP_CODES = (408, 429, 500, 502, 503, 504)
+# Settings missing from matched_pairs.json files written by earlier versions
+LEGACY_SETTINGS = {'matching': 'nearest', 'min_coverage': 0.0, 'min_overlap': 0.0}
+
+
+@dataclass
+class DatasetOptions:
+    """
+    Matching, search and output options of create_dataset() and create_batch_dataset().
+
+    Both functions also accept every field as a keyword argument, which
+    overrides the value of the options they are given:
+
+        options = DatasetOptions(matching='one_to_one', cache=StacSearchCache('cache.sqlite'))
+        create_dataset(bbox, '2016-01-01', options=options, quiet=True)
+
+    Attributes:
+        matching: Pairing strategy, 'nearest' or 'one_to_one' (default: 'nearest')
+        min_coverage: Drop scenes whose footprint covers less than this fraction
+            of the region before matching (default: 0.0)
+        min_overlap: Drop pairs whose footprints jointly cover less than this
+            fraction of the region (default: 0.0)
+        compact: Keep search results in SceneCatalog columns and load full STAC
+            items only when pairs are downloaded (default: False)
+        cache: StacSearchCache that stores search results on disk and only
+            searches dates missing from earlier runs (default: None)
+        shard_days: Split each sensor's date range into shards of this many days
+            that are searched in parallel, e.g. 365 (default: None)
+        max_workers: Maximum number of concurrent searches per sensor (default: 4)
+        metadata_format: 'json' (matched_pairs.json) or 'jsonl' (an indexed
+            pair_store.PairStore in matched_pairs.jsonl, which incremental
+            updates append to) (default: 'json')
+        report_path: Write a run report with per-stage timings (client init,
+            search pages, matching, metadata write) to this file, as JSON or,
+            for a .prom path, Prometheus text (default: None)
+        quiet: Silence the console output, e.g. in batch jobs (default: False)
+    """
+    matching: str = 'nearest'
+    min_coverage: float = 0.0
+    min_overlap: float = 0.0
+    compact: bool = False
+    cache: Optional[StacSearchCache] = None
+    shard_days: Optional[int] = None
+    max_workers: int = 4
+    metadata_format: str = 'json'
+    report_path: Optional[str] = None
+    quiet: bool = False
+
+    def __post_init__(self):
+        if self.metadata_format not in ('json', 'jsonl'):
+            raise ValueError(f"Unknown metadata_format '{self.metadata_format}'; expected 'json' or 'jsonl'")
+
 
 def get_planetary_computer_client() -> Client:
     """
@@ -26,11 +101,15 @@ def get_planetary_computer_client() -> Client:
     Returns:
         Client: STAC API client
     """
-    catalog = Client.open(
-        "https://planetarycomputer.microsoft.com/api/stac/v1",
-        modifier=pc.sign_inplace
-    )
-    print("Microsoft Planetary Computer client initialized successfully")
+    import planetary_computer as pc
+    from pystac_client import Client
+
+    with timings.span('client_init'):
+        catalog = Client.open(
+            "https://planetarycomputer.microsoft.com/api/stac/v1",
+            modifier=pc.sign_inplace
+        )
+    log("Microsoft Planetary Computer client initialized successfully")
     return catalog
 
 
@@ -62,11 +141,194 @@ def create_bbox_from_geometry(geometry: Dict) -> Tuple[float, float, float, floa
         raise ValueError(f"Unsupported geometry type: {geometry['type']}")
 
 
+def _s2_record(item: Item) -> Dict:
+    """Sentinel-2 metadata record for a STAC item."""
+    return {
+        'id': item.id,
+        'datetime': item.datetime.strftime('%Y-%m-%d %H:%M:%S'),
+        'date': item.datetime.strftime('%Y-%m-%d'),
+        'timestamp': int(item.datetime.timestamp() * 1000),
+        'cloud_cover': item.properties.get('eo:cloud_cover', MISSING_CLOUD_COVER),
+        'item': item
+    }
+
+
+def _s1_record(item: Item) -> Dict:
+    """Sentinel-1 metadata record for a STAC item."""
+    return {
+        'id': item.id,
+        'datetime': item.datetime.strftime('%Y-%m-%d %H:%M:%S'),
+        'date': item.datetime.strftime('%Y-%m-%d'),
+        'timestamp': int(item.datetime.timestamp() * 1000),
+        'orbit_direction': item.properties.get('sat:orbit_state', 'unknown'),
+        'item': item
+    }
+
+
+def _pair_record(s1_item: Dict, s2_item: Dict, time_diff: float) -> Dict:
+    """Matched pair record from Sentinel-1 and Sentinel-2 metadata records."""
+    return {
+        's1_id': s1_item['id'],
+        's1_date': s1_item['date'],
+        's1_datetime': s1_item['datetime'],
+        's1_timestamp': int(s1_item['timestamp']),
+        's1_orbit': s1_item['orbit_direction'],
+        's1_item': s1_item['item'],
+        's2_id': s2_item['id'],
+        's2_date': s2_item['date'],
+        's2_datetime': s2_item['datetime'],
+        's2_timestamp': int(s2_item['timestamp']),
+        's2_cloud_cover': float(s2_item['cloud_cover']),
+        's2_item': s2_item['item'],
+        'time_diff_days': time_diff
+    }
+
+
+def _pair_columns(items: Union[List[Dict], SceneCatalog], sensor: str, indices: np.ndarray) -> Dict[str, List]:
+    """
+    Pair record fields of one sensor for the matched scene positions.
+
+    SceneCatalog fields are gathered column by column, so no per-scene
+    record dict is built.
+    """
+    if isinstance(items, SceneCatalog):
+        datetimes = items.column('datetime')[indices]
+        columns = {
+            'id': items.ids[indices].tolist(),
+            'date': [value[:10] for value in datetimes],
+            'datetime': datetimes.tolist(),
+            'timestamp': items.timestamps[indices].tolist(),
+            'orbit': items.column('orbit_direction')[indices].tolist(),
+            'cloud_cover': items.cloud_cover[indices].astype(float).tolist(),
+            'item': [ItemRef(items, index) for index in indices.tolist()]
+        }
+    else:
+        records = [items[index] for index in indices.tolist()]
+        columns = {
+            'id': [record['id'] for record in records],
+            'date': [record['date'] for record in records],
+            'datetime': [record['datetime'] for record in records],
+            'timestamp': [int(record['timestamp']) for record in records],
+            'item': [record['item'] for record in records]
+        }
+        if sensor == 's1':
+            columns['orbit'] = [record['orbit_direction'] for record in records]
+        else:
+            columns['cloud_cover'] = [float(record['cloud_cover']) for record in records]
+
+    # Same fields and order as _pair_record()
+    keys = ('id', 'date', 'datetime', 'timestamp', 'orbit', 'item') if sensor == 's1' else \
+        ('id', 'date', 'datetime', 'timestamp', 'cloud_cover', 'item')
+    return {f'{sensor}_{key}': columns[key] for key in keys}
+
+
+def split_date_range(start_date: str,
+                     end_date: str,
+                     shard_days: int) -> List[Tuple[str, str]]:
+    """
+    Split an inclusive date range into consecutive shards of shard_days days.
+
+    Args:
+        start_date: Start date in 'YYYY-MM-DD' format
+        end_date: End date in 'YYYY-MM-DD' format (inclusive)
+        shard_days: Maximum number of days per shard
+
+    Returns:
+        List of (start_date, end_date) strings, in time order and non-overlapping
+    """
+    if shard_days < 1:
+        raise ValueError(f"shard_days must be at least 1, got {shard_days}")
+
+    start = date.fromisoformat(start_date)
+    end = date.fromisoformat(end_date)
+
+    shards = []
+    while start <= end:
+        shard_end = min(start + timedelta(days=shard_days - 1), end)
+        shards.append((start.isoformat(), shard_end.isoformat()))
+        start = shard_end + timedelta(days=1)
+    return shards
+
+
+def _run_search(catalog: Client,
+                collection: str,
+                bbox: Tuple[float, float, float, float],
+                start_date: str,
+                end_date: str,
+                query: Optional[Dict] = None,
+                as_catalog: bool = False,
+                cache: Optional[StacSearchCache] = None,
+                shard_days: Optional[int] = None,
+                max_workers: int = 4) -> Union[List[Item], SceneCatalog]:
+    """
+    Run a STAC search, optionally through the on-disk cache and split into
+    date shards that are searched in parallel.
+
+    Args:
+        catalog: STAC client
+        collection: STAC collection id
+        bbox: Bounding box (min_lon, min_lat, max_lon, max_lat)
+        start_date: Start date in 'YYYY-MM-DD' format
+        end_date: End date in 'YYYY-MM-DD' format
+        query: STAC query extension filter (default: None)
+        as_catalog: Return a SceneCatalog instead of pystac Items (default: False)
+        cache: StacSearchCache to reuse earlier results from (default: None)
+        shard_days: Split the date range into shards of this many days (default: None)
+        max_workers: Maximum number of shards searched at the same time (default: 4)
+
+    Returns:
+        List of signed pystac Items, or a SceneCatalog
+    """
+    import planetary_computer as pc
+    from pystac import Item
+
+    if shard_days:
+        shards = split_date_range(start_date, end_date, shard_days)
+        if len(shards) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                results = list(pool.map(
+                    lambda shard: _run_search(catalog, collection, bbox, shard[0], shard[1],
+                                              query, as_catalog, cache),
+                    shards
+                ))
+            # pool.map keeps shard order, so results stay in date order
+            if as_catalog:
+                return SceneCatalog.concatenate(results)
+            return [item for shard_items in results for item in shard_items]
+
+    if cache is not None:
+        # Cached hrefs carry no SAS token; only sign when full items are needed
+        item_dicts = cache.search(catalog, collection, bbox, start_date, end_date, query,
+                                  modifier=None if as_catalog else pc.sign_inplace)
+        if as_catalog:
+            return SceneCatalog.from_item_dicts(collection, item_dicts, client=catalog)
+        return [Item.from_dict(item, preserve_dict=False) for item in item_dicts]
+
+    search = catalog.search(
+        collections=[collection],
+        bbox=bbox,
+        datetime=f"{start_date}/{end_date}",
+        query=query
+    )
+
+    # Pages are requested lazily, so each one is timed as it is fetched
+    item_dicts = (feature for page in timed_pages(search.pages_as_dicts(), collection=collection)
+                  for feature in page.get('features', []))
+    if as_catalog:
+        return SceneCatalog.from_item_dicts(collection, item_dicts, client=catalog)
+    # The client's modifier has already signed the pages
+    return [Item.from_dict(item, preserve_dict=False) for item in item_dicts]
+
+
 def search_sentinel2(catalog: Client,
                      bbox: Tuple[float, float, float, float],
                      start_date: str = '2016-01-01',
                      end_date: Optional[str] = None,
-                     cloud_percentage: float = 5.0) -> List[Dict]:
+                     cloud_percentage: float = 5.0,
+                     as_catalog: bool = False,
+                     cache: Optional[StacSearchCache] = None,
+                     shard_days: Optional[int] = None,
+                     max_workers: int = 4) -> Union[List[Dict], SceneCatalog]:
     """
     Search Sentinel-2 imagery using Microsoft Planetary Computer.
 
@@ -76,47 +338,50 @@ def search_sentinel2(catalog: Client,
         start_date: Start date in 'YYYY-MM-DD' format
         end_date: End date in 'YYYY-MM-DD' format (default: today)
         cloud_percentage: Maximum cloud coverage percentage (default: 5.0)
+        as_catalog: Return a compact SceneCatalog instead of a list of dicts
+            holding full pystac Items (default: False)
+        cache: StacSearchCache used to search only dates not cached yet (default: None)
+        shard_days: Split the date range into shards of this many days that are
+            searched in parallel (default: None - a single search)
+        max_workers: Maximum number of shards searched at the same time (default: 4)
 
     Returns:
-        List of Sentinel-2 items with metadata
+        List of Sentinel-2 items with metadata, or a SceneCatalog
     """
     if end_date is None:
         end_date = datetime.now().strftime('%Y-%m-%d')
 
-    print(f"\nSearching Sentinel-2 imagery...")
-    print(f"  Date range: {start_date} to {end_date}")
-    print(f"  Cloud coverage: <{cloud_percentage}%")
+    log(f"\nSearching Sentinel-2 imagery...")
+    log(f"  Date range: {start_date} to {end_date}")
+    log(f"  Cloud coverage: <{cloud_percentage}%")
 
-    search = catalog.search(
-        collections=["sentinel-2-l2a"],
-        bbox=bbox,
-        datetime=f"{start_date}/{end_date}",
+    items = _run_search(
+        catalog, "sentinel-2-l2a", bbox, start_date, end_date,
         query={
             "eo:cloud_cover": {"lt": cloud_percentage}
-        }
+        },
+        as_catalog=as_catalog,
+        cache=cache,
+        shard_days=shard_days,
+        max_workers=max_workers
     )
+    log(f"  Found {len(items)} Sentinel-2 scenes")
 
-    items = list(search.items())
-    print(f"  Found {len(items)} Sentinel-2 scenes")
-
-    return [
-        {
-            'id': item.id,
-            'datetime': item.datetime.strftime('%Y-%m-%d %H:%M:%S'),
-            'date': item.datetime.strftime('%Y-%m-%d'),
-            'timestamp': int(item.datetime.timestamp() * 1000),
-            'cloud_cover': item.properties.get('eo:cloud_cover', 0),
-            'item': item
-        }
-        for item in items
-    ]
+    if as_catalog:
+        return items
+
+    return [_s2_record(item) for item in items]
 
 
 def search_sentinel1(catalog: Client,
                      bbox: Tuple[float, float, float, float],
                      start_date: str = '2016-01-01',
                      end_date: Optional[str] = None,
-                     orbit_direction: Optional[str] = None) -> List[Dict]:
+                     orbit_direction: Optional[str] = None,
+                     as_catalog: bool = False,
+                     cache: Optional[StacSearchCache] = None,
+                     shard_days: Optional[int] = None,
+                     max_workers: int = 4) -> Union[List[Dict], SceneCatalog]:
     """
     Search Sentinel-1 SAR imagery using Microsoft Planetary Computer.
 
@@ -126,118 +391,369 @@ def search_sentinel1(catalog: Client,
         start_date: Start date in 'YYYY-MM-DD' format
         end_date: End date in 'YYYY-MM-DD' format (default: today)
         orbit_direction: Orbit direction ('ascending' or 'descending') (default: None - both)
+        as_catalog: Return a compact SceneCatalog instead of a list of dicts
+            holding full pystac Items (default: False)
+        cache: StacSearchCache used to search only dates not cached yet (default: None)
+        shard_days: Split the date range into shards of this many days that are
+            searched in parallel (default: None - a single search)
+        max_workers: Maximum number of shards searched at the same time (default: 4)
 
     Returns:
-        List of Sentinel-1 items with metadata
+        List of Sentinel-1 items with metadata, or a SceneCatalog
     """
     if end_date is None:
         end_date = datetime.now().strftime('%Y-%m-%d')
 
-    print(f"\nSearching Sentinel-1 imagery...")
-    print(f"  Date range: {start_date} to {end_date}")
-    print(f"  Orbit direction: {orbit_direction or 'Both'}")
+    log(f"\nSearching Sentinel-1 imagery...")
+    log(f"  Date range: {start_date} to {end_date}")
+    log(f"  Orbit direction: {orbit_direction or 'Both'}")
 
     query_params = {}
     if orbit_direction:
         query_params["sat:orbit_state"] = {"eq": orbit_direction.lower()}
 
-    search = catalog.search(
-        collections=["sentinel-1-rtc"],
-        bbox=bbox,
-        datetime=f"{start_date}/{end_date}",
-        query=query_params if query_params else None
+    items = _run_search(
+        catalog, "sentinel-1-rtc", bbox, start_date, end_date,
+        query=query_params if query_params else None,
+        as_catalog=as_catalog,
+        cache=cache,
+        shard_days=shard_days,
+        max_workers=max_workers
     )
+    log(f"  Found {len(items)} Sentinel-1 scenes")
 
-    items = list(search.items())
-    print(f"  Found {len(items)} Sentinel-1 scenes")
-
-    return [
-        {
-            'id': item.id,
-            'datetime': item.datetime.strftime('%Y-%m-%d %H:%M:%S'),
-            'date': item.datetime.strftime('%Y-%m-%d'),
-            'timestamp': int(item.datetime.timestamp() * 1000),
-            'orbit_direction': item.properties.get('sat:orbit_state', 'unknown'),
-            'item': item
-        }
-        for item in items
-    ]
+    if as_catalog:
+        return items
 
+    return [_s1_record(item) for item in items]
 
-def match_temporal_pairs(s1_items: List[Dict],
-                        s2_items: List[Dict],
-                        max_time_diff_days: int = 3) -> List[Dict]:
+
+def match_temporal_pairs(s1_items: Union[List[Dict], SceneCatalog],
+                        s2_items: Union[List[Dict], SceneCatalog],
+                        max_time_diff_days: int = 3,
+                        matching: str = 'nearest',
+                        top_k: Optional[int] = None) -> Union[List[Dict], pd.DataFrame]:
     """
     Match Sentinel-1 and Sentinel-2 images that are within max_time_diff_days.
 
     Args:
-        s1_items: List of Sentinel-1 item metadata
-        s2_items: List of Sentinel-2 item metadata
+        s1_items: List of Sentinel-1 item metadata or a SceneCatalog
+        s2_items: List of Sentinel-2 item metadata or a SceneCatalog
         max_time_diff_days: Maximum time difference in days (default: 3)
+        matching: Pairing strategy (default: 'nearest')
+            - 'nearest': closest Sentinel-1 image for every Sentinel-2 image;
+              one Sentinel-1 image may appear in several pairs
+            - 'one_to_one': every image is used at most once, maximizing the
+              number of pairs and minimizing the total time difference
+        top_k: Return up to top_k closest Sentinel-1 candidates per Sentinel-2
+            image as a DataFrame instead of a list of pairs (default: None).
+            Only supported with matching='nearest'.
 
     Returns:
-        List of matched image pairs with metadata
+        List of matched image pairs with metadata, or a DataFrame with one row
+        per candidate when top_k is set. The 's1_position'/'s2_position'
+        columns index back into the input lists.
     """
+    if top_k is not None and matching != 'nearest':
+        raise ValueError("top_k candidates are only supported with matching='nearest'")
+
     if not s1_items or not s2_items:
-        print("Warning: One or both collections are empty")
-        return []
-
-    print(f"\nMatching temporal pairs (max {max_time_diff_days} days apart)...")
-
-    # Convert to pandas DataFrames
-    s1_df = pd.DataFrame(s1_items)
-    s2_df = pd.DataFrame(s2_items)
-
-    s1_df['datetime_obj'] = pd.to_datetime(s1_df['datetime'])
-    s2_df['datetime_obj'] = pd.to_datetime(s2_df['datetime'])
-
-    # Sort by datetime
-    s1_df = s1_df.sort_values('datetime_obj').reset_index(drop=True)
-    s2_df = s2_df.sort_values('datetime_obj').reset_index(drop=True)
-
-    matched_pairs = []
-
-    # For each Sentinel-2 image, find the closest Sentinel-1 image
-    for idx, s2_row in s2_df.iterrows():
-        s2_time = s2_row['datetime_obj']
-
-        # Calculate time differences in days
-        s1_df['time_diff'] = abs((s1_df['datetime_obj'] - s2_time).dt.total_seconds() / 86400)
-
-        # Find images within the time threshold
-        valid_matches = s1_df[s1_df['time_diff'] <= max_time_diff_days]
-
-        if not valid_matches.empty:
-            # Get the closest match
-            closest_match = valid_matches.loc[valid_matches['time_diff'].idxmin()]
-
-            matched_pairs.append({
-                's1_id': closest_match['id'],
-                's1_date': closest_match['date'],
-                's1_datetime': closest_match['datetime'],
-                's1_timestamp': int(closest_match['timestamp']),
-                's1_orbit': closest_match['orbit_direction'],
-                's1_item': closest_match['item'],
-                's2_id': s2_row['id'],
-                's2_date': s2_row['date'],
-                's2_datetime': s2_row['datetime'],
-                's2_timestamp': int(s2_row['timestamp']),
-                's2_cloud_cover': float(s2_row['cloud_cover']),
-                's2_item': s2_row['item'],
-                'time_diff_days': float(closest_match['time_diff'])
-            })
+        log("Warning: One or both collections are empty")
+        if top_k is None:
+            return []
+
+    log(f"\nMatching temporal pairs (max {max_time_diff_days} days apart)...")
+    start = time.perf_counter()
+
+    # Item datetimes are compared at whole-second resolution
+    s1_times = timestamps_from_records(s1_items, resolution_ms=1000)
+    s2_times = timestamps_from_records(s2_items, resolution_ms=1000)
+
+    if top_k is not None:
+        s2_indices, s1_indices, time_diffs, ranks = topk_matches(
+            s1_times, s2_times, max_time_diff_days, top_k
+        )
+        candidates = candidates_frame(
+            s1_items, s2_items, s2_indices, s1_indices, time_diffs, ranks,
+            s1_columns={'s1_id': 'id', 's1_datetime': 'datetime',
+                        's1_timestamp': 'timestamp', 's1_orbit': 'orbit_direction'},
+            s2_columns={'s2_id': 'id', 's2_datetime': 'datetime',
+                        's2_timestamp': 'timestamp', 's2_cloud_cover': 'cloud_cover'}
+        )
+        timings.record('matching', time.perf_counter() - start,
+                       items=len(s1_times) + len(s2_times), pairs=len(candidates))
+        log(f"  Found {len(candidates)} candidates for "
+            f"{candidates['s2_position'].nunique()} Sentinel-2 scenes")
+        return candidates
+
+    s2_indices, s1_indices, time_diffs = match_indices(
+        s1_times, s2_times, max_time_diff_days, matching
+    )
 
-    print(f"  Found {len(matched_pairs)} matched pairs")
+    if isinstance(s1_items, SceneCatalog) or isinstance(s2_items, SceneCatalog):
+        columns = _pair_columns(s1_items, 's1', s1_indices)
+        columns.update(_pair_columns(s2_items, 's2', s2_indices))
+        columns['time_diff_days'] = time_diffs.tolist()
+        matched_pairs = [dict(zip(columns, values)) for values in zip(*columns.values())]
+    else:
+        matched_pairs = [
+            _pair_record(s1_items[s1_idx], s2_items[s2_idx], time_diff)
+            for s2_idx, s1_idx, time_diff in zip(s2_indices.tolist(), s1_indices.tolist(), time_diffs.tolist())
+        ]
+
+    timings.record('matching', time.perf_counter() - start,
+                   items=len(s1_times) + len(s2_times), pairs=len(matched_pairs))
+    log(f"  Found {len(matched_pairs)} matched pairs")
     return matched_pairs
 
 
+def iter_search_pages(catalog: Client,
+                      collection: str,
+                      bbox: Tuple[float, float, float, float],
+                      start_date: str,
+                      end_date: str,
+                      query: Optional[Dict] = None,
+                      page_size: int = 100) -> Iterator[List[Item]]:
+    """
+    Search a collection and yield results page by page in ascending time order.
+
+    Unlike list(search.items()), nothing is buffered beyond the current page.
+
+    Args:
+        catalog: STAC client
+        collection: STAC collection id
+        bbox: Bounding box (min_lon, min_lat, max_lon, max_lat)
+        start_date: Start date in 'YYYY-MM-DD' format
+        end_date: End date in 'YYYY-MM-DD' format
+        query: STAC query extension filter (default: None)
+        page_size: Items requested per page (default: 100)
+
+    Yields:
+        List of pystac Items for each page, sorted by datetime
+    """
+    from pystac import Item
+
+    search = catalog.search(
+        collections=[collection],
+        bbox=bbox,
+        datetime=f"{start_date}/{end_date}",
+        query=query,
+        sortby=[{"field": "datetime", "direction": "asc"}],
+        limit=page_size
+    )
+
+    for page in timed_pages(search.pages_as_dicts(), collection=collection):
+        items = [Item.from_dict(feature, preserve_dict=False) for feature in page.get('features', [])]
+        yield sorted(items, key=lambda item: item.datetime)
+
+
+def _prefetch(pages: Iterator, out: queue.Queue, stop: threading.Event):
+    """Push pages into a bounded queue from a background thread, ending with None."""
+    def put(value):
+        while not stop.is_set():
+            try:
+                out.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        for page in pages:
+            if not put(page):
+                return
+    except Exception as e:
+        put(e)
+        return
+    put(None)
+
+
+def stream_matched_pairs(catalog: Client,
+                         bbox: Tuple[float, float, float, float],
+                         start_date: str = '2016-01-01',
+                         end_date: Optional[str] = None,
+                         cloud_percentage: float = 5.0,
+                         max_time_diff_days: int = 3,
+                         orbit_direction: Optional[str] = None,
+                         page_size: int = 100,
+                         prefetch_pages: int = 2) -> Iterator[Dict]:
+    """
+    Search both sensors page by page and yield matched pairs as soon as they are final.
+
+    Each sensor's pages are fetched by a background thread into a queue holding
+    at most prefetch_pages pages, so network fetching overlaps with matching.
+    A Sentinel-2 scene is paired once the Sentinel-1 stream has passed its
+    timestamp plus max_time_diff_days. Pairs are identical to
+    match_temporal_pairs(..., matching='nearest'), but the first ones arrive
+    after a single page and memory stays bounded on decade-long queries.
+
+    Args:
+        catalog: STAC client
+        bbox: Bounding box (min_lon, min_lat, max_lon, max_lat)
+        start_date: Start date in 'YYYY-MM-DD' format (default: '2016-01-01')
+        end_date: End date in 'YYYY-MM-DD' format (default: today)
+        cloud_percentage: Maximum cloud coverage for Sentinel-2 (default: 5.0)
+        max_time_diff_days: Maximum time difference for pairing (default: 3 days)
+        orbit_direction: Sentinel-1 orbit ('ascending'/'descending'/None)
+        page_size: Items requested per page (default: 100)
+        prefetch_pages: Pages buffered ahead per sensor (default: 2)
+
+    Yields:
+        Matched pair dictionaries, in Sentinel-2 time order
+    """
+    if end_date is None:
+        end_date = datetime.now().strftime('%Y-%m-%d')
+
+    s1_query = {"sat:orbit_state": {"eq": orbit_direction.lower()}} if orbit_direction else None
+    s2_query = {"eo:cloud_cover": {"lt": cloud_percentage}}
+
+    stop = threading.Event()
+    streams = {}
+    for sensor, collection, query in (('s1', "sentinel-1-rtc", s1_query),
+                                      ('s2', "sentinel-2-l2a", s2_query)):
+        pages = iter_search_pages(catalog, collection, bbox, start_date, end_date, query, page_size)
+        out = queue.Queue(maxsize=prefetch_pages)
+        threading.Thread(target=_prefetch, args=(pages, out, stop), daemon=True).start()
+        streams[sensor] = out
+
+    matcher = StreamingMatcher(max_time_diff_days)
+    latest = {'s1': None, 's2': None}
+    exhausted = {'s1': False, 's2': False}
+    pairs_found = 0
+
+    log(f"\nStreaming matched pairs (max {max_time_diff_days} days apart)...")
+
+    try:
+        while not (exhausted['s1'] and exhausted['s2']) and not matcher.done:
+            # Advance whichever stream is behind so both watermarks move together
+            if exhausted['s1'] or (not exhausted['s2'] and
+                                   (latest['s2'] is None or
+                                    (latest['s1'] is not None and latest['s2'] <= latest['s1']))):
+                sensor = 's2'
+            else:
+                sensor = 's1'
+
+            page = streams[sensor].get()
+            if isinstance(page, Exception):
+                raise page
+
+            if page is None:
+                exhausted[sensor] = True
+                pairs = matcher.finish_s1() if sensor == 's1' else matcher.finish_s2()
+            else:
+                records = [_s1_record(item) if sensor == 's1' else _s2_record(item) for item in page]
+                # Item datetimes are compared at whole-second resolution
+                times = [record['timestamp'] // 1000 * 1000 for record in records]
+                if times:
+                    latest[sensor] = times[-1]
+                if sensor == 's1':
+                    pairs = matcher.add_s1(times, records)
+                else:
+                    pairs = matcher.add_s2(times, records)
+
+            for s1_record, s2_record, time_diff in pairs:
+                pairs_found += 1
+                yield _pair_record(s1_record, s2_record, time_diff)
+    finally:
+        stop.set()
+
+    log(f"  Streamed {pairs_found} matched pairs")
+
+
+def filter_items_by_coverage(items: Union[List[Dict], SceneCatalog],
+                             bbox: Tuple[float, float, float, float],
+                             min_coverage: float = 0.0) -> Union[List[Dict], SceneCatalog]:
+    """
+    Annotate items with the fraction of the bbox their footprint covers and
+    drop those below min_coverage.
+
+    Args:
+        items: Item metadata from search_sentinel1() or search_sentinel2()
+        bbox: Bounding box (min_lon, min_lat, max_lon, max_lat)
+        min_coverage: Minimum fraction of the bbox covered by the footprint (default: 0.0)
+
+    Returns:
+        Items with a 'roi_coverage' entry, filtered by min_coverage; with
+        min_coverage 0 nothing can be dropped and items are returned as is
+    """
+    from spatial_matching import footprints_from_items, roi_coverage
+
+    if not items or min_coverage <= 0:
+        return items
+
+    if isinstance(items, SceneCatalog):
+        items.roi_coverage = roi_coverage(items.footprints, bbox).astype(np.float32)
+        keep = items.roi_coverage >= min_coverage
+        if not keep.all():
+            log(f"  Dropped {int((~keep).sum())} scenes covering <{min_coverage:.0%} of the bbox")
+            items = items.subset(keep)
+        return items
+
+    coverage = roi_coverage(footprints_from_items([item['item'] for item in items]), bbox)
+
+    kept = []
+    for item, fraction in zip(items, coverage.tolist()):
+        item['roi_coverage'] = fraction
+        if fraction >= min_coverage:
+            kept.append(item)
+
+    if len(kept) < len(items):
+        log(f"  Dropped {len(items) - len(kept)} scenes covering <{min_coverage:.0%} of the bbox")
+
+    return kept
+
+
+def filter_pairs_by_overlap(matched_pairs: List[Dict],
+                            bbox: Tuple[float, float, float, float],
+                            min_overlap: float = 0.0) -> List[Dict]:
+    """
+    Annotate pairs with the fraction of the bbox covered by both footprints
+    and drop those below min_overlap.
+
+    Args:
+        matched_pairs: List of matched pairs from match_temporal_pairs()
+        bbox: Bounding box (min_lon, min_lat, max_lon, max_lat)
+        min_overlap: Minimum fraction of the bbox covered by both scenes (default: 0.0)
+
+    Returns:
+        List of pairs with an 'overlap' entry, filtered by min_overlap; with
+        min_overlap 0 nothing can be dropped and pairs are returned as is
+    """
+    from spatial_matching import footprints_from_items, pair_overlap
+
+    if not matched_pairs or min_overlap <= 0:
+        return matched_pairs
+
+    overlap = pair_overlap(
+        footprints_from_items([pair['s1_item'] for pair in matched_pairs]),
+        footprints_from_items([pair['s2_item'] for pair in matched_pairs]),
+        bbox
+    )
+
+    kept = []
+    for pair, fraction in zip(matched_pairs, overlap.tolist()):
+        pair['overlap'] = fraction
+        if fraction >= min_overlap:
+            kept.append(pair)
+
+    if len(kept) < len(matched_pairs):
+        log(f"  Dropped {len(matched_pairs) - len(kept)} pairs overlapping <{min_overlap:.0%} of the bbox")
+
+    return kept
+
+
 def create_dataset(bbox: Tuple[float, float, float, float],
                   start_date: str = '2016-01-01',
                   end_date: Optional[str] = None,
                   cloud_percentage: float = 5.0,
                   max_time_diff_days: int = 3,
                   output_dir: str = './sentinel_dataset_mpc',
-                  orbit_direction: Optional[str] = None) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+                  orbit_direction: Optional[str] = None,
+                  options: Optional[DatasetOptions] = None,
+                  incremental: bool = False,
+                  **overrides) -> Tuple[Union[List[Dict], SceneCatalog],
+                                                Union[List[Dict], SceneCatalog],
+                                                List[Dict]]:
     """
     Create a temporally-aligned dataset of Sentinel-1 and Sentinel-2 images
     using Microsoft Planetary Computer.
@@ -250,196 +766,1026 @@ def create_dataset(bbox: Tuple[float, float, float, float],
         max_time_diff_days: Maximum time difference for pairing (default: 3 days)
         output_dir: Directory to save dataset metadata (default: './sentinel_dataset_mpc')
         orbit_direction: Sentinel-1 orbit ('ascending'/'descending'/None)
+        options: Matching, search and output options (default: DatasetOptions())
+        incremental: Update the dataset already in output_dir instead of
+            rebuilding it: only scenes from 2 * max_time_diff_days before its
+            end_date onwards are searched, pairs whose S2 scene lies within
+            max_time_diff_days of that end are rematched and all earlier pairs
+            are kept as they are, which gives the same pairs as a rebuild for
+            'nearest' matching ('one_to_one' keeps its earlier assignment and
+            may differ slightly). Without an existing dataset a full run is
+            done (default: False)
+        **overrides: DatasetOptions fields, e.g. matching='one_to_one' or
+            report_path='report.json', overriding those of options
 
     Returns:
-        Tuple of (s1_items, s2_items, matched_pairs)
-    """
-    print("=" * 80)
-    print("CREATING SENTINEL-1 & SENTINEL-2 TEMPORAL DATASET")
-    print("Using Microsoft Planetary Computer")
-    print("=" * 80)
-    print(f"Bounding Box: {bbox}")
-    print(f"Start Date: {start_date}")
-    print(f"End Date: {end_date or 'today'}")
-    print(f"Cloud Coverage Threshold: {cloud_percentage}%")
-    print(f"Max Temporal Difference: {max_time_diff_days} days")
-    print(f"Sentinel-1 Orbit: {orbit_direction or 'Both'}")
-    print("-" * 80)
-
-    # Initialize catalog
-    catalog = get_planetary_computer_client()
-
-    # Search Sentinel-2
-    s2_items = search_sentinel2(
-        catalog, bbox, start_date, end_date, cloud_percentage
-    )
+        Tuple of (s1_items, s2_items, matched_pairs). In an incremental update
+        the items are those of the searched window and matched_pairs holds
+        only the new or rematched pairs; the metadata file holds all pairs.
+    """
+    options = replace(options or DatasetOptions(), **overrides)
+    matching, min_coverage, min_overlap = options.matching, options.min_coverage, options.min_overlap
+    settings = {
+        'bbox': bbox,
+        'start_date': start_date,
+        'end_date': end_date or datetime.now().strftime('%Y-%m-%d'),
+        'cloud_percentage_threshold': cloud_percentage,
+        'max_time_diff_days': max_time_diff_days,
+        'orbit_direction': orbit_direction,
+        'matching': matching,
+        'min_coverage': min_coverage,
+        'min_overlap': min_overlap
+    }
 
-    # Search Sentinel-1
-    s1_items = search_sentinel1(
-        catalog, bbox, start_date, end_date, orbit_direction
-    )
+    with reporting('create_dataset', options.report_path, options.quiet) as run:
+        update = None
+        if incremental:
+            with timings.span('metadata_read') as span:
+                update = _incremental_window(output_dir, settings, options.metadata_format)
+                if update is not None:
+                    span['file_bytes'] = os.path.getsize(update['source'])
+
+        log("=" * 80)
+        log("CREATING SENTINEL-1 & SENTINEL-2 TEMPORAL DATASET")
+        log("Using Microsoft Planetary Computer")
+        log("=" * 80)
+        log(f"Bounding Box: {bbox}")
+        log(f"Start Date: {start_date}")
+        log(f"End Date: {end_date or 'today'}")
+        log(f"Cloud Coverage Threshold: {cloud_percentage}%")
+        log(f"Max Temporal Difference: {max_time_diff_days} days")
+        log(f"Sentinel-1 Orbit: {orbit_direction or 'Both'}")
+        log(f"Matching: {matching}")
+        log(f"Min Footprint Coverage: {min_coverage:.0%} (pair overlap: {min_overlap:.0%})")
+        if update is not None:
+            log(f"Incremental update of {update['source']}: searching from {update['search_start']}")
+        log("-" * 80)
+
+        search_start = update['search_start'] if update is not None else start_date
+        if search_start > settings['end_date']:
+            log("\nDataset is already up to date")
+            run['new_pairs'] = 0
+            if update is not None:
+                run['metadata_file'] = update['source']
+            return [], [], []
+
+        # Initialize catalog
+        catalog = get_planetary_computer_client()
+
+        # Search Sentinel-2 and Sentinel-1 concurrently
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            s2_future = pool.submit(
+                search_sentinel2, catalog, bbox, search_start, end_date, cloud_percentage,
+                **_search_kwargs(options)
+            )
+            s1_future = pool.submit(
+                search_sentinel1, catalog, bbox, search_start, end_date, orbit_direction,
+                **_search_kwargs(options)
+            )
+            s2_items = s2_future.result()
+            s1_items = s1_future.result()
+        run.update(s1_scenes_found=len(s1_items), s2_scenes_found=len(s2_items))
+
+        if update is not None:
+            # Only S2 scenes near or after the previous end are (re)matched; the
+            # earlier S1 scenes of the window are searched as their candidates
+            s2_items = _items_subset(s2_items, np.flatnonzero(
+                timestamps_from_records(s2_items) >= update['boundary_ms']))
+            if matching == 'one_to_one':
+                used = update['used_s1_ids']
+                s1_ids = s1_items.ids if isinstance(s1_items, SceneCatalog) else [item['id'] for item in s1_items]
+                s1_items = _items_subset(s1_items, np.flatnonzero(
+                    [item_id not in used for item_id in s1_ids]))
+
+        s1_items, s2_items, matched_pairs = _pair_region(
+            s1_items, s2_items, bbox, max_time_diff_days, matching, min_coverage, min_overlap
+        )
+
+        if update is None:
+            if not s1_items or not s2_items:
+                log("\nWarning: No images found in one or both collections!")
+                return s1_items, s2_items, []
+            s1_count, s2_count = len(s1_items), len(s2_items)
+        else:
+            previous = update['previous']
+            # Scenes up to the previous end were counted by earlier runs
+            s1_count = previous['total_s1_images'] + int(
+                (timestamps_from_records(s1_items) >= update['covered_ms']).sum())
+            s2_count = previous['total_s2_images'] + int(
+                (timestamps_from_records(s2_items) >= update['covered_ms']).sum())
+
+        if update is not None and update['store'] is not None:
+            # Rematched pairs are at the end of the store; earlier lines stay untouched
+            store = update['store']
+            with timings.span('metadata_write', pairs=len(matched_pairs)) as span:
+                store.truncate(update['boundary_ms'])
+                store.append(_pair_metadata(pair) for pair in matched_pairs)
+                store.update_metadata(dict(settings, total_s1_images=s1_count, total_s2_images=s2_count))
+                span['file_bytes'] = os.path.getsize(store.path)
+            metadata_file, total_pairs = store.path, len(store)
+        else:
+            all_pairs = matched_pairs if update is None else update['kept_pairs'] + matched_pairs
+            metadata_file = _save_metadata(output_dir, all_pairs, s1_count, s2_count, settings,
+                                           options.metadata_format)
+            total_pairs = len(all_pairs)
+        run.update(total_s1_images=s1_count, total_s2_images=s2_count, matched_pairs=total_pairs,
+                   new_pairs=len(matched_pairs), metadata_file=metadata_file)
+
+        log(f"\n{'=' * 80}")
+        log("DATASET SUMMARY")
+        log(f"{'=' * 80}")
+        log(f"Total Sentinel-1 images: {s1_count}")
+        log(f"Total Sentinel-2 images: {s2_count}")
+        log(f"Matched pairs: {total_pairs}")
+        if update is not None:
+            log(f"New or rematched pairs: {len(matched_pairs)}")
+        log(f"\nMetadata saved to: {metadata_file}")
+        log(f"{'=' * 80}\n")
+
+        return s1_items, s2_items, matched_pairs
+
+
+def _search_kwargs(options: DatasetOptions) -> Dict:
+    """Keyword arguments of search_sentinel1()/search_sentinel2() set by options."""
+    return {'as_catalog': options.compact, 'cache': options.cache,
+            'shard_days': options.shard_days, 'max_workers': options.max_workers}
+
+
+def _incremental_window(output_dir: str, settings: Dict, metadata_format: str) -> Optional[Dict]:
+    """
+    Plan an incremental update of an existing dataset.
+
+    S2 scenes taken less than max_time_diff_days before the end of the
+    previous run may gain a closer S1 partner from new scenes, so their pairs
+    are dropped and rematched; their candidates reach back another
+    max_time_diff_days, which is where the new search starts. Pairs before
+    that boundary can no longer change.
+
+    A PairStore in the requested 'jsonl' format is updated in place and only
+    its pairs with S1 scenes inside the searched window are read. Otherwise
+    the earlier pairs are loaded (from either format) and rewritten.
+    """
+    json_file = os.path.join(output_dir, JSON_NAME)
+    store_file = os.path.join(output_dir, STORE_NAME)
+    sources = [store_file, json_file] if metadata_format == 'jsonl' else [json_file, store_file]
+    sources = [path for path in sources
+               if os.path.exists(index_path(path) if path == store_file else path)]
+    if not sources:
+        return None
+
+    metadata_file = sources[0]
+    store = PairStore(store_file) if metadata_file == store_file else None
+    if store is not None:
+        previous = store.metadata
+    else:
+        with open(json_file) as f:
+            previous = json.load(f)
+    # Datasets written before these options were saved used the defaults
+    for key, value in LEGACY_SETTINGS.items():
+        previous.setdefault(key, value)
+
+    changed = [key for key, value in settings.items()
+               if key != 'end_date' and json.loads(json.dumps(value)) != previous.get(key)]
+    if changed:
+        raise ValueError(f"{metadata_file} was created with different {', '.join(changed)}; "
+                         f"rerun without incremental to rebuild it")
+
+    window = timedelta(days=settings['max_time_diff_days'])
+    # Searches include the whole end date
+    covered = datetime.strptime(previous['end_date'], '%Y-%m-%d') + timedelta(days=1)
+    boundary = covered - window
+    search_start = max(boundary - window, datetime.strptime(settings['start_date'], '%Y-%m-%d'))
+    boundary_ms = int(boundary.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    search_start = search_start.strftime('%Y-%m-%d')
+
+    if store is not None and metadata_format == 'jsonl':
+        kept_pairs = None
+        window_pairs = store.query(start_date=search_start, sensor='s1')
+    else:
+        if store is not None:
+            previous['matched_pairs'] = store.load()
+        kept_pairs = [pair for pair in previous.pop('matched_pairs')
+                      if pair['s2_timestamp'] < boundary_ms]
+        store = None
+        window_pairs = kept_pairs
+
+    return {
+        'source': metadata_file,
+        'previous': previous,
+        'search_start': search_start,
+        'boundary_ms': boundary_ms,
+        'covered_ms': int(covered.replace(tzinfo=timezone.utc).timestamp() * 1000),
+        'store': store,
+        'kept_pairs': kept_pairs,
+        # S1 scenes already paired before the boundary (for one_to_one matching)
+        'used_s1_ids': {pair['s1_id'] for pair in window_pairs if pair['s2_timestamp'] < boundary_ms}
+    }
+
+
+def _pair_region(s1_items: Union[List[Dict], SceneCatalog],
+                 s2_items: Union[List[Dict], SceneCatalog],
+                 region,
+                 max_time_diff_days: int,
+                 matching: str,
+                 min_coverage: float,
+                 min_overlap: float) -> Tuple:
+    """Coverage filter, temporal matching and overlap filter for one region."""
+    # Drop scenes that only touch a corner of the region before matching
+    s2_items = filter_items_by_coverage(s2_items, region, min_coverage)
+    s1_items = filter_items_by_coverage(s1_items, region, min_coverage)
 
     if not s1_items or not s2_items:
-        print("\nWarning: No images found in one or both collections!")
         return s1_items, s2_items, []
 
-    # Match temporal pairs
-    matched_pairs = match_temporal_pairs(s1_items, s2_items, max_time_diff_days)
+    matched_pairs = match_temporal_pairs(s1_items, s2_items, max_time_diff_days, matching)
+    matched_pairs = filter_pairs_by_overlap(matched_pairs, region, min_overlap)
+    return s1_items, s2_items, matched_pairs
+
 
-    # Save metadata
+def _pair_metadata(pair: Dict) -> Dict:
+    """Pair record as saved to disk (without STAC item objects)."""
+    return {
+        's1_id': pair['s1_id'],
+        's1_date': pair['s1_date'],
+        's1_datetime': pair['s1_datetime'],
+        's1_timestamp': pair['s1_timestamp'],
+        's1_orbit': pair['s1_orbit'],
+        's2_id': pair['s2_id'],
+        's2_date': pair['s2_date'],
+        's2_datetime': pair['s2_datetime'],
+        's2_timestamp': pair['s2_timestamp'],
+        's2_cloud_cover': pair['s2_cloud_cover'],
+        'time_diff_days': pair['time_diff_days'],
+        # Only measured when min_overlap is set; streamed pairs never have it
+        'overlap': pair.get('overlap')
+    }
+
+
+def attach_item_refs(matched_pairs: List[Dict], catalog: Optional[Client] = None) -> List[Dict]:
+    """
+    Make pairs loaded from saved metadata downloadable again.
+
+    Adds 's1_item'/'s2_item' ItemRefs to every pair; export_matched_pairs()
+    then loads the full STAC items in one request per collection.
+
+    Args:
+        matched_pairs: Pairs from load_matched_pairs() or matched_pairs.json
+        catalog: STAC client (default: None, a new Planetary Computer client)
+
+    Returns:
+        The same pairs, updated in place
+    """
+    if not matched_pairs:
+        return matched_pairs
+    if catalog is None:
+        catalog = get_planetary_computer_client()
+
+    for prefix, collection in (('s1', "sentinel-1-rtc"), ('s2', "sentinel-2-l2a")):
+        # One row per distinct scene; a scene is often shared by several pairs
+        datetimes = {pair[f'{prefix}_id']: pair[f'{prefix}_datetime'] for pair in matched_pairs}
+        scenes = SceneCatalog.from_item_dicts(
+            collection,
+            ({'id': scene_id, 'properties': {'datetime': dt}} for scene_id, dt in datetimes.items()),
+            client=catalog
+        )
+        positions = {scene_id: index for index, scene_id in enumerate(datetimes)}
+        for pair in matched_pairs:
+            pair[f'{prefix}_item'] = ItemRef(scenes, positions[pair[f'{prefix}_id']])
+    return matched_pairs
+
+
+def _save_metadata(output_dir: str,
+                   matched_pairs: List[Dict],
+                   s1_count: int,
+                   s2_count: int,
+                   settings: Dict,
+                   metadata_format: str = 'json') -> str:
+    """Write matched_pairs.json or a matched_pairs.jsonl store and return its path."""
     os.makedirs(output_dir, exist_ok=True)
-    metadata_file = os.path.join(output_dir, 'matched_pairs.json')
-
-    # Prepare metadata (without STAC item objects)
-    pairs_metadata = []
-    for pair in matched_pairs:
-        pairs_metadata.append({
-            's1_id': pair['s1_id'],
-            's1_date': pair['s1_date'],
-            's1_datetime': pair['s1_datetime'],
-            's1_timestamp': pair['s1_timestamp'],
-            's1_orbit': pair['s1_orbit'],
-            's2_id': pair['s2_id'],
-            's2_date': pair['s2_date'],
-            's2_datetime': pair['s2_datetime'],
-            's2_timestamp': pair['s2_timestamp'],
-            's2_cloud_cover': pair['s2_cloud_cover'],
-            'time_diff_days': pair['time_diff_days']
-        })
-
-    metadata = {
-        'source': 'Microsoft Planetary Computer',
-        'bbox': bbox,
+
+    metadata = {'source': 'Microsoft Planetary Computer'}
+    metadata.update(settings)
+    metadata.update({
+        'total_s1_images': s1_count,
+        'total_s2_images': s2_count
+    })
+
+    with timings.span('metadata_write', pairs=len(matched_pairs)) as span:
+        if metadata_format == 'jsonl':
+            store = PairStore(os.path.join(output_dir, STORE_NAME))
+            store.clear()
+            store.append(_pair_metadata(pair) for pair in matched_pairs)
+            store.update_metadata(metadata)
+            metadata_file = store.path
+        else:
+            metadata_file = os.path.join(output_dir, JSON_NAME)
+            metadata.update({
+                'matched_pairs_count': len(matched_pairs),
+                'matched_pairs': [_pair_metadata(pair) for pair in matched_pairs]
+            })
+
+            with open(metadata_file, 'w') as f:
+                json.dump(metadata, f, indent=2)
+        span['file_bytes'] = os.path.getsize(metadata_file)
+
+    return metadata_file
+
+
+def _items_subset(items: Union[List[Dict], SceneCatalog],
+                  indices: np.ndarray) -> Union[List[Dict], SceneCatalog]:
+    """Selected scenes; records are copied since each ROI annotates its own coverage."""
+    if isinstance(items, SceneCatalog):
+        return items.subset(indices)
+    return [dict(items[i]) for i in indices.tolist()]
+
+
+def create_batch_dataset(rois: Union[str, List[Dict]],
+                         start_date: str = '2016-01-01',
+                         end_date: Optional[str] = None,
+                         cloud_percentage: float = 5.0,
+                         max_time_diff_days: int = 3,
+                         output_dir: str = './sentinel_dataset_mpc',
+                         orbit_direction: Optional[str] = None,
+                         options: Optional[DatasetOptions] = None,
+                         max_gap: float = 0.1,
+                         max_extent: float = 1.0,
+                         id_field: Optional[str] = None,
+                         **overrides) -> Dict[str, Tuple]:
+    """
+    Create datasets for many ROIs (e.g. reservoirs) with shared catalog searches.
+
+    Neighbouring ROIs are grouped with cluster_rois() and every group is
+    searched once per sensor over its bounding box. Each scene is then
+    assigned to the ROIs its footprint intersects and every ROI is matched
+    on its own, so the number of searches grows with the number of groups
+    rather than the number of ROIs. Coverage and overlap are measured
+    against the ROI geometry.
+
+    Args:
+        rois: GeoJSON/GeoPackage path, or list of {'id', 'geometry'} dicts with
+            a shapely or GeoJSON geometry in lon/lat
+        start_date: Start date in 'YYYY-MM-DD' format (default: '2016-01-01')
+        end_date: End date in 'YYYY-MM-DD' format (default: today)
+        cloud_percentage: Maximum cloud coverage for Sentinel-2 (default: 5.0%)
+        max_time_diff_days: Maximum time difference for pairing (default: 3 days)
+        output_dir: Directory holding one <roi id>/matched_pairs.json(l) per ROI
+            and batch_summary.json (default: './sentinel_dataset_mpc')
+        orbit_direction: Sentinel-1 orbit ('ascending'/'descending'/None)
+        options: Matching, search and output options as in create_dataset();
+            min_coverage and min_overlap are fractions of each ROI, and the
+            run report covers the whole batch (default: DatasetOptions())
+        max_gap: Largest distance in degrees between ROIs sharing a search (default: 0.1)
+        max_extent: Largest size in degrees of a shared search region (default: 1.0)
+        id_field: Feature property with the ROI name when rois is a path (default: None)
+        **overrides: DatasetOptions fields overriding those of options
+
+    Returns:
+        Dict mapping every ROI id to its (s1_items, s2_items, matched_pairs)
+    """
+    import shapely
+    from shapely.geometry import mapping, shape
+    from spatial_matching import assign_to_rois, cluster_rois, footprints_from_items, load_rois
+
+    options = replace(options or DatasetOptions(), **overrides)
+    settings = {
         'start_date': start_date,
         'end_date': end_date or datetime.now().strftime('%Y-%m-%d'),
         'cloud_percentage_threshold': cloud_percentage,
         'max_time_diff_days': max_time_diff_days,
         'orbit_direction': orbit_direction,
-        'total_s1_images': len(s1_items),
-        'total_s2_images': len(s2_items),
-        'matched_pairs_count': len(matched_pairs),
-        'matched_pairs': pairs_metadata
+        'matching': options.matching,
+        'min_coverage': options.min_coverage,
+        'min_overlap': options.min_overlap
     }
 
-    with open(metadata_file, 'w') as f:
-        json.dump(metadata, f, indent=2)
-
-    print(f"\n{'=' * 80}")
-    print("DATASET SUMMARY")
-    print(f"{'=' * 80}")
-    print(f"Total Sentinel-1 images: {len(s1_items)}")
-    print(f"Total Sentinel-2 images: {len(s2_items)}")
-    print(f"Matched pairs: {len(matched_pairs)}")
-    print(f"\nMetadata saved to: {metadata_file}")
-    print(f"{'=' * 80}\n")
-
-    return s1_items, s2_items, matched_pairs
-
-
-def download_image(item, output_path: str, bands: Optional[List[str]] = None):
+    with reporting('create_batch_dataset', options.report_path, options.quiet) as run:
+        if isinstance(rois, str):
+            rois = load_rois(rois, id_field=id_field)
+        geometries = [roi['geometry'] if isinstance(roi['geometry'], shapely.Geometry)
+                      else shape(roi['geometry']) for roi in rois]
+        clusters = cluster_rois(geometries, max_gap=max_gap, max_extent=max_extent)
+
+        log("=" * 80)
+        log("CREATING SENTINEL-1 & SENTINEL-2 DATASETS FOR MULTIPLE ROIS")
+        log("Using Microsoft Planetary Computer")
+        log("=" * 80)
+        log(f"ROIs: {len(rois)} in {len(clusters)} search regions")
+        log(f"Start Date: {start_date}")
+        log(f"End Date: {end_date or 'today'}")
+        log(f"Cloud Coverage Threshold: {cloud_percentage}%")
+        log(f"Max Temporal Difference: {max_time_diff_days} days")
+        log(f"Sentinel-1 Orbit: {orbit_direction or 'Both'}")
+        log(f"Matching: {options.matching}")
+        log("-" * 80)
+
+        catalog = get_planetary_computer_client()
+
+        results = {}
+        summary = []
+        for number, members in enumerate(clusters):
+            search_bbox = tuple(float(v) for v in shapely.total_bounds(
+                np.array([geometries[i] for i in members], dtype=object)))
+            log(f"\n[{number + 1}/{len(clusters)}] Search region {search_bbox} "
+                f"({len(members)} ROIs)")
+
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                s2_future = pool.submit(
+                    search_sentinel2, catalog, search_bbox, start_date, end_date, cloud_percentage,
+                    **_search_kwargs(options)
+                )
+                s1_future = pool.submit(
+                    search_sentinel1, catalog, search_bbox, start_date, end_date, orbit_direction,
+                    **_search_kwargs(options)
+                )
+                s2_found = s2_future.result()
+                s1_found = s1_future.result()
+
+            # Assign every scene to the ROIs its footprint intersects
+            member_geometries = [geometries[i] for i in members]
+            s2_hits = assign_to_rois(s2_found.footprints if options.compact else footprints_from_items(
+                [item['item'] for item in s2_found]), member_geometries)
+            s1_hits = assign_to_rois(s1_found.footprints if options.compact else footprints_from_items(
+                [item['item'] for item in s1_found]), member_geometries)
+
+            for position, roi_index in enumerate(members.tolist()):
+                roi_id = rois[roi_index]['id']
+                geometry = geometries[roi_index]
+                s1_items, s2_items, matched_pairs = _pair_region(
+                    _items_subset(s1_found, s1_hits[position]),
+                    _items_subset(s2_found, s2_hits[position]),
+                    geometry, max_time_diff_days, options.matching, options.min_coverage,
+                    options.min_overlap
+                )
+                _save_metadata(os.path.join(output_dir, roi_id), matched_pairs,
+                               len(s1_items), len(s2_items),
+                               dict(settings, roi_id=roi_id, roi_geometry=mapping(geometry),
+                                    bbox=tuple(geometry.bounds), search_bbox=search_bbox),
+                               options.metadata_format)
+                results[roi_id] = (s1_items, s2_items, matched_pairs)
+                summary.append({'roi_id': roi_id, 'search_region': number,
+                                'total_s1_images': len(s1_items), 'total_s2_images': len(s2_items),
+                                'matched_pairs_count': len(matched_pairs)})
+                log(f"  {roi_id}: {len(s1_items)} S1, {len(s2_items)} S2, "
+                    f"{len(matched_pairs)} matched pairs")
+
+        os.makedirs(output_dir, exist_ok=True)
+        summary_file = os.path.join(output_dir, 'batch_summary.json')
+        with open(summary_file, 'w') as f:
+            json.dump({
+                'search_regions': [{'rois': [rois[i]['id'] for i in members]} for members in clusters],
+                'rois': summary
+            }, f, indent=2)
+
+        total_pairs = sum(len(result[2]) for result in results.values())
+        run.update(rois=len(rois), search_regions=len(clusters), matched_pairs=total_pairs,
+                   summary_file=summary_file)
+
+        log(f"\n{'=' * 80}")
+        log("BATCH SUMMARY")
+        log(f"{'=' * 80}")
+        log(f"ROIs: {len(rois)}")
+        log(f"Search regions: {len(clusters)} ({2 * len(clusters)} catalog searches)")
+        log(f"Matched pairs: {total_pairs}")
+        log(f"\nSummary saved to: {summary_file}")
+        log(f"{'=' * 80}\n")
+
+        return results
+
+
+def download_image(item, output_path: str,
+                   bands: Optional[List[str]] = None,
+                   bbox: Optional[Tuple[float, float, float, float]] = None,
+                   stack: bool = False,
+                   resolution: Optional[float] = None,
+                   crs: Optional[str] = None,
+                   output_profile: str = 'gtiff'):
     """
     Download a single STAC item to local storage.
 
+    When a bbox is given, only the window intersecting it is read from each
+    Cloud-Optimized GeoTIFF (HTTP range requests on the internal tiles)
+    instead of the whole scene.
+
+    With stack=True every requested band is resampled onto one common grid
+    and written as a separate band of the output, so bands of different
+    resolutions (e.g. B04 at 10 m and B11 at 20 m) are co-registered.
+
     Args:
-        item: STAC Item object
+        item: STAC Item object, or an ItemRef from a SceneCatalog (loaded on demand)
         output_path: Path to save the downloaded file
         bands: List of bands to download (default: all available)
+        bbox: Region to read as (min_lon, min_lat, max_lon, max_lat) in WGS84
+            (default: None, the full asset extent)
+        stack: Resample all bands onto a common grid and stack them (default: False)
+        resolution: Pixel size of the stacked grid in CRS units (default: finest band)
+        crs: CRS of the stacked grid (default: CRS of the first band)
+        output_profile: 'gtiff' (plain GeoTIFF), 'cog' (tiled DEFLATE COG with
+            overviews) or 'cog-zstd' (same with ZSTD) (default: 'gtiff')
     """
-    import rasterio
     from rasterio.merge import merge
-    import numpy as np
+    from rasterio.warp import transform_bounds
 
-    print(f"Downloading {item.id}...")
+    if isinstance(item, ItemRef):
+        item = item.resolve()
+
+    log(f"Downloading {item.id}...")
 
     if bands is None:
         # Get all asset keys except metadata
         bands = [key for key in item.assets.keys()
                 if key not in ['thumbnail', 'metadata', 'info']]
 
-    # Download and merge bands if multiple
-    datasets = []
-    for band in bands[:3]:  # Limit to first 3 bands for example
-        if band in item.assets:
-            href = item.assets[band].href
-            datasets.append(rasterio.open(href))
-
-    if datasets:
-        mosaic, out_trans = merge(datasets)
+    if stack:
+        bands = [band for band in bands if band in item.assets]
+    else:
+        # Download and merge bands if multiple
+        bands = [band for band in bands[:3]  # Limit to first 3 bands for example
+                 if band in item.assets]
+    if not bands:
+        return
+
+    with timings.span('download', item=item.id, bands=len(bands)) as span:
+        datasets = open_assets([item.assets[band].href for band in bands])
+        try:
+            if stack:
+                grid = target_grid(datasets, bbox=bbox, crs=crs, resolution=resolution)
+                array = stack_assets(datasets, bands, grid)
+                write_raster(array, stack_meta(datasets, grid),
+                             output_path, descriptions=bands, profile=output_profile)
+            else:
+                bounds = None
+                if bbox is not None:
+                    if datasets[0].crs is None:
+                        log("  Asset has no CRS, reading the full extent")
+                    else:
+                        # Reproject the WGS84 bbox into the asset CRS; densify the edges
+                        # so the projected bounds enclose the curved UTM outline
+                        bounds = transform_bounds('EPSG:4326', datasets[0].crs, *bbox, densify_pts=21)
+
+                array, out_trans = merge(datasets, bounds=bounds)
+
+                out_meta = datasets[0].meta.copy()
+                out_meta["transform"] = out_trans
+                write_raster(array, out_meta, output_path, profile=output_profile)
+        finally:
+            for dataset in datasets:
+                dataset.close()
+        # Decoded pixel bytes read from the assets, and the size of the written file
+        span['decoded_bytes'] = int(array.nbytes)
+        span['file_bytes'] = os.path.getsize(output_path)
+
+    log(f"  Saved to: {output_path}")
+
+
+def read_pair_stack(pair: Dict,
+                    s2_bands: Optional[List[str]] = None,
+                    s1_bands: Optional[List[str]] = None,
+                    bbox: Optional[Tuple[float, float, float, float]] = None,
+                    resolution: Optional[float] = None,
+                    crs: Optional[str] = None,
+                    grid: Optional[Grid] = None) -> Tuple[np.ndarray, List[str], Grid, Dict]:
+    """
+    Read a matched pair as one co-registered (band, y, x) array.
 
-        out_meta = datasets[0].meta.copy()
-        out_meta.update({
-            "driver": "GTiff",
-            "height": mosaic.shape[1],
-            "width": mosaic.shape[2],
-            "transform": out_trans,
-            "count": mosaic.shape[0]
-        })
+    Sentinel-2 bands come first, followed by the Sentinel-1 bands, all
+    resampled in a single pass onto the grid of the finest Sentinel-2 band
+    (or the given crs/resolution). Bands are named 'S2_<band>' / 'S1_<band>'.
 
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    Args:
+        pair: Matched pair from create_dataset()
+        s2_bands: Sentinel-2 bands (default: ['B04', 'B03', 'B02'])
+        s1_bands: Sentinel-1 bands (default: ['vh', 'vv'])
+        bbox: Region to read in WGS84 (default: None, the S2 scene extent)
+        resolution: Pixel size in CRS units (default: finest S2 band)
+        crs: Target CRS (default: CRS of the first S2 band)
+        grid: Exact grid to resample onto, e.g. the grid of an earlier pair;
+            overrides bbox, resolution and crs (default: None)
 
-        with rasterio.open(output_path, "w", **out_meta) as dest:
-            dest.write(mosaic)
+    Returns:
+        Tuple of (array, band names, grid, rasterio profile with crs/transform/nodata)
+    """
+    if s2_bands is None:
+        s2_bands = ['B04', 'B03', 'B02']
+    if s1_bands is None:
+        s1_bands = ['vh', 'vv']
 
+    s2_item, s1_item = resolve_items([pair['s2_item'], pair['s1_item']])
+    log(f"Stacking {s2_item.id} + {s1_item.id}...")
+
+    names, hrefs = [], []
+    for prefix, item, bands in (('S2', s2_item, s2_bands), ('S1', s1_item, s1_bands)):
+        for band in bands:
+            if band not in item.assets:
+                raise KeyError(f"{item.id} has no asset {band!r}")
+            names.append(f"{prefix}_{band}")
+            hrefs.append(item.assets[band].href)
+
+    datasets = open_assets(hrefs)
+    try:
+        if grid is None:
+            # The grid is defined by the S2 bands, which come first
+            grid = target_grid(datasets[:len(s2_bands)] or datasets, bbox=bbox, crs=crs,
+                               resolution=resolution)
+        return stack_assets(datasets, names, grid), names, grid, stack_meta(datasets, grid)
+    finally:
         for dataset in datasets:
             dataset.close()
 
-        print(f"  Saved to: {output_path}")
+
+def download_pair_stack(pair: Dict, output_path: str,
+                        s2_bands: Optional[List[str]] = None,
+                        s1_bands: Optional[List[str]] = None,
+                        bbox: Optional[Tuple[float, float, float, float]] = None,
+                        resolution: Optional[float] = None,
+                        crs: Optional[str] = None,
+                        output_profile: str = 'gtiff'):
+    """
+    Download a matched pair as one co-registered multi-band GeoTIFF.
+
+    See read_pair_stack() for the band order and grid.
+
+    Args:
+        pair: Matched pair from create_dataset()
+        output_path: Path to save the stacked file
+        s2_bands: Sentinel-2 bands (default: ['B04', 'B03', 'B02'])
+        s1_bands: Sentinel-1 bands (default: ['vh', 'vv'])
+        bbox: Region to read in WGS84 (default: None, the S2 scene extent)
+        resolution: Pixel size in CRS units (default: finest S2 band)
+        crs: Target CRS (default: CRS of the first S2 band)
+        output_profile: Output profile, see download_image() (default: 'gtiff')
+    """
+    with timings.span('download', item=f"{pair['s1_id']}+{pair['s2_id']}") as span:
+        array, names, _, meta = read_pair_stack(pair, s2_bands, s1_bands, bbox=bbox,
+                                                resolution=resolution, crs=crs)
+        write_raster(array, meta, output_path, descriptions=names, profile=output_profile)
+        span['bands'] = len(names)
+        span['decoded_bytes'] = int(array.nbytes)
+        span['file_bytes'] = os.path.getsize(output_path)
+
+    log(f"  Saved to: {output_path}")
+
+
+def is_transient_error(error: Exception) -> bool:
+    """
+    Check whether a download error is worth retrying.
+
+    GDAL reports HTTP failures of remote assets as RasterioIOError messages
+    such as 'HTTP response code: 503'; requests exposes the status code on
+    the response.
+
+    Args:
+        error: Exception raised while downloading
+
+    Returns:
+        bool: True for timeouts, connection failures and retryable HTTP status codes
+    """
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status in TRANSIENT_HTTP_CODES:
+        return True
+
+    message = str(error).lower()
+    if any(f"http response code: {code}" in message for code in TRANSIENT_HTTP_CODES):
+        return True
+    return any(text in message for text in ('timed out', 'timeout', 'connection reset',
+                                            'connection refused', 'could not resolve host'))
+
+
+def _with_retries(download: Callable[[], None], retries: int, backoff: float) -> int:
+    """Call download(), retrying transient errors; returns the number of attempts."""
+    for attempt in range(retries + 1):
+        try:
+            download()
+            return attempt + 1
+        except Exception as e:
+            if attempt == retries or not is_transient_error(e):
+                raise
+            delay = backoff * 2 ** attempt
+            log(f"  Transient error ({e}); retrying in {delay:.1f}s [{attempt + 1}/{retries}]")
+            time.sleep(delay)
 
 
 def export_matched_pairs(matched_pairs: List[Dict],
                         output_dir: str = './sentinel_dataset_mpc/images',
                         max_pairs: Optional[int] = None,
                         s2_bands: Optional[List[str]] = None,
-                        s1_bands: Optional[List[str]] = None):
+                        s1_bands: Optional[List[str]] = None,
+                        max_workers: int = 4,
+                        retries: int = 3,
+                        backoff: float = 1.0,
+                        bbox: Optional[Tuple[float, float, float, float]] = None,
+                        resume: bool = True,
+                        verify_checksums: bool = False,
+                        stack: bool = False,
+                        resolution: Optional[float] = None,
+                        crs: Optional[str] = None,
+                        output_profile: str = 'gtiff',
+                        report_path: Optional[str] = None,
+                        quiet: bool = False) -> Dict:
     """
     Download matched image pairs to local storage.
 
+    Every distinct Sentinel-1 and Sentinel-2 scene is a separate task on a
+    pool of max_workers threads, so network waits overlap across pairs and
+    sensors. A scene shared by several pairs is downloaded once and copied.
+
+    Completed scenes are recorded in <output_dir>/download_manifest.json with
+    their size and SHA-256 checksum. Rerunning after an interruption skips
+    them, matching on scene id rather than on the position-based file names.
+
+    With stack=True each pair is instead written as one co-registered file
+    (S2 bands then S1 bands on a common grid, see download_pair_stack()).
+
     Args:
         matched_pairs: List of matched pairs from create_dataset()
         output_dir: Output directory for downloaded images
         max_pairs: Maximum number of pairs to download (default: all)
         s2_bands: Sentinel-2 bands to download (default: ['B04', 'B03', 'B02'])
         s1_bands: Sentinel-1 bands to download (default: ['vh', 'vv'])
+        max_workers: Maximum number of scenes downloaded at the same time (default: 4)
+        retries: Retries per scene on transient HTTP/connection errors (default: 3)
+        backoff: Initial retry delay in seconds, doubled after each retry (default: 1.0)
+        bbox: Only read the part of every scene inside this (min_lon, min_lat,
+            max_lon, max_lat) region, e.g. the bbox passed to create_dataset()
+            (default: None, full scenes)
+        resume: Skip scenes the manifest records as complete (default: True)
+        verify_checksums: Re-hash completed files before skipping them
+            instead of only checking their size (default: False)
+        stack: Write one resampled S2+S1 stack per pair instead of one file
+            per scene (default: False)
+        resolution: Pixel size of the stacks in CRS units (default: finest S2 band)
+        crs: CRS of the stacks (default: CRS of the S2 scene)
+        output_profile: 'gtiff' (plain GeoTIFF), 'cog' (tiled DEFLATE COG with
+            overviews) or 'cog-zstd' (same with ZSTD) (default: 'gtiff')
+        report_path: Write a run report with the time, decoded bytes and file
+            size of every scene download to this file, as JSON or, for a .prom path,
+            Prometheus text (default: None)
+        quiet: Silence the console output, e.g. in batch jobs (default: False)
+
+    Returns:
+        Dict with 'downloaded', 'skipped' and 'failed' scene counts and a
+        'failures' list describing every scene that could not be downloaded
     """
     if s2_bands is None:
         s2_bands = ['B04', 'B03', 'B02']  # RGB
     if s1_bands is None:
         s1_bands = ['vh', 'vv']
 
-    pairs_to_download = matched_pairs[:max_pairs] if max_pairs else matched_pairs
-
-    print(f"\n{'=' * 80}")
-    print(f"DOWNLOADING {len(pairs_to_download)} MATCHED IMAGE PAIRS")
-    print(f"{'=' * 80}")
-    print(f"Output directory: {output_dir}")
-    print(f"Sentinel-2 bands: {s2_bands}")
-    print(f"Sentinel-1 bands: {s1_bands}")
-    print("-" * 80)
+    with reporting('export_matched_pairs', report_path, quiet) as run:
+        pairs_to_download = matched_pairs[:max_pairs] if max_pairs else matched_pairs
+
+        log(f"\n{'=' * 80}")
+        log(f"DOWNLOADING {len(pairs_to_download)} MATCHED IMAGE PAIRS")
+        log(f"{'=' * 80}")
+        log(f"Output directory: {output_dir}")
+        log(f"Sentinel-2 bands: {s2_bands}")
+        log(f"Sentinel-1 bands: {s1_bands}")
+        log("-" * 80)
+
+        os.makedirs(output_dir, exist_ok=True)
+
+        # Load the STAC items behind SceneCatalog pairs in one request per collection
+        if any(isinstance(pair['s1_item'], ItemRef) or isinstance(pair['s2_item'], ItemRef)
+               for pair in pairs_to_download):
+            try:
+                with timings.span('resolve_items', items=2 * len(pairs_to_download)):
+                    resolve_items([pair[key] for pair in pairs_to_download for key in ('s1_item', 's2_item')])
+            except Exception as e:
+                log(f"Warning: could not prefetch STAC items: {e}")
+
+        manifest = DownloadManifest(os.path.join(output_dir, MANIFEST_NAME))
+
+        # One task per distinct scene (or S1+S2 stack), with every output file that needs it
+        scenes = {}
+        for i, pair in enumerate(pairs_to_download):
+            pair_name = f"pair_{i:04d}_diff_{pair['time_diff_days']:.2f}d"
+            if stack:
+                outputs = [('STACK', f"{pair['s1_id']}+{pair['s2_id']}", pair,
+                            [f"S2_{band}" for band in s2_bands] + [f"S1_{band}" for band in s1_bands],
+                            pair['s2_date'])]
+            else:
+                outputs = [(sensor, pair[f'{prefix}_id'], pair[f'{prefix}_item'], bands, pair[f'{prefix}_date'])
+                           for sensor, prefix, bands in (('S1', 's1', s1_bands), ('S2', 's2', s2_bands))]
+
+            for sensor, scene_id, item, bands, acquired in outputs:
+                scene = scenes.setdefault(scene_id, {
+                    'sensor': sensor,
+                    'item': item,
+                    'bands': bands,
+                    'pairs': [],
+                    'outputs': []
+                })
+                scene['pairs'].append(pair_name)
+                scene['outputs'].append(os.path.join(output_dir, f"{pair_name}_{sensor}_{acquired}.tif"))
+
+        def download(scene: Dict) -> int:
+            if stack:
+                task = lambda: download_pair_stack(scene['item'], scene['outputs'][0], s2_bands, s1_bands,
+                                                   bbox=bbox, resolution=resolution, crs=crs,
+                                                   output_profile=output_profile)
+            else:
+                task = lambda: download_image(scene['item'], scene['outputs'][0], scene['bands'], bbox,
+                                              output_profile=output_profile)
+            return _with_retries(task, retries, backoff)
+
+        # Stacks are resampled onto the requested grid; scene files keep their native one
+        grid = {'resolution': resolution, 'crs': crs} if stack else {}
+
+        skipped = 0
+        pending = {}
+        for scene_id, scene in scenes.items():
+            source = (manifest.completed_path(scene_id, scene['bands'], bbox, verify_checksums,
+                                              profile=output_profile, **grid)
+                      if resume else None)
+            if source is None:
+                pending[scene_id] = scene
+            else:
+                _copy_outputs(source, scene['outputs'])
+                skipped += 1
+
+        if skipped:
+            log(f"Resuming: {skipped}/{len(scenes)} scenes already downloaded")
+
+        failures = []
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {
+                pool.submit(download, scene): scene_id
+                for scene_id, scene in pending.items()
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                scene_id = futures[future]
+                scene = pending[scene_id]
+                try:
+                    future.result()
+                    _copy_outputs(scene['outputs'][0], scene['outputs'][1:])
+                    manifest.record(scene_id, scene['outputs'][0], scene['bands'], bbox,
+                                    profile=output_profile, **grid)
+                    log(f"[{done}/{len(pending)}] {scene['sensor']} {scene_id} done")
+                except Exception as e:
+                    log(f"[{done}/{len(pending)}] Error downloading {scene['sensor']} {scene_id}: {e}")
+                    failures.append({
+                        'pairs': scene['pairs'],
+                        'sensor': scene['sensor'],
+                        'id': scene_id,
+                        'output_path': scene['outputs'][0],
+                        'error': str(e)
+                    })
+
+        summary = {
+            'downloaded': len(pending) - len(failures),
+            'skipped': skipped,
+            'failed': len(failures),
+            'failures': failures
+        }
 
-    os.makedirs(output_dir, exist_ok=True)
+        log(f"\n{'=' * 80}")
+        log(f"Download complete! Images saved to: {output_dir}")
+        log(f"Downloaded {summary['downloaded']} scenes, skipped {skipped} already complete, "
+            f"{summary['failed']} failed")
+        for failure in failures:
+            log(f"  - {failure['sensor']} {failure['id']} ({', '.join(failure['pairs'])}): "
+                f"{failure['error']}")
+        log(f"{'=' * 80}\n")
+
+        run.update(summary)
+        return summary
+
+
+def _copy_outputs(source: str, targets: List[str]):
+    """Atomically copy a downloaded scene to the other output files that need it."""
+    for target in targets:
+        if target == source:
+            continue
+        if not os.path.exists(target) or os.path.getsize(target) != os.path.getsize(source):
+            partial = temp_path(target)
+            shutil.copyfile(source, partial)
+            os.replace(partial, target)
+
+
+def export_pairs_to_zarr(matched_pairs: List[Dict],
+                         zarr_path: str = './sentinel_dataset_mpc/pairs.zarr',
+                         bbox: Optional[Tuple[float, float, float, float]] = None,
+                         max_pairs: Optional[int] = None,
+                         s2_bands: Optional[List[str]] = None,
+                         s1_bands: Optional[List[str]] = None,
+                         resolution: Optional[float] = None,
+                         crs: Optional[str] = None,
+                         chunk_size: int = 512,
+                         max_workers: int = 4,
+                         retries: int = 3,
+                         backoff: float = 1.0) -> Dict:
+    """
+    Download matched pairs into one chunked Zarr datacube (time x band x y x x).
 
-    for i, pair in enumerate(pairs_to_download):
-        pair_name = f"pair_{i:04d}_diff_{pair['time_diff_days']:.2f}d"
+    The first pair defines the grid (see read_pair_stack()); every other
+    pair is resampled onto it. Pairs are read on a pool of max_workers
+    threads and appended in S2 acquisition order, so the time axis of a cube
+    written in one run is sorted. Pairs already in an existing cube are
+    skipped, which makes interrupted exports resumable; the pairs a resumed
+    run adds follow those already written, so sort the cube by time when
+    reading it after a resume (cube.sortby('time')).
 
-        print(f"\n[{i+1}/{len(pairs_to_download)}] Processing {pair_name}")
+    Args:
+        matched_pairs: List of matched pairs from create_dataset()
+        zarr_path: Zarr store directory
+        bbox: Region to read in WGS84, normally the bbox passed to create_dataset()
+            (default: None, the extent of the first S2 scene)
+        max_pairs: Maximum number of pairs to export (default: all)
+        s2_bands: Sentinel-2 bands (default: ['B04', 'B03', 'B02'])
+        s1_bands: Sentinel-1 bands (default: ['vh', 'vv'])
+        resolution: Pixel size in CRS units (default: finest S2 band)
+        crs: CRS of the cube (default: CRS of the first S2 scene)
+        chunk_size: Spatial chunk size in pixels (default: 512)
+        max_workers: Maximum number of pairs read at the same time (default: 4)
+        retries: Retries per pair on transient HTTP/connection errors (default: 3)
+        backoff: Initial retry delay in seconds, doubled after each retry (default: 1.0)
 
-        # Download Sentinel-1
-        s1_output = os.path.join(output_dir, f"{pair_name}_S1_{pair['s1_date']}.tif")
+    Returns:
+        Dict with 'written', 'skipped' and 'failed' pair counts and a 'failures' list
+    """
+    pairs_to_export = matched_pairs[:max_pairs] if max_pairs else matched_pairs
+
+    log(f"\n{'=' * 80}")
+    log(f"EXPORTING {len(pairs_to_export)} MATCHED PAIRS TO ZARR")
+    log(f"{'=' * 80}")
+    log(f"Zarr store: {zarr_path}")
+    log("-" * 80)
+
+    cube = ZarrCubeWriter(zarr_path, chunk_size=chunk_size)
+    pending = sorted((pair for pair in pairs_to_export if not cube.contains(pair)),
+                     key=lambda pair: pair['s2_timestamp'])
+    skipped = len(pairs_to_export) - len(pending)
+    if skipped:
+        log(f"Resuming: {skipped}/{len(pairs_to_export)} pairs already in the cube")
+
+    # Load the STAC items behind SceneCatalog pairs in one request per collection
+    if any(isinstance(pair['s1_item'], ItemRef) or isinstance(pair['s2_item'], ItemRef)
+           for pair in pending):
         try:
-            download_image(pair['s1_item'], s1_output, s1_bands)
+            resolve_items([pair[key] for pair in pending for key in ('s1_item', 's2_item')])
         except Exception as e:
-            print(f"  Error downloading S1: {e}")
-
-        # Download Sentinel-2
-        s2_output = os.path.join(output_dir, f"{pair_name}_S2_{pair['s2_date']}.tif")
+            log(f"Warning: could not prefetch STAC items: {e}")
+
+    failures = []
+    written = 0
+
+    def read(pair: Dict) -> Tuple:
+        result = []
+        _with_retries(lambda: result.append(
+            read_pair_stack(pair, s2_bands, s1_bands, bbox=bbox, resolution=resolution,
+                            crs=crs, grid=cube.grid)), retries, backoff)
+        return result[-1]
+
+    def append(pair: Dict, stacked: Tuple):
+        nonlocal written
+        array, names, grid, meta = stacked
+        cube.append(pair, array, names, grid, nodata=meta['nodata'])
+        written += 1
+        log(f"[{written + len(failures)}/{len(pending)}] Appended {pair['s2_id']}")
+
+    def fail(pair: Dict, error: Exception):
+        log(f"[{written + len(failures) + 1}/{len(pending)}] Error exporting "
+            f"{pair['s1_id']} + {pair['s2_id']}: {error}")
+        failures.append({'s1_id': pair['s1_id'], 's2_id': pair['s2_id'], 'error': str(error)})
+
+    remaining = list(pending)
+    # A new cube takes its grid from the first pair that can be read
+    while cube.grid is None and remaining:
+        pair = remaining.pop(0)
         try:
-            download_image(pair['s2_item'], s2_output, s2_bands)
+            append(pair, read(pair))
         except Exception as e:
-            print(f"  Error downloading S2: {e}")
+            fail(pair, e)
+
+    # Keep at most 2 * max_workers stacks in memory; the main thread is the only
+    # writer and appends in submission (time) order, while later reads continue
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        running = []
+        while remaining or running:
+            while remaining and len(running) < 2 * max_workers:
+                pair = remaining.pop(0)
+                running.append((pool.submit(read, pair), pair))
+            future, pair = running.pop(0)
+            try:
+                append(pair, future.result())
+            except Exception as e:
+                fail(pair, e)
+
+    summary = {
+        'written': written,
+        'skipped': skipped,
+        'failed': len(failures),
+        'failures': failures
+    }
+
+    log(f"\n{'=' * 80}")
+    log(f"Zarr export complete! Cube saved to: {zarr_path} ({len(cube)} pairs)")
+    log(f"Appended {written} pairs, skipped {skipped} already in the cube, {len(failures)} failed")
+    log(f"{'=' * 80}\n")
 
-    print(f"\n{'=' * 80}")
-    print(f"Download complete! Images saved to: {output_dir}")
-    print(f"{'=' * 80}\n")
+    return summary
 
 
 def get_sample_bbox() -> Tuple[float, float, float, float]:
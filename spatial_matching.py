@@ -0,0 +1,231 @@
+"""
+Footprint-Aware Spatial Matching for Sentinel-1 / Sentinel-2 Scenes
+
+This module provides bulk geometry operations on STAC item footprints used by
+sentinel_dataset_mpc.py:
+1. Convert STAC item geometries to shapely geometry arrays
+2. Compute the fraction of a region of interest covered by every footprint,
+   using an STRtree so scenes that miss the ROI are skipped without clipping
+3. Compute the fraction of the ROI covered by both scenes of each pair
+4. Load many ROIs (e.g. reservoir polygons), group neighbouring ROIs into
+   shared search regions and assign scenes back to the ROIs they intersect
+"""
+
+import json
+import os
+import re
+import numpy as np
+import shapely
+from shapely.geometry import box, shape
+from shapely.strtree import STRtree
+from scene_catalog import ItemRef
+from typing import Dict, List, Optional, Tuple, Union
+
+BBox = Tuple[float, float, float, float]
+
+
+def footprints_from_items(items: List) -> np.ndarray:
+    """
+    Build a shapely geometry array from STAC item footprints.
+
+    Args:
+        items: List of pystac.Item or ItemRef objects
+
+    Returns:
+        np.ndarray: Array of shapely geometries, in the same order as items.
+        Items without a geometry get an empty polygon.
+    """
+    footprints = []
+    for item in items:
+        if isinstance(item, ItemRef):
+            footprints.append(item.footprint)
+        elif item.geometry:
+            footprints.append(shape(item.geometry))
+        else:
+            footprints.append(shapely.Polygon())
+    return np.array(footprints, dtype=object)
+
+
+def _roi_geometry(roi: Union[BBox, Dict, shapely.Geometry]) -> shapely.Geometry:
+    """Accept a bbox tuple, a GeoJSON geometry dictionary or a shapely geometry."""
+    if isinstance(roi, shapely.Geometry):
+        return roi
+    if isinstance(roi, dict):
+        return shape(roi)
+    return box(*roi)
+
+
+def roi_coverage(footprints: np.ndarray,
+                 roi: Union[BBox, Dict, shapely.Geometry]) -> np.ndarray:
+    """
+    Compute the fraction of the ROI covered by each footprint.
+
+    Args:
+        footprints: Array of shapely footprint geometries
+        roi: Region of interest as a bbox (min_lon, min_lat, max_lon, max_lat),
+            a GeoJSON geometry dictionary or a shapely geometry
+
+    Returns:
+        np.ndarray: float64 coverage in [0, 1] for every footprint
+    """
+    roi = _roi_geometry(roi)
+    coverage = np.zeros(len(footprints), dtype=np.float64)
+    if len(footprints) == 0 or roi.area == 0:
+        return coverage
+
+    tree = STRtree(footprints)
+    hits = tree.query(roi, predicate='intersects')
+    if hits.size:
+        coverage[hits] = shapely.area(shapely.intersection(footprints[hits], roi)) / roi.area
+
+    return np.clip(coverage, 0.0, 1.0)
+
+
+def pair_overlap(s1_footprints: np.ndarray,
+                 s2_footprints: np.ndarray,
+                 roi: Union[BBox, Dict, shapely.Geometry]) -> np.ndarray:
+    """
+    Compute the fraction of the ROI covered by both footprints of each pair.
+
+    Args:
+        s1_footprints: Sentinel-1 footprint of every pair
+        s2_footprints: Sentinel-2 footprint of every pair, aligned with s1_footprints
+        roi: Region of interest as a bbox, GeoJSON geometry dictionary or shapely geometry
+
+    Returns:
+        np.ndarray: float64 overlap in [0, 1] for every pair
+    """
+    roi = _roi_geometry(roi)
+    if len(s1_footprints) == 0 or roi.area == 0:
+        return np.zeros(len(s1_footprints), dtype=np.float64)
+
+    shared = shapely.intersection(shapely.intersection(s1_footprints, s2_footprints), roi)
+    return np.clip(shapely.area(shared) / roi.area, 0.0, 1.0)
+
+
+def load_rois(path: str, id_field: Optional[str] = None) -> List[Dict]:
+    """
+    Read ROI polygons from a GeoJSON or GeoPackage file.
+
+    GeoJSON is read directly; other formats (GeoPackage, Shapefile) are read
+    with geopandas and reprojected to EPSG:4326.
+
+    Args:
+        path: GeoJSON FeatureCollection or any file geopandas can read
+        id_field: Feature property holding the ROI name (default: None, the
+            GeoJSON feature id or 'roi_XXXX' by position)
+
+    Returns:
+        List of {'id': str, 'geometry': shapely geometry} in lon/lat. Ids are
+        made safe for use as directory names.
+    """
+    if path.lower().endswith(('.geojson', '.json')):
+        with open(path) as f:
+            data = json.load(f)
+        features = data['features'] if data.get('type') == 'FeatureCollection' else [data]
+        records = [(feature.get('properties') or {}, feature.get('id'), shape(feature['geometry']))
+                   for feature in features if feature.get('geometry')]
+    else:
+        import geopandas as gpd
+
+        frame = gpd.read_file(path)
+        if frame.crs is not None:
+            frame = frame.to_crs(epsg=4326)
+        records = [(row.drop(labels=frame.geometry.name).to_dict(), None, row[frame.geometry.name])
+                   for _, row in frame.iterrows() if row[frame.geometry.name] is not None]
+
+    rois = []
+    for i, (properties, feature_id, geometry) in enumerate(records):
+        if id_field is not None:
+            if id_field not in properties:
+                raise ValueError(f"ROI {i} has no '{id_field}' property")
+            name = properties[id_field]
+        else:
+            name = feature_id if feature_id is not None else f"roi_{i:04d}"
+        rois.append({'id': re.sub(r'[^\w.-]+', '_', str(name)), 'geometry': geometry})
+
+    ids = [roi['id'] for roi in rois]
+    if len(set(ids)) < len(ids):
+        raise ValueError(f"ROI ids in {os.path.basename(path)} are not unique; pass id_field")
+    return rois
+
+
+def cluster_rois(geometries: List[shapely.Geometry],
+                 max_gap: float = 0.1,
+                 max_extent: float = 1.0) -> List[np.ndarray]:
+    """
+    Group neighbouring ROIs so that each group can share one catalog search.
+
+    ROIs closer than max_gap are linked (single linkage over an STRtree), and
+    groups whose bounding box grows beyond max_extent are split on a grid of
+    max_extent cells, so a search region never spans much more than one
+    Sentinel-2 tile (~1 degree).
+
+    Args:
+        geometries: ROI geometries in lon/lat
+        max_gap: Largest distance in degrees between linked ROIs (default: 0.1)
+        max_extent: Largest width or height of a group's bounding box in
+            degrees, before ROI sizes are added (default: 1.0)
+
+    Returns:
+        List of arrays of ROI positions, one per group, ordered by their
+        first ROI
+    """
+    if max_extent <= 0:
+        raise ValueError("max_extent must be positive")
+
+    geometries = np.array(geometries, dtype=object)
+    if len(geometries) == 0:
+        return []
+
+    # Union-find over all ROI pairs within max_gap
+    parent = np.arange(len(geometries))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    left, right = STRtree(geometries).query(geometries, predicate='dwithin', distance=max_gap)
+    for i, j in zip(left.tolist(), right.tolist()):
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+    roots = np.array([find(i) for i in range(len(geometries))])
+
+    centroids = shapely.get_coordinates(shapely.centroid(geometries))
+    clusters = []
+    for root in np.unique(roots):
+        members = np.flatnonzero(roots == root)
+        x_min, y_min, x_max, y_max = shapely.total_bounds(geometries[members])
+        if max(x_max - x_min, y_max - y_min) <= max_extent:
+            clusters.append(members)
+            continue
+        cells = np.floor(centroids[members] / max_extent).astype(np.int64)
+        _, labels = np.unique(cells, axis=0, return_inverse=True)
+        clusters.extend(members[labels.ravel() == label] for label in np.unique(labels))
+
+    return sorted(clusters, key=lambda members: members[0])
+
+
+def assign_to_rois(footprints: np.ndarray, rois: List[shapely.Geometry]) -> List[np.ndarray]:
+    """
+    Find the scenes whose footprint intersects each ROI.
+
+    Args:
+        footprints: Array of shapely footprint geometries
+        rois: ROI geometries
+
+    Returns:
+        For every ROI, the sorted positions of the intersecting footprints
+    """
+    if len(footprints) == 0:
+        return [np.zeros(0, dtype=np.int64) for _ in rois]
+
+    roi_index, item_index = STRtree(footprints).query(np.array(rois, dtype=object),
+                                                      predicate='intersects')
+    order = np.lexsort((item_index, roi_index))
+    roi_index, item_index = roi_index[order], item_index[order]
+    bounds = np.searchsorted(roi_index, np.arange(len(rois) + 1))
+    return [item_index[bounds[i]:bounds[i + 1]] for i in range(len(rois))]
@@ -0,0 +1,241 @@
+"""
+Persistent STAC Search Cache with Incremental Date-Range Top-Up
+
+This module provides StacSearchCache, a local SQLite cache for the STAC
+searches run by sentinel_dataset_mpc.py:
+1. Key searches by collection, bbox and query, and record which date
+   intervals have already been fetched for each key
+2. Store the item metadata of every fetched scene
+3. On later calls, only search the sub-intervals that are missing or whose
+   cached results are older than the configured expiry
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse, urlunparse
+
+from run_report import log, timed_pages
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS intervals (
+    search_key TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS intervals_key ON intervals (search_key);
+CREATE TABLE IF NOT EXISTS items (
+    search_key TEXT NOT NULL,
+    id TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    item_json TEXT NOT NULL,
+    PRIMARY KEY (search_key, id)
+);
+CREATE INDEX IF NOT EXISTS items_key_time ON items (search_key, timestamp);
+"""
+
+
+def _strip_sas_token(href: str) -> str:
+    """Remove a Shared Access Signature query string, which expires, from an href."""
+    parsed = urlparse(href)
+    if 'sig' in parse_qs(parsed.query):
+        return urlunparse(parsed._replace(query=''))
+    return href
+
+
+def _item_timestamp(item: Dict) -> int:
+    """Epoch milliseconds of a STAC item dictionary."""
+    value = item['properties']['datetime'].replace('Z', '+00:00')
+    return int(datetime.fromisoformat(value).timestamp() * 1000)
+
+
+def _date_to_ms(day: date) -> int:
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def missing_intervals(covered: List[Tuple[date, date]],
+                      start: date,
+                      end: date) -> List[Tuple[date, date]]:
+    """
+    Compute the parts of [start, end] not covered by any cached interval.
+
+    Args:
+        covered: Inclusive (start, end) date intervals already cached
+        start: First requested day
+        end: Last requested day (inclusive)
+
+    Returns:
+        List of inclusive (start, end) date intervals that still need a search
+    """
+    gaps = []
+    cursor = start
+    for interval_start, interval_end in sorted(covered):
+        if interval_end < cursor:
+            continue
+        if interval_start > end:
+            break
+        if interval_start > cursor:
+            gaps.append((cursor, interval_start - timedelta(days=1)))
+        cursor = max(cursor, interval_end + timedelta(days=1))
+        if cursor > end:
+            break
+    if cursor <= end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+class StacSearchCache:
+    """
+    SQLite-backed cache of STAC search results.
+
+    Date intervals are tracked per (collection, bbox, query) key at whole-day
+    resolution. Days from today onwards are never marked as covered, so scenes
+    published later today are picked up by the next call.
+
+    Every operation uses its own short-lived connection, so one cache can be
+    shared by the threads of a date-sharded search; the database runs in WAL
+    mode so they can read while another writes.
+
+    Args:
+        path: SQLite database file (default: './stac_cache.sqlite')
+        max_age_days: Re-search intervals fetched longer ago than this; None
+            keeps cached intervals forever (default: 7)
+    """
+
+    def __init__(self, path: str = './stac_cache.sqlite', max_age_days: Optional[float] = 7):
+        self.path = path
+        self.max_age_days = max_age_days
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Connection running one transaction, committed (or rolled back) and closed on exit."""
+        # Writers from other threads hold the lock briefly; wait instead of failing
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def search_key(collection: str,
+                   bbox: Tuple[float, float, float, float],
+                   query: Optional[Dict] = None) -> str:
+        """Stable hash identifying a search independently of its date range."""
+        payload = json.dumps([collection, [round(float(v), 6) for v in bbox], query or {}],
+                             sort_keys=True)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def search(self, catalog,
+               collection: str,
+               bbox: Tuple[float, float, float, float],
+               start_date: str,
+               end_date: str,
+               query: Optional[Dict] = None,
+               modifier: Optional[Callable] = None) -> List[Dict]:
+        """
+        Return STAC item dictionaries for a search, querying only missing dates.
+
+        Args:
+            catalog: STAC client (anything with a pystac_client-style search())
+            collection: STAC collection id
+            bbox: Bounding box (min_lon, min_lat, max_lon, max_lat)
+            start_date: Start date in 'YYYY-MM-DD' format
+            end_date: End date in 'YYYY-MM-DD' format (inclusive)
+            query: STAC query extension filter (default: None)
+            modifier: Callable applied to every returned item dictionary, e.g.
+                planetary_computer.sign_inplace to add fresh SAS tokens (default: None)
+
+        Returns:
+            List of STAC item dictionaries ordered by acquisition time
+        """
+        key = self.search_key(collection, bbox, query)
+        start = date.fromisoformat(start_date)
+        end = date.fromisoformat(end_date)
+        today = datetime.now(timezone.utc).date()
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT start_date, end_date, fetched_at FROM intervals WHERE search_key = ?",
+                (key,)
+            ).fetchall()
+
+        now = time.time()
+        covered = [
+            (date.fromisoformat(s), date.fromisoformat(e))
+            for s, e, fetched_at in rows
+            if self.max_age_days is None or now - fetched_at <= self.max_age_days * 86400
+        ]
+        gaps = missing_intervals(covered, start, end)
+
+        total_days = (end - start).days + 1
+        missing_days = sum((e - s).days + 1 for s, e in gaps)
+        log(f"  Cache: {total_days - missing_days}/{total_days} days cached, "
+            f"searching {len(gaps)} missing interval(s)")
+
+        for gap_start, gap_end in gaps:
+            search = catalog.search(
+                collections=[collection],
+                bbox=bbox,
+                datetime=f"{gap_start.isoformat()}/{gap_end.isoformat()}",
+                query=query
+            )
+            items = [feature for page in timed_pages(search.pages_as_dicts(), collection=collection)
+                     for feature in page.get('features', [])]
+            self._store(key, gap_start, gap_end, items,
+                        record_until=min(gap_end, today - timedelta(days=1)))
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT item_json FROM items WHERE search_key = ? AND timestamp >= ? AND timestamp < ? "
+                "ORDER BY timestamp",
+                (key, _date_to_ms(start), _date_to_ms(end + timedelta(days=1)))
+            ).fetchall()
+
+        items = [json.loads(row[0]) for row in rows]
+        if modifier is not None:
+            for item in items:
+                modifier(item)
+        return items
+
+    def _store(self, key: str, start: date, end: date, items: List[Dict], record_until: date):
+        """Replace the cached items of [start, end] and mark the settled days as covered."""
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM items WHERE search_key = ? AND timestamp >= ? AND timestamp < ?",
+                (key, _date_to_ms(start), _date_to_ms(end + timedelta(days=1)))
+            )
+            rows = []
+            for item in items:
+                for asset in item.get('assets', {}).values():
+                    if 'href' in asset:
+                        asset['href'] = _strip_sas_token(asset['href'])
+                rows.append((key, item['id'], _item_timestamp(item), json.dumps(item)))
+            conn.executemany("INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?)", rows)
+
+            if record_until >= start:
+                conn.execute(
+                    "DELETE FROM intervals WHERE search_key = ? AND start_date >= ? AND end_date <= ?",
+                    (key, start.isoformat(), record_until.isoformat())
+                )
+                conn.execute(
+                    "INSERT INTO intervals VALUES (?, ?, ?, ?)",
+                    (key, start.isoformat(), record_until.isoformat(), time.time())
+                )
+
+    def clear(self):
+        """Remove every cached search."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM intervals")
+            conn.execute("DELETE FROM items")
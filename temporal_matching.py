@@ -0,0 +1,452 @@
+"""
+Temporal Matching Engine for Sentinel-1 / Sentinel-2 Pairing
+
+This module provides the array-based matching primitives shared by
+sentinel_dataset.py (Google Earth Engine) and sentinel_dataset_mpc.py
+(Microsoft Planetary Computer):
+1. Convert scene metadata to sorted int64 epoch arrays
+2. Find the closest Sentinel-1 acquisition for every Sentinel-2 acquisition
+   with a binary search, in O((N + M) log M) instead of O(N * M)
+3. Solve a one-to-one assignment that never reuses a scene and minimizes the
+   total time difference, restricted to the sorted time windows
+4. Return the k closest candidates per Sentinel-2 acquisition as columns
+5. Match time-ordered scene streams incrementally, page by page
+"""
+
+import numpy as np
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Dict, List, Tuple, Union
+from scene_catalog import SceneCatalog
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+MS_PER_DAY = 86_400_000
+
+MATCHING_MODES = ('nearest', 'one_to_one')
+
+
+def timestamps_from_records(records: Union[List[Dict], SceneCatalog],
+                            key: str = 'timestamp',
+                            resolution_ms: int = 1) -> np.ndarray:
+    """
+    Build an int64 array of epoch milliseconds from scene metadata records.
+
+    Args:
+        records: List of scene metadata dictionaries or a SceneCatalog
+        key: Dictionary key holding the epoch timestamp in milliseconds (default: 'timestamp')
+        resolution_ms: Truncate timestamps to this resolution, e.g. 1000 for whole
+            seconds or MS_PER_DAY for whole days (default: 1 - no truncation)
+
+    Returns:
+        np.ndarray: int64 epoch milliseconds, in the same order as records
+    """
+    if isinstance(records, SceneCatalog):
+        times = records.column(key).astype(np.int64)
+    else:
+        times = np.fromiter((int(record[key]) for record in records),
+                            dtype=np.int64, count=len(records))
+    if resolution_ms > 1:
+        times = (times // resolution_ms) * resolution_ms
+    return times
+
+
+def nearest_matches(s1_times: np.ndarray,
+                    s2_times: np.ndarray,
+                    max_time_diff_days: float = 3) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Find the closest Sentinel-1 acquisition for every Sentinel-2 acquisition.
+
+    Both inputs are sorted once and each Sentinel-2 time is located in the
+    Sentinel-1 timeline with a binary search, so only the two neighbours
+    around the insertion point need to be compared. Ties are broken in favour
+    of the earliest Sentinel-1 acquisition, as the original pandas matcher did.
+
+    Args:
+        s1_times: Sentinel-1 epoch milliseconds (any order)
+        s2_times: Sentinel-2 epoch milliseconds (any order)
+        max_time_diff_days: Maximum time difference in days (default: 3)
+
+    Returns:
+        Tuple of (s2_indices, s1_indices, time_diff_days). Indices refer to
+        positions in the input arrays and rows are ordered by Sentinel-2 time.
+    """
+    s1_times = np.asarray(s1_times, dtype=np.int64)
+    s2_times = np.asarray(s2_times, dtype=np.int64)
+
+    empty = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float64))
+    if s1_times.size == 0 or s2_times.size == 0:
+        return empty
+
+    s1_order = np.argsort(s1_times, kind='stable')
+    s2_order = np.argsort(s2_times, kind='stable')
+    s1_sorted = s1_times[s1_order]
+    s2_sorted = s2_times[s2_order]
+
+    # First Sentinel-1 acquisition at or after each Sentinel-2 acquisition
+    right = np.searchsorted(s1_sorted, s2_sorted, side='left')
+    # Last acquisition before it, moved to the first of any run of equal times
+    left = np.maximum(right - 1, 0)
+    left = np.searchsorted(s1_sorted, s1_sorted[left], side='left')
+
+    has_left = right > 0
+    has_right = right < s1_sorted.size
+    right_clipped = np.minimum(right, s1_sorted.size - 1)
+
+    diff_left = np.where(has_left, s2_sorted - s1_sorted[left], np.iinfo(np.int64).max)
+    diff_right = np.where(has_right, s1_sorted[right_clipped] - s2_sorted, np.iinfo(np.int64).max)
+
+    use_left = diff_left <= diff_right
+    best = np.where(use_left, left, right_clipped)
+    best_diff = np.where(use_left, diff_left, diff_right)
+
+    valid = best_diff <= max_time_diff_days * MS_PER_DAY
+    if not valid.any():
+        return empty
+
+    s2_indices = s2_order[valid]
+    s1_indices = s1_order[best[valid]]
+    time_diff_days = best_diff[valid] / 1000 / 86400
+
+    return s2_indices, s1_indices, time_diff_days
+
+
+def one_to_one_matches(s1_times: np.ndarray,
+                       s2_times: np.ndarray,
+                       max_time_diff_days: float = 3) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Pair Sentinel-1 and Sentinel-2 acquisitions so that no scene is used twice.
+
+    The assignment maximizes the number of pairs and, among those, minimizes
+    the total time difference. On a single time axis an optimal assignment
+    never has crossing pairs, so it is solved with a dynamic programme over
+    the two sorted timelines that only visits the Sentinel-1 scenes inside
+    each Sentinel-2 window. Work and memory grow with the number of candidate
+    pairs rather than with N * M.
+
+    Args:
+        s1_times: Sentinel-1 epoch milliseconds (any order)
+        s2_times: Sentinel-2 epoch milliseconds (any order)
+        max_time_diff_days: Maximum time difference in days (default: 3)
+
+    Returns:
+        Tuple of (s2_indices, s1_indices, time_diff_days). Indices refer to
+        positions in the input arrays and rows are ordered by Sentinel-2 time.
+    """
+    s1_times = np.asarray(s1_times, dtype=np.int64)
+    s2_times = np.asarray(s2_times, dtype=np.int64)
+
+    empty = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float64))
+    if s1_times.size == 0 or s2_times.size == 0:
+        return empty
+
+    s1_order = np.argsort(s1_times, kind='stable')
+    s2_order = np.argsort(s2_times, kind='stable')
+    s1_sorted = s1_times[s1_order]
+    s2_sorted = s2_times[s2_order]
+
+    # Window of candidate Sentinel-1 scenes [lo, hi) for every Sentinel-2 scene
+    max_diff_ms = max_time_diff_days * MS_PER_DAY
+    lo = np.searchsorted(s1_sorted, s2_sorted - max_diff_ms, side='left').tolist()
+    hi = np.searchsorted(s1_sorted, s2_sorted + max_diff_ms, side='right').tolist()
+    s1_list = s1_sorted.tolist()
+    s2_list = s2_sorted.tolist()
+
+    # Each state is (pair count, total difference in ms, chain of chosen pairs)
+    # and holds the best assignment of the Sentinel-2 scenes processed so far
+    # to the first j Sentinel-1 scenes. Only the states inside the current
+    # window are stored; every j past the previous window shares prev_tail.
+    prev_band = [(0, 0, None)]
+    prev_lo = prev_hi = 0
+    prev_tail = (0, 0, None)
+
+    for row in range(len(s2_list)):
+        row_lo, row_hi = lo[row], hi[row]
+        s2_time = s2_list[row]
+
+        def previous(j):
+            return prev_band[j - prev_lo] if j <= prev_hi else prev_tail
+
+        band = [previous(row_lo)]
+        for j in range(row_lo + 1, row_hi + 1):
+            best = previous(j)
+            left = band[-1]
+            if left[0] > best[0] or (left[0] == best[0] and left[1] < best[1]):
+                best = left
+
+            count, total, chain = previous(j - 1)
+            diff = abs(s2_time - s1_list[j - 1])
+            count += 1
+            total += diff
+            if count > best[0] or (count == best[0] and total < best[1]):
+                best = (count, total, (row, j - 1, diff, chain))
+
+            band.append(best)
+
+        last = band[-1]
+        if last[0] > prev_tail[0] or (last[0] == prev_tail[0] and last[1] < prev_tail[1]):
+            prev_tail = last
+        prev_band, prev_lo, prev_hi = band, row_lo, row_hi
+
+    rows, cols, diffs = [], [], []
+    chain = prev_tail[2]
+    while chain is not None:
+        row, col, diff, chain = chain
+        rows.append(row)
+        cols.append(col)
+        diffs.append(diff)
+
+    if not rows:
+        return empty
+
+    rows = np.asarray(rows[::-1], dtype=np.intp)
+    cols = np.asarray(cols[::-1], dtype=np.intp)
+    diffs = np.asarray(diffs[::-1], dtype=np.int64)
+
+    return s2_order[rows], s1_order[cols], diffs / 1000 / 86400
+
+
+def topk_matches(s1_times: np.ndarray,
+                 s2_times: np.ndarray,
+                 max_time_diff_days: float = 3,
+                 k: int = 1) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Find up to k closest Sentinel-1 acquisitions for every Sentinel-2 acquisition.
+
+    The k nearest neighbours of a time in a sorted array lie within k positions
+    on either side of its insertion point, so only a (N, 2k) block of
+    candidates is evaluated.
+
+    Args:
+        s1_times: Sentinel-1 epoch milliseconds (any order)
+        s2_times: Sentinel-2 epoch milliseconds (any order)
+        max_time_diff_days: Maximum time difference in days (default: 3)
+        k: Maximum number of candidates per Sentinel-2 acquisition (default: 1)
+
+    Returns:
+        Tuple of (s2_indices, s1_indices, time_diff_days, ranks). Rows are
+        ordered by Sentinel-2 time and then by rank (0 = closest).
+    """
+    if k < 1:
+        raise ValueError(f"k must be at least 1, got {k}")
+
+    s1_times = np.asarray(s1_times, dtype=np.int64)
+    s2_times = np.asarray(s2_times, dtype=np.int64)
+
+    if s1_times.size == 0 or s2_times.size == 0:
+        return (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp),
+                np.empty(0, dtype=np.float64), np.empty(0, dtype=np.intp))
+
+    s1_order = np.argsort(s1_times, kind='stable')
+    s2_order = np.argsort(s2_times, kind='stable')
+    s1_sorted = s1_times[s1_order]
+    s2_sorted = s2_times[s2_order]
+
+    insert_at = np.searchsorted(s1_sorted, s2_sorted, side='left')
+    candidates = insert_at[:, None] + np.arange(-k, k)[None, :]
+    in_range = (candidates >= 0) & (candidates < s1_sorted.size)
+    candidates = np.clip(candidates, 0, s1_sorted.size - 1)
+
+    # A run of equal times may start before the window; take its first scenes
+    # instead of the last ones, so ties pick the same scenes as nearest_matches
+    first = candidates[:, 0]
+    shift = first - np.searchsorted(s1_sorted, s1_sorted[first], side='left')
+    same_run = (np.arange(2 * k) < k)[None, :] & (s1_sorted[candidates] == s1_sorted[first][:, None])
+    candidates = candidates - np.where(same_run, shift[:, None], 0)
+
+    diffs = np.abs(s1_sorted[candidates] - s2_sorted[:, None])
+    diffs = np.where(in_range, diffs, np.iinfo(np.int64).max)
+
+    # Stable sort keeps the earlier Sentinel-1 acquisition first on ties
+    nearest = np.argsort(diffs, axis=1, kind='stable')[:, :k]
+    candidates = np.take_along_axis(candidates, nearest, axis=1)
+    diffs = np.take_along_axis(diffs, nearest, axis=1)
+
+    valid = diffs <= max_time_diff_days * MS_PER_DAY
+    rows = np.broadcast_to(np.arange(s2_sorted.size)[:, None], valid.shape)
+    ranks = np.broadcast_to(np.arange(valid.shape[1])[None, :], valid.shape)
+
+    return (s2_order[rows[valid]], s1_order[candidates[valid]],
+            diffs[valid] / 1000 / 86400, ranks[valid].astype(np.intp))
+
+
+def candidates_frame(s1_records: Union[List[Dict], SceneCatalog],
+                     s2_records: Union[List[Dict], SceneCatalog],
+                     s2_indices: np.ndarray,
+                     s1_indices: np.ndarray,
+                     time_diff_days: np.ndarray,
+                     ranks: np.ndarray,
+                     s1_columns: Dict[str, str],
+                     s2_columns: Dict[str, str]) -> 'pd.DataFrame':
+    """
+    Build a columnar candidate table from match indices in a single pass.
+
+    Each metadata field is converted to an array once and gathered with the
+    index arrays, instead of building one dictionary per candidate pair.
+
+    Args:
+        s1_records: Sentinel-1 scene metadata records or SceneCatalog
+        s2_records: Sentinel-2 scene metadata records or SceneCatalog
+        s2_indices: Positions in s2_records
+        s1_indices: Positions in s1_records
+        time_diff_days: Time difference of each candidate in days
+        ranks: Rank of each candidate for its Sentinel-2 scene (0 = closest)
+        s1_columns: Mapping of output column name to Sentinel-1 record key
+        s2_columns: Mapping of output column name to Sentinel-2 record key
+
+    Returns:
+        pd.DataFrame: One row per candidate, including 's1_position' and
+        's2_position' columns that index back into the input records
+    """
+    import pandas as pd
+
+    columns = {
+        's2_position': s2_indices,
+        's1_position': s1_indices,
+        'rank': ranks,
+    }
+    for records, indices, mapping in ((s1_records, s1_indices, s1_columns),
+                                      (s2_records, s2_indices, s2_columns)):
+        for column, key in mapping.items():
+            if isinstance(records, SceneCatalog):
+                values = records.column(key)
+            else:
+                values = np.asarray([record[key] for record in records])
+            columns[column] = values[indices]
+    columns['time_diff_days'] = time_diff_days
+
+    return pd.DataFrame(columns)
+
+
+def match_indices(s1_times: np.ndarray,
+                  s2_times: np.ndarray,
+                  max_time_diff_days: float = 3,
+                  matching: str = 'nearest') -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Dispatch to the matching strategy selected by name.
+
+    Args:
+        s1_times: Sentinel-1 epoch milliseconds (any order)
+        s2_times: Sentinel-2 epoch milliseconds (any order)
+        max_time_diff_days: Maximum time difference in days (default: 3)
+        matching: 'nearest' (closest S1 scene per S2 scene, S1 scenes may repeat)
+            or 'one_to_one' (each scene used at most once) (default: 'nearest')
+
+    Returns:
+        Tuple of (s2_indices, s1_indices, time_diff_days)
+    """
+    if matching == 'nearest':
+        return nearest_matches(s1_times, s2_times, max_time_diff_days)
+    elif matching == 'one_to_one':
+        return one_to_one_matches(s1_times, s2_times, max_time_diff_days)
+    else:
+        raise ValueError(f"Unsupported matching mode: {matching} (expected one of {MATCHING_MODES})")
+
+
+class StreamingMatcher:
+    """
+    Incremental nearest-neighbour matcher for time-ordered scene streams.
+
+    Sentinel-1 and Sentinel-2 scenes are fed in ascending time order, page by
+    page. A Sentinel-2 scene is matched as soon as the Sentinel-1 stream has
+    moved past its time window, so pairs are emitted while later pages are
+    still being fetched. Sentinel-1 scenes that can no longer match any
+    upcoming Sentinel-2 scene are dropped, which keeps memory bounded by the
+    number of scenes inside one window. Until the first Sentinel-2 page
+    arrives, Sentinel-1 scenes more than one window older than the newest one
+    are dropped too, so that page must not start earlier than that; with this
+    order, results are identical to nearest_matches on the full arrays.
+
+    Args:
+        max_time_diff_days: Maximum time difference in days (default: 3)
+    """
+
+    def __init__(self, max_time_diff_days: float = 3):
+        self.max_diff_ms = max_time_diff_days * MS_PER_DAY
+        self._s1_times = []
+        self._s1_payloads = []
+        self._s2_pending = []
+        self._s1_done = False
+        self._s2_done = False
+        self._s2_last = None
+
+    @property
+    def done(self) -> bool:
+        """True once no further Sentinel-1 scene can produce a pair."""
+        return self._s2_done and not self._s2_pending
+
+    def add_s1(self, times: List[int], payloads: List) -> List[Tuple[object, object, float]]:
+        """
+        Add a page of Sentinel-1 scenes (ascending, not earlier than previous pages).
+
+        Returns:
+            Newly completed (s1_payload, s2_payload, time_diff_days) pairs
+        """
+        self._s1_times.extend(times)
+        self._s1_payloads.extend(payloads)
+        return self._drain()
+
+    def add_s2(self, times: List[int], payloads: List) -> List[Tuple[object, object, float]]:
+        """
+        Add a page of Sentinel-2 scenes (ascending, not earlier than previous pages).
+
+        Returns:
+            Newly completed (s1_payload, s2_payload, time_diff_days) pairs
+        """
+        self._s2_pending.extend(zip(times, payloads))
+        if times:
+            self._s2_last = times[-1]
+        return self._drain()
+
+    def finish_s1(self) -> List[Tuple[object, object, float]]:
+        """Mark the Sentinel-1 stream as exhausted and match everything pending."""
+        self._s1_done = True
+        return self._drain()
+
+    def finish_s2(self) -> List[Tuple[object, object, float]]:
+        """Mark the Sentinel-2 stream as exhausted."""
+        self._s2_done = True
+        return self._drain()
+
+    def _drain(self) -> List[Tuple[object, object, float]]:
+        s1_times = self._s1_times
+        s1_last = s1_times[-1] if s1_times else None
+        ready = 0
+        pairs = []
+
+        for s2_time, s2_payload in self._s2_pending:
+            # Later Sentinel-1 scenes could still fall inside this window
+            if not self._s1_done and (s1_last is None or s1_last <= s2_time + self.max_diff_ms):
+                break
+            ready += 1
+
+            right = bisect_left(s1_times, s2_time)
+            best, best_diff = None, None
+            if right > 0:
+                left = bisect_left(s1_times, s1_times[right - 1])
+                best, best_diff = left, s2_time - s1_times[left]
+            if right < len(s1_times) and (best is None or s1_times[right] - s2_time < best_diff):
+                best, best_diff = right, s1_times[right] - s2_time
+
+            if best is not None and best_diff <= self.max_diff_ms:
+                pairs.append((self._s1_payloads[best], s2_payload, best_diff / 1000 / 86400))
+
+        if ready:
+            del self._s2_pending[:ready]
+
+        # Upcoming Sentinel-2 scenes are no earlier than the oldest pending one
+        # (or the last one seen), so older Sentinel-1 scenes can be evicted.
+        # Before the first one, only a window of Sentinel-1 scenes is kept.
+        if self._s2_pending:
+            horizon = self._s2_pending[0][0]
+        elif self._s2_last is not None:
+            horizon = self._s2_last
+        else:
+            horizon = s1_last
+        if horizon is not None and s1_times:
+            cut = bisect_left(s1_times, horizon - self.max_diff_ms)
+            if cut:
+                del self._s1_times[:cut]
+                del self._s1_payloads[:cut]
+
+        return pairs
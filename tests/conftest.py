@@ -0,0 +1,12 @@
+"""
+Shared pytest setup: the modules live at the repository root and the offline
+fixtures (synthetic catalogs, LocalStacClient, COG writers) in benchmarks/.
+"""
+
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
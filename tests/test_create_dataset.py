@@ -0,0 +1,156 @@
+import json
+import os
+
+import pytest
+
+import sentinel_dataset_mpc
+from fixtures import DEFAULT_BBOX, LocalStacClient, synthetic_item_dicts
+from run_report import timings
+from sentinel_dataset_mpc import DatasetOptions, create_batch_dataset, create_dataset
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = LocalStacClient(synthetic_item_dicts('s1', 150, seed=2) + synthetic_item_dicts('s2', 300, seed=1))
+    monkeypatch.setattr(sentinel_dataset_mpc, 'get_planetary_computer_client', lambda: client)
+    return client
+
+
+def pair_ids(path):
+    with open(path) as f:
+        return [(pair['s1_id'], pair['s2_id']) for pair in json.load(f)['matched_pairs']]
+
+
+def test_options_and_keyword_overrides(client, tmp_path):
+    options = DatasetOptions(matching='one_to_one', compact=True)
+    create_dataset(DEFAULT_BBOX, '2016-01-01', '2017-06-30', 100.0, output_dir=str(tmp_path / 'a'),
+                   options=options, quiet=True)
+    create_dataset(DEFAULT_BBOX, '2016-01-01', '2017-06-30', 100.0, output_dir=str(tmp_path / 'b'),
+                   matching='one_to_one', compact=True, quiet=True)
+
+    a, b = pair_ids(tmp_path / 'a' / 'matched_pairs.json'), pair_ids(tmp_path / 'b' / 'matched_pairs.json')
+    assert a and a == b
+    with open(tmp_path / 'a' / 'matched_pairs.json') as f:
+        assert json.load(f)['matching'] == 'one_to_one'
+    # The options object is not modified by overrides
+    assert options.quiet is False
+
+    with pytest.raises(ValueError, match='metadata_format'):
+        create_dataset(DEFAULT_BBOX, output_dir=str(tmp_path / 'c'), metadata_format='csv')
+    with pytest.raises(TypeError):
+        create_dataset(DEFAULT_BBOX, output_dir=str(tmp_path / 'c'), matchign='nearest')
+
+
+def test_incremental_update_is_reported(client, tmp_path):
+    output_dir = str(tmp_path / 'dataset')
+    create_dataset(DEFAULT_BBOX, '2016-01-01', '2016-12-31', 100.0, output_dir=output_dir, quiet=True)
+
+    report_path = str(tmp_path / 'update.json')
+    create_dataset(DEFAULT_BBOX, '2016-01-01', '2017-06-30', 100.0, output_dir=output_dir,
+                   incremental=True, report_path=report_path, quiet=True)
+    with open(report_path) as f:
+        report = json.load(f)
+    assert report['run'] == 'create_dataset'
+    assert {'metadata_read', 'search_page', 'matching', 'metadata_write'} <= set(report['stages'])
+    assert report['result']['metadata_file'] == os.path.join(output_dir, 'matched_pairs.json')
+
+    # An update with nothing left to search still reports its run
+    create_dataset(DEFAULT_BBOX, '2016-01-01', '2016-01-31', 100.0, output_dir=output_dir,
+                   incremental=True, quiet=True)
+    assert timings.last_report['result']['new_pairs'] == 0
+
+
+
+def test_incremental_update_of_legacy_dataset(client, tmp_path):
+    # Every footprint lies in this region, which makes scenes dense enough to contest
+    min_lon, min_lat, max_lon, max_lat = DEFAULT_BBOX
+    region = (min_lon - 2, min_lat - 2, max_lon + 2, max_lat + 2)
+    full_dir, legacy_dir = str(tmp_path / 'full'), str(tmp_path / 'legacy')
+    create_dataset(region, '2016-01-01', '2017-06-30', 100.0, 3, full_dir, quiet=True)
+    create_dataset(region, '2016-01-01', '2016-12-31', 100.0, 3, legacy_dir, quiet=True)
+
+    # Rewrite the metadata in the layout of earlier versions, without matching options
+    path = os.path.join(legacy_dir, 'matched_pairs.json')
+    with open(path) as f:
+        metadata = json.load(f)
+    for key in ('matching', 'min_coverage', 'min_overlap'):
+        del metadata[key]
+    for pair in metadata['matched_pairs']:
+        del pair['overlap']
+    legacy_pairs = pair_ids(path)
+    with open(path, 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+    create_dataset(region, '2016-01-01', '2017-06-30', 100.0, 3, legacy_dir, incremental=True, quiet=True)
+    updated = pair_ids(path)
+    assert len(updated) > len(legacy_pairs)
+    assert updated == pair_ids(os.path.join(full_dir, 'matched_pairs.json'))
+    with open(path) as f:
+        assert json.load(f)['matching'] == 'nearest'
+
+    with pytest.raises(ValueError, match='matching'):
+        create_dataset(region, '2016-01-01', '2017-12-31', 100.0, 3, legacy_dir, matching='one_to_one',
+                       incremental=True, quiet=True)
+
+def test_batch_run_is_reported(client, tmp_path):
+    min_lon, min_lat, max_lon, max_lat = DEFAULT_BBOX
+    rois = [{'id': f'roi{i}', 'geometry': {'type': 'Point', 'coordinates': [min_lon + 0.1 * i, min_lat]}}
+            for i in range(3)]
+    report_path = str(tmp_path / 'batch.json')
+    results = create_batch_dataset(rois, '2016-01-01', '2016-12-31', 100.0, output_dir=str(tmp_path),
+                                   options=DatasetOptions(compact=True), report_path=report_path,
+                                   quiet=True)
+
+    assert set(results) == {'roi0', 'roi1', 'roi2'}
+    with open(report_path) as f:
+        report = json.load(f)
+    assert report['run'] == 'create_batch_dataset'
+    assert report['result']['rois'] == 3 and report['result']['search_regions'] == 1
+    assert report['result']['matched_pairs'] == sum(len(result[2]) for result in results.values())
+    assert report['stages']['metadata_write']['count'] == 3
+
+
+@pytest.mark.parametrize('metadata_format', ['json', 'jsonl'])
+@pytest.mark.parametrize('matching', ['nearest', 'one_to_one'])
+def test_incremental_updates_equal_full_rebuild(client, tmp_path, matching, metadata_format):
+    from pair_store import load_matched_pairs
+
+    # Every footprint lies in this region, which makes scenes dense enough to contest
+    min_lon, min_lat, max_lon, max_lat = DEFAULT_BBOX
+    region = (min_lon - 2, min_lat - 2, max_lon + 2, max_lat + 2)
+
+    def run(end_date, output_dir, **kwargs):
+        return create_dataset(region, '2016-01-01', end_date, 100.0, 3, str(tmp_path / output_dir),
+                              matching=matching, compact=True, metadata_format=metadata_format,
+                              quiet=True, **kwargs)
+
+    run('2017-12-31', 'full')
+    run('2016-05-31', 'daily')
+    # Daily and weekly runs leave S2 scenes near the end whose best S1 scene comes later
+    end_dates = [f"2016-06-{day:02d}" for day in range(1, 31)] + \
+        [f"2016-{month:02d}-{day:02d}" for month in range(7, 13) for day in (7, 14, 21, 28)] + \
+        ['2017-12-31', '2017-12-31']
+    searches = client.searches
+    for end_date in end_dates:
+        run(end_date, 'daily', incremental=True)
+    # One search per sensor and update, even when only the rematched window is searched
+    assert client.searches - searches == 2 * len(end_dates)
+
+    full = load_matched_pairs(str(tmp_path / 'full'))
+    daily = load_matched_pairs(str(tmp_path / 'daily'))
+    assert len(full['matched_pairs']) > 100
+    for key in ('total_s1_images', 'total_s2_images', 'end_date'):
+        assert daily[key] == full[key]
+    if matching == 'nearest':
+        assert daily['matched_pairs'] == full['matched_pairs']
+    else:
+        # Kept pairs are never revisited, so a rebuild may shift a chain of pairs
+        pairs = daily['matched_pairs']
+        assert len({pair['s1_id'] for pair in pairs}) == len({pair['s2_id'] for pair in pairs}) == len(pairs)
+        assert all(pair['time_diff_days'] <= 3 for pair in pairs)
+        assert len(pairs) >= 0.95 * len(full['matched_pairs'])
+        assert pairs[:20] == full['matched_pairs'][:20]
+
+    with pytest.raises(ValueError, match='max_time_diff_days'):
+        create_dataset(region, '2016-01-01', '2018-01-31', 100.0, 2, str(tmp_path / 'daily'),
+                       matching=matching, metadata_format=metadata_format, incremental=True, quiet=True)
@@ -0,0 +1,61 @@
+import json
+import os
+
+import pytest
+
+from download_manifest import DownloadManifest
+
+
+@pytest.fixture
+def scene_file(tmp_path):
+    path = tmp_path / 'pair_0000_S2.tif'
+    path.write_bytes(b'\0' * 128)
+    return str(path)
+
+
+def test_completed_scene_matches_request(tmp_path, scene_file):
+    manifest = DownloadManifest(str(tmp_path / 'manifest.json'))
+    manifest.record('S2A', scene_file, ['B04', 'B03'], bbox=(0, 0, 1, 1), profile='cog')
+
+    reloaded = DownloadManifest(manifest.path)
+    assert reloaded.completed_path('S2A', ['B04', 'B03'], (0, 0, 1, 1), profile='cog') == scene_file
+    assert reloaded.completed_path('S2A', ['B04', 'B03'], (0, 0, 1, 1), verify=True, profile='cog') == scene_file
+    assert reloaded.completed_path('S2A', ['B04'], (0, 0, 1, 1), profile='cog') is None
+    assert reloaded.completed_path('S2A', ['B04', 'B03'], None, profile='cog') is None
+    assert reloaded.completed_path('S2A', ['B04', 'B03'], (0, 0, 1, 1)) is None
+    assert reloaded.completed_path('S2B', ['B04', 'B03'], (0, 0, 1, 1), profile='cog') is None
+
+
+def test_stack_grid_must_match(tmp_path, scene_file):
+    manifest = DownloadManifest(str(tmp_path / 'manifest.json'))
+    manifest.record('S1A+S2A', scene_file, ['S2_B04', 'S1_vv'], resolution=20.0, crs='EPSG:32629')
+
+    assert manifest.completed_path('S1A+S2A', ['S2_B04', 'S1_vv'], resolution=20.0, crs='EPSG:32629') == scene_file
+    assert manifest.completed_path('S1A+S2A', ['S2_B04', 'S1_vv'], resolution=10.0, crs='EPSG:32629') is None
+    assert manifest.completed_path('S1A+S2A', ['S2_B04', 'S1_vv'], resolution=20.0, crs='EPSG:4326') is None
+    assert manifest.completed_path('S1A+S2A', ['S2_B04', 'S1_vv']) is None
+
+
+def test_changed_or_missing_file_is_downloaded_again(tmp_path, scene_file):
+    manifest = DownloadManifest(str(tmp_path / 'manifest.json'))
+    manifest.record('S2A', scene_file, ['B04'])
+
+    with open(scene_file, 'r+b') as f:
+        f.write(b'\1')
+    assert manifest.completed_path('S2A', ['B04']) == scene_file
+    assert manifest.completed_path('S2A', ['B04'], verify=True) is None
+
+    os.remove(scene_file)
+    assert manifest.completed_path('S2A', ['B04']) is None
+
+
+def test_entries_without_grid_count_as_native(tmp_path, scene_file):
+    # Manifests written before the grid was recorded
+    entry = {'path': scene_file, 'bands': ['B04'], 'bbox': None, 'profile': 'gtiff',
+             'size': 128, 'sha256': '', 'completed_at': '2024-01-01T00:00:00'}
+    path = tmp_path / 'manifest.json'
+    path.write_text(json.dumps({'scenes': {'S2A': entry}}))
+
+    manifest = DownloadManifest(str(path))
+    assert manifest.completed_path('S2A', ['B04']) == scene_file
+    assert manifest.completed_path('S2A', ['B04'], resolution=20.0) is None
@@ -0,0 +1,188 @@
+import json
+import sys
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from ee_export_scheduler import COMPLETED, FAILED, PENDING, RUNNING, ExportScheduler
+
+
+class FakeBatch:
+    """In-memory stand-in for ee.batch: tasks change state when a test says so."""
+
+    def __init__(self):
+        self.states = {}
+        self.errors = {}
+        self.unlisted = set()
+        self.submitted = []
+        batch = self
+
+        class Task:
+            def __init__(self, task_id, task_type, state, config=None, name=None):
+                self.id, self.name, self.config = task_id, name, config
+
+            @property
+            def state(self):
+                return batch.states[self.id]
+
+            def start(self):
+                self.id = f"T{len(batch.states)}"
+                self.name = f"projects/test/operations/{self.id}"
+                batch.states[self.id] = 'READY'
+                batch.submitted.append(self.config['description'])
+
+            def status(self):
+                if self.name is None:
+                    return {'state': 'UNSUBMITTED'}
+                status = {'state': batch.states[self.id]}
+                if self.id in batch.errors:
+                    status['error_message'] = batch.errors[self.id]
+                return status
+
+            @staticmethod
+            def list():
+                return [Task(task_id, None, None, name=f"projects/test/operations/{task_id}")
+                        for task_id in batch.states if task_id not in batch.unlisted]
+
+        def export(**params):
+            return Task(None, 'EXPORT_IMAGE', 'UNSUBMITTED', params)
+
+        self.Task = Task
+        self.Export = SimpleNamespace(image=SimpleNamespace(toDrive=export, toCloudStorage=export))
+
+    def finish(self, task_id, state='COMPLETED', error=None):
+        self.states[task_id] = state
+        if error:
+            self.errors[task_id] = error
+
+
+def factories(batch, count):
+    return {f"job{i}": (lambda name=f"job{i}": batch.Export.image.toDrive(description=name))
+            for i in range(count)}
+
+
+@pytest.fixture
+def batch():
+    return FakeBatch()
+
+
+def scheduler(tmp_path, batch, **kwargs):
+    kwargs = dict({'max_running': 2, 'poll_interval': 0, 'backoff': 0}, **kwargs)
+    return ExportScheduler(str(tmp_path / 'state.json'), batch=batch, **kwargs)
+
+
+def test_submit_poll_retry_complete(tmp_path, batch):
+    jobs = factories(batch, 3)
+    runner = scheduler(tmp_path, batch)
+
+    counts = runner.step(jobs)
+    assert counts[RUNNING] == 2 and counts[PENDING] == 1
+    assert batch.submitted == ['job0', 'job1']
+
+    batch.finish('T0')
+    batch.finish('T1', 'FAILED', error='quota exceeded')
+    counts = runner.step(jobs)
+    # job1 is resubmitted (backoff 0) and job2 takes the freed slot
+    assert runner.jobs['job0']['status'] == COMPLETED
+    assert runner.jobs['job1']['attempts'] == 2
+    assert runner.jobs['job1']['error'] == 'quota exceeded'
+    assert counts[RUNNING] == 2
+    assert batch.submitted == ['job0', 'job1', 'job1', 'job2']
+
+    for task_id in ('T2', 'T3'):
+        batch.finish(task_id)
+    summary = runner.run(jobs)
+    assert summary[COMPLETED] == 3 and summary['failures'] == []
+
+    with open(runner.state_path) as f:
+        saved = json.load(f)['jobs']
+    assert {job['status'] for job in saved.values()} == {COMPLETED}
+
+
+def test_gives_up_after_max_attempts(tmp_path, batch):
+    jobs = factories(batch, 1)
+    runner = scheduler(tmp_path, batch, max_attempts=2)
+    runner.step(jobs)
+    batch.finish('T0', 'FAILED', error='bad band')
+    runner.step(jobs)
+    batch.finish('T1', 'FAILED', error='bad band')
+
+    summary = runner.run(jobs)
+    assert summary[FAILED] == 1
+    assert summary['failures'] == [{'name': 'job0', 'error': 'bad band'}]
+
+
+
+def test_summary_only_counts_jobs_of_the_call(tmp_path, batch):
+    first = factories(batch, 2)
+    runner = scheduler(tmp_path, batch, max_attempts=1)
+    runner.step(first)
+    batch.finish('T0')
+    batch.finish('T1', 'FAILED', error='bad band')
+    assert runner.run(first)[FAILED] == 1
+
+    # Another job set sharing the state file, e.g. pairs of a later date range
+    second = {name.replace('job', 'next'): factory for name, factory in factories(batch, 3).items()}
+    runner = scheduler(tmp_path, batch, max_attempts=1)
+    counts = runner.step(second)
+    assert counts == {PENDING: 1, RUNNING: 2, COMPLETED: 0, FAILED: 0}
+    for task_id in ('T2', 'T3'):
+        batch.finish(task_id)
+    runner.step(second)
+    batch.finish('T4')
+
+    summary = runner.run(second)
+    assert summary[COMPLETED] == 3 and summary[FAILED] == 0 and summary['failures'] == []
+    assert len(runner.jobs) == 5
+
+def test_unlisted_task_falls_back_to_status(tmp_path, batch):
+    jobs = factories(batch, 1)
+    runner = scheduler(tmp_path, batch)
+    runner.step(jobs)
+
+    batch.unlisted.add('T0')
+    batch.finish('T0')
+    assert runner.run(jobs)[COMPLETED] == 1
+
+
+def test_unlisted_task_after_restart(tmp_path, batch):
+    jobs = factories(batch, 1)
+    scheduler(tmp_path, batch).step(jobs)
+
+    batch.unlisted.add('T0')
+    batch.finish('T0')
+    # A new process only has the task id and operation name from the state file
+    restarted = scheduler(tmp_path, batch)
+    assert restarted.run(jobs)[COMPLETED] == 1
+    assert batch.submitted == ['job0']
+
+
+def test_task_running_too_long_fails(tmp_path, batch):
+    jobs = factories(batch, 1)
+    runner = scheduler(tmp_path, batch, max_wait=60)
+    runner.step(jobs)
+    runner.jobs['job0']['submitted_at'] = time.time() - 120
+
+    summary = runner.run(jobs)
+    assert summary[FAILED] == 1
+    assert 'still running' in summary['failures'][0]['error']
+
+
+def test_export_matched_images_uses_scheduler_batch(tmp_path, batch, monkeypatch):
+    ee = mock.MagicMock()
+    monkeypatch.setitem(sys.modules, 'ee', ee)
+    import sentinel_dataset
+
+    pairs = [{'s1_index': f's1_{i}', 's2_index': f's2_{i}', 's1_date': '2020-01-01',
+              's2_date': '2020-01-02', 'time_diff_days': 1.0} for i in range(2)]
+    runner = scheduler(tmp_path, batch, max_running=10)
+    summary = sentinel_dataset.export_matched_images(
+        pairs, mock.Mock(), mock.Mock(), mock.Mock(), scheduler=runner, wait=False, quiet=True
+    )
+
+    assert summary[RUNNING] == 4
+    assert batch.submitted == ['pair_0000_diff_1.00d_S1_2020-01-01', 'pair_0000_diff_1.00d_S2_2020-01-02',
+                               'pair_0001_diff_1.00d_S1_2020-01-01', 'pair_0001_diff_1.00d_S2_2020-01-02']
+    ee.batch.Export.image.toDrive.assert_not_called()
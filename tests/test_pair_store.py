@@ -0,0 +1,115 @@
+import json
+
+import pytest
+
+from fixtures import synthetic_records
+from pair_store import PairStore, load_matched_pairs, pair_filter
+from sentinel_dataset_mpc import _pair_metadata, match_temporal_pairs
+
+FILTERS = [
+    {},
+    {'start_date': '2017-03-01', 'end_date': '2018-06-30'},
+    {'start_date': '2019-01-01', 'sensor': 's1'},
+    {'orbit': 'descending', 'max_cloud_cover': 10.0},
+    {'end_date': '2016-12-31', 'orbit': 'ascending'},
+    {'start_date': '2030-01-01'},
+]
+
+
+@pytest.fixture(scope='module')
+def pairs():
+    matched = match_temporal_pairs(synthetic_records('s1', 600, seed=2), synthetic_records('s2', 1500, seed=1))
+    return [_pair_metadata(pair) for pair in matched]
+
+
+@pytest.fixture
+def store(tmp_path, pairs):
+    store = PairStore(str(tmp_path / 'matched_pairs.jsonl'), block_size=64)
+    # Several appends, as incremental updates write them
+    for start in range(0, len(pairs), 250):
+        store.append(pairs[start:start + 250])
+    store.update_metadata({'matching': 'nearest', 'total_s1_images': 600})
+    return store
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_query_equals_filtered_pairs(store, pairs, filters, monkeypatch):
+    matches = pair_filter(**filters)
+    expected = [pair for pair in pairs if matches(pair)]
+
+    read = []
+    read_block = store._read_block
+    monkeypatch.setattr(store, '_read_block', lambda block: read.append(block) or read_block(block))
+    assert list(store.query(**filters)) == expected
+    if filters.get('start_date') == '2030-01-01':
+        assert read == []
+    elif 'end_date' in filters:
+        # Blocks outside the date range are skipped
+        assert len(read) < len(store.index['blocks'])
+
+
+def test_reopen_and_round_trip(store, pairs, tmp_path):
+    reopened = PairStore(store.path)
+    assert len(reopened) == len(pairs) > 100
+    assert reopened.load() == pairs
+    assert reopened.metadata == {'matching': 'nearest', 'total_s1_images': 600}
+
+    json_path = str(tmp_path / 'legacy.json')
+    reopened.to_json(json_path)
+    converted = PairStore.from_json(json_path, str(tmp_path / 'converted.jsonl'), block_size=100)
+    assert converted.load() == pairs and converted.metadata == reopened.metadata
+
+
+def test_rewrite_drops_stale_metadata(store, pairs, tmp_path):
+    json_path = str(tmp_path / 'legacy.json')
+    with open(json_path, 'w') as f:
+        json.dump({'matching': 'one_to_one', 'matched_pairs': pairs[:10]}, f)
+    # A rebuild in place keeps no pair or setting of the old dataset
+    rewritten = PairStore.from_json(json_path, store.path)
+    assert rewritten.metadata == {'matching': 'one_to_one'}
+    assert PairStore(store.path).metadata == {'matching': 'one_to_one'}
+    assert rewritten.load() == pairs[:10]
+
+
+@pytest.mark.parametrize('cut', [0.0, 0.4, 0.97, 1.1])
+def test_truncate(store, pairs, cut):
+    times = sorted(pair['s2_timestamp'] for pair in pairs)
+    boundary = times[min(int(cut * len(times)), len(times) - 1)] + (1 if cut > 1 else 0)
+    kept = [pair for pair in pairs if pair['s2_timestamp'] < boundary]
+
+    assert store.truncate(boundary) == len(pairs) - len(kept)
+    assert len(store) == len(kept)
+    assert PairStore(store.path).load() == kept
+
+    # Rematched pairs are appended after the kept ones
+    store.append(pairs[len(kept):])
+    assert PairStore(store.path).load() == pairs
+    assert list(store.query(start_date='2018-01-01')) == list(
+        filter(pair_filter(start_date='2018-01-01'), pairs))
+
+
+def test_interrupted_append_is_discarded(store, pairs):
+    with open(store.path, 'ab') as f:
+        f.write(b'{"s1_id": "half a li')
+    store.append(pairs[:3])
+    assert PairStore(store.path).load() == pairs + pairs[:3]
+
+
+def test_load_matched_pairs_from_either_format(store, pairs, tmp_path):
+    filters = {'start_date': '2017-01-01', 'max_cloud_cover': 20.0}
+    expected = list(filter(pair_filter(**filters), pairs))
+
+    from_store = load_matched_pairs(str(tmp_path), **filters)
+    json_path = str(tmp_path / 'matched_pairs.json')
+    store.to_json(json_path)
+    from_json = load_matched_pairs(json_path, **filters)
+
+    for data in (from_store, from_json):
+        assert data['matched_pairs'] == expected
+        assert data['matched_pairs_count'] == len(expected)
+        assert data['matching'] == 'nearest'
+    with open(json_path) as f:
+        assert json.load(f)['matched_pairs_count'] == len(pairs)
+
+    with pytest.raises(ValueError):
+        load_matched_pairs(str(tmp_path), sensor='s3')
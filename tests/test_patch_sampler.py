@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip('rasterio')
+
+from rasterio.crs import CRS  # noqa: E402
+from rasterio.transform import from_origin  # noqa: E402
+
+from patch_sampler import PatchSampler  # noqa: E402
+from raster_stack import write_raster  # noqa: E402
+
+
+@pytest.fixture
+def images_dir(tmp_path):
+    """Three separate S1/S2 pairs of 64x64 pixels on one grid."""
+    meta = {'crs': CRS.from_epsg(32629), 'transform': from_origin(480000, 4300000, 10, 10), 'nodata': 0}
+    rng = np.random.default_rng(0)
+    for i in range(3):
+        name = f"pair_{i:04d}_diff_1.00d"
+        write_raster(rng.integers(1, 10000, (2, 64, 64)).astype(np.uint16), meta,
+                     os.path.join(tmp_path, f"{name}_S2_2020-01-0{i + 1}.tif"))
+        write_raster(rng.uniform(0.01, 1, (2, 64, 64)).astype(np.float32), meta,
+                     os.path.join(tmp_path, f"{name}_S1_2020-01-0{i + 1}.tif"))
+    return str(tmp_path)
+
+
+def open_handles(sampler):
+    return [handle for cache in sampler._caches for handles in cache.values() for handle in handles]
+
+
+def test_epochs_close_their_datasets(images_dir):
+    sampler = PatchSampler.from_directory(images_dir, patch_size=32)
+    assert len(sampler) == 12
+
+    for seed in range(2):
+        patches = list(sampler.iter_patches(num_workers=3, prefetch=4, shuffle_buffer=4, seed=seed))
+        assert len(patches) == 12
+        assert patches[0]['s2'].shape == (2, 32, 32) and patches[0]['s1'].shape == (2, 32, 32)
+        assert open_handles(sampler) == []
+
+
+def test_abandoned_epoch_closes_its_datasets(images_dir):
+    sampler = PatchSampler.from_directory(images_dir, patch_size=32)
+    epoch = sampler.iter_patches(shuffle=False, num_workers=2, prefetch=2)
+    next(epoch)
+    assert open_handles(sampler)
+    epoch.close()
+    assert open_handles(sampler) == []
+
+
+def test_close_releases_map_style_reads(images_dir):
+    sampler = PatchSampler.from_directory(images_dir, patch_size=32)
+    sampler[0]
+    handles = open_handles(sampler)
+    assert len(handles) == 3  # S2, S1 and the S1 WarpedVRT
+    sampler.close()
+    assert all(handle.closed for handle in handles)
+    assert open_handles(sampler) == []
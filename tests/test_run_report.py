@@ -0,0 +1,24 @@
+from run_report import reporting, timings, to_prometheus
+
+
+def test_download_bytes_are_reported_as_decoded_and_written():
+    with reporting('export', quiet=True):
+        for size in (4_000_000, 6_000_000):
+            with timings.span('download') as span:
+                span['decoded_bytes'] = size
+                span['file_bytes'] = size // 4
+        with timings.span('matching', pairs=3):
+            pass
+
+    report = timings.last_report
+    download = report['stages']['download']
+    assert download['count'] == 2
+    assert (download['decoded_bytes'], download['file_bytes']) == (10_000_000, 2_500_000)
+    # Decoded pixels over wall time is not a transfer rate, so none is derived
+    assert 'mb_per_s' not in download
+    assert report['stages']['matching']['pairs'] == 3
+
+    text = to_prometheus(report)
+    assert 'sentinel_dataset_stage_decoded_bytes{run="export",stage="download"} 10000000' in text
+    assert 'sentinel_dataset_stage_file_bytes{run="export",stage="download"} 2500000' in text
+    assert 'mb_per_s' not in text
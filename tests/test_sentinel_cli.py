@@ -0,0 +1,73 @@
+import subprocess
+import sys
+
+import pytest
+
+import sentinel_cli
+
+BBOX = ['--bbox', '-9.3', '38.6', '-8.9', '38.9']
+
+
+def usage_error(capsys, argv):
+    with pytest.raises(SystemExit) as exit_info:
+        sentinel_cli.main(argv)
+    assert exit_info.value.code == 2
+    return capsys.readouterr().err
+
+
+def test_profile_choices(capsys, tmp_path):
+    err = usage_error(capsys, ['download', '--output-dir', str(tmp_path), '--profile', 'jpeg'])
+    assert "invalid choice: 'jpeg'" in err and "'cog-zstd'" in err
+
+
+@pytest.mark.parametrize('argv, message', [
+    (['match', '--backend', 'gee', '--cache', 'c.sqlite', '--incremental'] + BBOX,
+     '--incremental, --cache: only supported with --backend mpc'),
+    (['search', '--backend', 'gee', '--shard-days', '30'] + BBOX, '--shard-days: only supported'),
+    (['match', '--server-side'] + BBOX, '--server-side: only supported with --backend gee'),
+])
+def test_backend_options_are_usage_errors(capsys, argv, message):
+    assert message in usage_error(capsys, argv)
+
+
+def test_missing_dataset_is_a_usage_error(capsys, tmp_path):
+    assert 'run the match subcommand first' in usage_error(capsys, ['download', '--output-dir', str(tmp_path)])
+    err = usage_error(capsys, ['export', '--metadata', str(tmp_path / 'none.json')])
+    assert 'does not exist' in err
+
+
+def test_runtime_errors_are_not_usage_errors(monkeypatch):
+    def handler(args):
+        raise ValueError('start_date must be before end_date')
+
+    monkeypatch.setattr(sentinel_cli, 'match', handler)
+    # The handler is bound when the parser is built
+    with pytest.raises(ValueError, match='start_date'):
+        sentinel_cli.main(['match'] + BBOX)
+
+
+@pytest.mark.parametrize('command, summary, status', [
+    # ExportScheduler.run()
+    ('export', {'COMPLETED': 1, 'FAILED': 1, 'failures': [{'name': 'pair_0000_S1', 'error': 'quota'}]}, 1),
+    ('export', {'COMPLETED': 2, 'FAILED': 0, 'failures': []}, 0),
+    # download_matched_pairs()
+    ('download', {'downloaded': 1, 'skipped': 0, 'failed': 1, 'failures': [{'pair': 0, 'error': 'timeout'}]}, 1),
+])
+def test_failures_set_exit_status(monkeypatch, tmp_path, command, summary, status):
+    metadata = tmp_path / 'matched_pairs.json'
+    metadata.write_text('{"matched_pairs": []}')
+    monkeypatch.setattr(sentinel_cli, command, lambda args: summary)
+    assert sentinel_cli.main([command, '--metadata', str(metadata), '--quiet']) == status
+
+
+def test_help_does_not_load_backends():
+    source = ('import contextlib, io, sys, sentinel_cli\n'
+              'with contextlib.redirect_stdout(io.StringIO()):\n'
+              '    try:\n'
+              '        sentinel_cli.main(["download", "--help"])\n'
+              '    except SystemExit:\n'
+              '        pass\n'
+              'print(sorted(m for m in ("ee", "pandas", "pystac_client", "rasterio", "shapely") if m in sys.modules))')
+    output = subprocess.run([sys.executable, '-c', source], cwd=sentinel_cli.os.path.dirname(sentinel_cli.__file__),
+                            capture_output=True, text=True, check=True).stdout
+    assert output.strip() == '[]'
@@ -0,0 +1,137 @@
+import os
+
+import pytest
+
+from fixtures import synthetic_catalog, synthetic_item_dicts, synthetic_records
+from scene_catalog import ItemRef, SceneCatalog
+from sentinel_dataset_mpc import _s2_record, match_temporal_pairs
+
+
+@pytest.mark.parametrize('matching', ['nearest', 'one_to_one'])
+def test_catalog_pairs_equal_record_pairs(matching):
+    s1_catalog, s2_catalog = synthetic_catalog('s1', 400, seed=2), synthetic_catalog('s2', 1000, seed=1)
+    # The same scenes as records (cloud cover at the catalog's float32 precision)
+    s1_records = [s1_catalog[i] for i in range(len(s1_catalog))]
+    s2_records = [s2_catalog[i] for i in range(len(s2_catalog))]
+
+    from_catalogs = match_temporal_pairs(s1_catalog, s2_catalog, 3, matching)
+    from_records = match_temporal_pairs(s1_records, s2_records, 3, matching)
+
+    assert len(from_catalogs) > 100
+    assert [list(pair) for pair in from_catalogs] == [list(pair) for pair in from_records]
+    for catalog_pair, record_pair in zip(from_catalogs, from_records):
+        for key, value in record_pair.items():
+            if key.endswith('_item'):
+                assert isinstance(catalog_pair[key], ItemRef)
+                assert (catalog_pair[key].catalog, catalog_pair[key].index) == (value.catalog, value.index)
+            else:
+                assert catalog_pair[key] == value and type(catalog_pair[key]) is type(value)
+
+
+def test_mixed_inputs():
+    s1 = synthetic_records('s1', 100, seed=2)
+    pairs = match_temporal_pairs(s1, synthetic_catalog('s2', 250, seed=1))
+    assert pairs and all(isinstance(pair['s2_item'], ItemRef) and pair['s1_item'] is None for pair in pairs)
+    assert {type(pair['s2_cloud_cover']) for pair in pairs} == {float}
+
+
+def test_missing_cloud_cover_matches_in_both_paths():
+    from pystac import Item
+
+    items = synthetic_item_dicts('s2', 20, seed=1)
+    del items[3]['properties']['eo:cloud_cover']
+    catalog = SceneCatalog.from_item_dicts('sentinel-2-l2a', items)
+    records = [_s2_record(Item.from_dict(item)) for item in items]
+    assert catalog[3]['cloud_cover'] == records[3]['cloud_cover'] == 0.0
+
+    # Both paths pass the same value on to the pairs
+    s1 = [dict(synthetic_records('s1', 1, seed=2)[0], timestamp=records[3]['timestamp'])]
+    pairs = [match_temporal_pairs(s1, scenes)[0] for scenes in (catalog.subset([3]), records[3:4])]
+    assert pairs[0]['s2_cloud_cover'] == pairs[1]['s2_cloud_cover'] == 0.0
+
+
+def test_stack_resume_respects_grid(tmp_path):
+    pytest.importorskip('rasterio')
+    import rasterio
+
+    from fixtures import write_cog_fixtures
+    from sentinel_dataset_mpc import export_matched_pairs
+
+    assets = write_cog_fixtures(str(tmp_path / 'assets'), size=128)
+    pair = {'s1_id': 'S1A', 's2_id': 'S2A', 's1_item': assets['s1_item'], 's2_item': assets['s2_item'],
+            's1_date': '2020-01-01', 's2_date': '2020-01-02', 'time_diff_days': 1.0}
+    output_dir = str(tmp_path / 'images')
+
+    def export(resolution):
+        return export_matched_pairs([pair], output_dir, s2_bands=['B04'], s1_bands=['vv'],
+                                    stack=True, resolution=resolution, quiet=True)
+
+    assert export(20.0)['downloaded'] == 1
+    assert export(20.0)['skipped'] == 1
+    # A different grid is a different request, not a finished one
+    assert export(40.0)['downloaded'] == 1
+
+    (path,) = [name for name in os.listdir(output_dir) if name.endswith('.tif')]
+    with rasterio.open(os.path.join(output_dir, path)) as src:
+        assert src.res == (40.0, 40.0)
+
+
+def test_zero_thresholds_skip_geometry(monkeypatch):
+    import spatial_matching
+    from sentinel_dataset_mpc import filter_items_by_coverage, filter_pairs_by_overlap
+
+    def fail(*args, **kwargs):
+        raise AssertionError('footprints measured with a 0 threshold')
+
+    monkeypatch.setattr(spatial_matching, 'footprints_from_items', fail)
+    monkeypatch.setattr(spatial_matching, 'roi_coverage', fail)
+    items = synthetic_catalog('s2', 50, seed=1)
+    pairs = match_temporal_pairs(synthetic_records('s1', 20, seed=2), synthetic_records('s2', 50, seed=1))
+    assert filter_items_by_coverage(items, (0, 0, 1, 1), 0.0) is items
+    assert filter_pairs_by_overlap(pairs, (0, 0, 1, 1), 0.0) is pairs
+
+
+def test_streamed_pairs_can_be_saved():
+    from fixtures import LocalStacClient, synthetic_item_dicts
+    from sentinel_dataset_mpc import _pair_metadata, stream_matched_pairs
+
+    client = LocalStacClient(synthetic_item_dicts('s1', 60, seed=2) + synthetic_item_dicts('s2', 120, seed=1))
+    pairs = list(stream_matched_pairs(client, (-9.3, 38.6, -8.9, 38.9), '2016-01-01', '2017-01-01',
+                                      cloud_percentage=100))
+    assert pairs
+    assert all(_pair_metadata(pair)['overlap'] is None for pair in pairs)
+
+
+def test_zarr_cube_time_axis_is_sorted(tmp_path, monkeypatch):
+    pytest.importorskip('rasterio')
+    pytest.importorskip('zarr')
+    import time
+
+    import numpy as np
+    import xarray as xr
+
+    import sentinel_dataset_mpc
+    from fixtures import write_cog_fixtures
+
+    assets = write_cog_fixtures(str(tmp_path / 'assets'), size=64)
+    # Unsorted input; the earliest scenes take longest to read, so they finish last
+    days = [5, 1, 4, 2, 3, 0]
+    pairs = [{'s1_id': f'S1_{day}', 's2_id': f'S2_{day}', 's1_item': assets['s1_item'],
+              's2_item': assets['s2_item'], 's1_timestamp': (day * 86400 - 3600) * 1000,
+              's2_timestamp': day * 86400 * 1000, 'time_diff_days': 0.04} for day in days]
+
+    read_pair_stack = sentinel_dataset_mpc.read_pair_stack
+
+    def slow_read(pair, *args, **kwargs):
+        time.sleep(0.05 * (6 - int(pair['s2_id'][3:])))
+        return read_pair_stack(pair, *args, **kwargs)
+
+    monkeypatch.setattr(sentinel_dataset_mpc, 'read_pair_stack', slow_read)
+    summary = sentinel_dataset_mpc.export_pairs_to_zarr(
+        pairs, str(tmp_path / 'pairs.zarr'), s2_bands=['B04'], s1_bands=['vv'], max_workers=4)
+
+    assert summary['written'] == 6
+    with xr.open_zarr(str(tmp_path / 'pairs.zarr')) as cube:
+        times = cube['time'].values
+        assert (np.diff(times) > np.timedelta64(0)).all()
+        assert [str(s2_id) for s2_id in cube['s2_id'].values] == [f'S2_{day}' for day in sorted(days)]
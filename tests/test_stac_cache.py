@@ -0,0 +1,125 @@
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from fixtures import LocalStacClient, synthetic_item_dicts
+from stac_cache import StacSearchCache, missing_intervals
+
+BBOX = (-9.3, 38.6, -8.9, 38.9)
+S2 = 'sentinel-2-l2a'
+
+
+def d(value: str) -> date:
+    return date.fromisoformat(value)
+
+
+@pytest.mark.parametrize('covered, start, end, expected', [
+    ([], '2020-01-01', '2020-01-31', [('2020-01-01', '2020-01-31')]),
+    ([('2020-01-01', '2020-01-31')], '2020-01-01', '2020-01-31', []),
+    ([('2020-01-01', '2020-01-31')], '2020-01-10', '2020-01-20', []),
+    ([('2020-01-10', '2020-01-20')], '2020-01-01', '2020-01-31',
+     [('2020-01-01', '2020-01-09'), ('2020-01-21', '2020-01-31')]),
+    # Unsorted, overlapping and adjacent intervals
+    ([('2020-01-15', '2020-01-25'), ('2020-01-01', '2020-01-05'), ('2020-01-04', '2020-01-10'),
+      ('2020-01-11', '2020-01-12')], '2020-01-01', '2020-01-31',
+     [('2020-01-13', '2020-01-14'), ('2020-01-26', '2020-01-31')]),
+    ([('2019-12-01', '2019-12-31'), ('2020-03-01', '2020-03-31')], '2020-01-01', '2020-01-31',
+     [('2020-01-01', '2020-01-31')]),
+    ([('2020-01-01', '2020-01-01')], '2020-01-01', '2020-01-02', [('2020-01-02', '2020-01-02')]),
+])
+def test_missing_intervals(covered, start, end, expected):
+    covered = [(d(s), d(e)) for s, e in covered]
+    assert missing_intervals(covered, d(start), d(end)) == [(d(s), d(e)) for s, e in expected]
+
+
+@pytest.fixture
+def client():
+    # Recorded responses: 300 S2 items from 2016-01 onwards, served page by page
+    return LocalStacClient(synthetic_item_dicts('s2', 300, seed=1, assets={
+        'B04': 'https://example.blob.core.windows.net/s2/B04.tif?st=2024&se=2024&sig=abc'
+    }))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return StacSearchCache(str(tmp_path / 'cache.sqlite'))
+
+
+def ids(items):
+    return [item['id'] for item in items]
+
+
+def test_cached_range_is_not_searched_again(client, cache):
+    first = cache.search(client, S2, BBOX, '2016-01-01', '2016-06-30')
+    assert client.searches == 1 and first
+
+    again = cache.search(client, S2, BBOX, '2016-02-01', '2016-05-31')
+    assert client.searches == 1
+    assert ids(again) == [item['id'] for item in first
+                          if '2016-02-01' <= item['properties']['datetime'][:10] <= '2016-05-31']
+
+
+def test_extended_range_only_searches_new_days(client, cache):
+    cache.search(client, S2, BBOX, '2016-01-01', '2016-06-30')
+    searched = []
+    search = client.search
+    client.search = lambda **kwargs: searched.append(kwargs['datetime']) or search(**kwargs)
+
+    items = cache.search(client, S2, BBOX, '2015-12-01', '2016-09-30')
+    assert searched == ['2015-12-01/2015-12-31', '2016-07-01/2016-09-30']
+    direct = LocalStacClient(synthetic_item_dicts('s2', 300, seed=1)).search(
+        collections=[S2], bbox=BBOX, datetime='2015-12-01/2016-09-30',
+        sortby=[{'field': 'datetime', 'direction': 'asc'}])
+    assert ids(items) == ids(direct.items_as_dicts())
+
+
+def test_sas_tokens_are_not_cached(client, cache):
+    signed = []
+    items = cache.search(client, S2, BBOX, '2016-01-01', '2016-01-31', modifier=signed.append)
+    assert items and len(signed) == len(items)
+    assert all(item['assets']['B04']['href'].endswith('/B04.tif') for item in items)
+
+
+def test_days_from_today_are_searched_every_time(client, cache):
+    today = datetime.now(timezone.utc).date()
+    start = (today - timedelta(days=10)).isoformat()
+    cache.search(client, S2, BBOX, start, today.isoformat())
+
+    searched = []
+    search = client.search
+    client.search = lambda **kwargs: searched.append(kwargs['datetime']) or search(**kwargs)
+    cache.search(client, S2, BBOX, start, today.isoformat())
+    assert searched == [f"{today.isoformat()}/{today.isoformat()}"]
+
+
+def test_expired_intervals_are_searched_again(client, tmp_path):
+    cache = StacSearchCache(str(tmp_path / 'cache.sqlite'), max_age_days=7)
+    cache.search(client, S2, BBOX, '2016-01-01', '2016-03-31')
+    cache.search(client, S2, BBOX, '2016-01-01', '2016-03-31')
+    assert client.searches == 1
+
+    with sqlite3.connect(cache.path) as conn:
+        conn.execute("UPDATE intervals SET fetched_at = ?", (time.time() - 8 * 86400,))
+    items = cache.search(client, S2, BBOX, '2016-01-01', '2016-03-31')
+    assert client.searches == 2 and items
+
+    # Without expiry, cached intervals are kept forever
+    forever = StacSearchCache(cache.path, max_age_days=None)
+    with sqlite3.connect(cache.path) as conn:
+        conn.execute("UPDATE intervals SET fetched_at = 0")
+    forever.search(client, S2, BBOX, '2016-01-01', '2016-03-31')
+    assert client.searches == 2
+
+
+def test_concurrent_shards_share_one_cache(client, cache):
+    shards = [(f"2016-{month:02d}-01", f"2016-{month:02d}-28") for month in range(1, 13)]
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        results = list(pool.map(lambda shard: cache.search(client, S2, BBOX, *shard), shards))
+    assert all(results)
+
+    with sqlite3.connect(cache.path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM intervals").fetchone()[0] == 12
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
@@ -0,0 +1,140 @@
+from functools import lru_cache
+
+import numpy as np
+import pytest
+
+from temporal_matching import (MS_PER_DAY, StreamingMatcher, match_indices, nearest_matches,
+                               one_to_one_matches, topk_matches)
+
+HALF_DAY = MS_PER_DAY // 2
+
+
+def random_times(rng, count, days=30):
+    # Half-day steps make equal times and equal distances common
+    return rng.integers(0, 2 * days, size=count) * HALF_DAY
+
+
+def ranked_candidates(s1_times, s2_time, max_days):
+    """S1 indices within the window, closest first, earlier S1 scene first on ties."""
+    candidates = [(abs(int(s1_time) - int(s2_time)), int(s1_time), index)
+                  for index, s1_time in enumerate(s1_times)
+                  if abs(int(s1_time) - int(s2_time)) <= max_days * MS_PER_DAY]
+    return [index for _, _, index in sorted(candidates)]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_nearest_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    s1, s2 = random_times(rng, rng.integers(0, 30)), random_times(rng, rng.integers(0, 40))
+
+    s2_indices, s1_indices, diffs = nearest_matches(s1, s2, 2)
+
+    expected = {j: ranked_candidates(s1, s2[j], 2)[0] for j in range(len(s2)) if ranked_candidates(s1, s2[j], 2)}
+    assert dict(zip(s2_indices.tolist(), s1_indices.tolist())) == expected
+    assert len(s2_indices) == len(expected)
+    assert np.all(np.diff(s2[s2_indices]) >= 0)
+    np.testing.assert_allclose(diffs, np.abs(s2[s2_indices] - s1[s1_indices]) / MS_PER_DAY)
+
+
+@pytest.mark.parametrize('k', [1, 2, 3])
+@pytest.mark.parametrize('seed', range(10))
+def test_topk_matches_brute_force(seed, k):
+    rng = np.random.default_rng(seed)
+    s1, s2 = random_times(rng, 25), random_times(rng, 30)
+
+    s2_indices, s1_indices, diffs, ranks = topk_matches(s1, s2, 3, k=k)
+
+    rows = list(zip(s2_indices.tolist(), ranks.tolist(), s1_indices.tolist()))
+    expected = [(j, rank, i) for j in range(len(s2))
+                for rank, i in enumerate(ranked_candidates(s1, s2[j], 3)[:k])]
+    assert sorted(rows) == sorted(expected)
+    if k == 1:
+        nearest = nearest_matches(s1, s2, 3)
+        assert s2_indices.tolist() == nearest[0].tolist() and s1_indices.tolist() == nearest[1].tolist()
+
+    with pytest.raises(ValueError):
+        topk_matches(s1, s2, 3, k=0)
+
+
+def best_assignment(s1, s2, max_days):
+    """Largest pair count, then smallest total difference, by exhaustive search."""
+    @lru_cache(maxsize=None)
+    def best(j, used):
+        if j == len(s2):
+            return 0, 0
+        count, total = best(j + 1, used)
+        options = [(-count, total)]
+        for i in range(len(s1)):
+            diff = abs(int(s1[i]) - int(s2[j]))
+            if not used & (1 << i) and diff <= max_days * MS_PER_DAY:
+                count, total = best(j + 1, used | (1 << i))
+                options.append((-(count + 1), total + diff))
+        count, total = min(options)
+        return -count, total
+
+    return best(0, 0)
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_one_to_one_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    s1, s2 = random_times(rng, rng.integers(0, 8), days=6), random_times(rng, rng.integers(0, 8), days=6)
+
+    s2_indices, s1_indices, diffs = one_to_one_matches(s1, s2, 1)
+
+    assert len(set(s1_indices.tolist())) == len(s1_indices)
+    assert len(set(s2_indices.tolist())) == len(s2_indices)
+    gaps = np.abs(s2[s2_indices] - s1[s1_indices])
+    assert np.all(gaps <= MS_PER_DAY)
+    np.testing.assert_allclose(diffs, gaps / MS_PER_DAY)
+    assert (len(s2_indices), int(gaps.sum())) == best_assignment(s1, s2, 1)
+
+
+def test_match_indices_dispatch():
+    s1, s2 = np.array([0, MS_PER_DAY]), np.array([HALF_DAY, HALF_DAY])
+    assert len(match_indices(s1, s2, 1, 'nearest')[0]) == 2
+    assert len(match_indices(s1, s2, 1, 'one_to_one')[0]) == 2
+    with pytest.raises(ValueError):
+        match_indices(s1, s2, 1, 'closest')
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_streaming_matcher_equals_nearest(seed):
+    rng = np.random.default_rng(seed)
+    s1, s2 = np.sort(random_times(rng, 60, days=90)), np.sort(random_times(rng, 80, days=90))
+
+    matcher = StreamingMatcher(3)
+    pairs = []
+    streams = {'s1': 0, 's2': 0}
+    # Feed pages of random size in an arbitrary interleaving, after a first Sentinel-2 page
+    while streams['s1'] < len(s1) or streams['s2'] < len(s2):
+        sensor = rng.choice([name for name, times in (('s1', s1), ('s2', s2)) if streams[name] < len(times)])
+        sensor = 's2' if streams['s2'] == 0 else sensor
+        times = s1 if sensor == 's1' else s2
+        start = streams[sensor]
+        end = min(len(times), start + int(rng.integers(1, 10)))
+        streams[sensor] = end
+        add = matcher.add_s1 if sensor == 's1' else matcher.add_s2
+        pairs += add(times[start:end].tolist(), list(range(start, end)))
+        if end == len(times):
+            pairs += matcher.finish_s1() if sensor == 's1' else matcher.finish_s2()
+
+    s2_indices, s1_indices, diffs = nearest_matches(s1, s2, 3)
+    assert [(s2_index, s1_index) for s1_index, s2_index, _ in pairs] == \
+        list(zip(s2_indices.tolist(), s1_indices.tolist()))
+    np.testing.assert_allclose([diff for _, _, diff in pairs], diffs)
+    assert matcher.done
+
+
+def test_streaming_matcher_bounds_sentinel1_buffer():
+    matcher = StreamingMatcher(3)
+    # Two years of Sentinel-1 scenes every 12 hours, without any Sentinel-2 page
+    times = [day * MS_PER_DAY // 2 for day in range(1460)]
+    for start in range(0, len(times), 10):
+        assert matcher.add_s1(times[start:start + 10], times[start:start + 10]) == []
+        assert len(matcher._s1_times) <= 7
+    assert matcher._s1_times[0] >= times[-1] - 3 * MS_PER_DAY
+
+    # A first Sentinel-2 page within one window of the newest scene still finds its partner
+    assert matcher.add_s2([times[-1] - 2 * MS_PER_DAY], ['s2']) == []
+    assert matcher.finish_s1() == [(times[-1] - 2 * MS_PER_DAY, 's2', 0.0)]
@@ -0,0 +1,147 @@
+"""
+Chunked Zarr Datacube for Matched Sentinel-1 / Sentinel-2 Pairs
+
+This module provides ZarrCubeWriter, the store behind
+export_pairs_to_zarr() in sentinel_dataset_mpc.py:
+1. Keep every matched pair of a ROI in one xarray-compatible Zarr store with
+   a 'data' variable of dimensions time x band x y x x, on one common grid
+2. Append pairs one at a time along time as they are downloaded, with
+   chunks of one pair, one band and a spatial tile, so readers load only
+   the chunks they need
+3. Record the pair ids in the store, so an interrupted export can resume
+
+Read a cube back lazily with xarray:
+
+    import xarray as xr
+    cube = xr.open_zarr('pairs.zarr')
+    ndvi = cube.data.sel(band='S2_B08') - cube.data.sel(band='S2_B04')
+
+xarray and zarr are imported inside the methods, so the rest of the package
+works without them.
+"""
+
+import os
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from raster_stack import Grid
+
+
+class ZarrCubeWriter:
+    """
+    Append-only writer of a (time, band, y, x) Zarr datacube.
+
+    The grid and band list are fixed by the first appended pair and stored in
+    the cube attributes; later pairs must match them. Opening an existing
+    store continues it.
+
+    Args:
+        path: Zarr store directory
+        chunk_size: Spatial chunk size in pixels along y and x (default: 512)
+    """
+
+    def __init__(self, path: str, chunk_size: int = 512):
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+        self.path = path
+        self.chunk_size = chunk_size
+        self.grid: Optional[Grid] = None
+        self.bands: Optional[List[str]] = None
+        self.pairs: Set[Tuple[str, str]] = set()
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        """Read the grid, bands and pair ids of an existing cube."""
+        import xarray as xr
+        from affine import Affine
+        from rasterio.crs import CRS
+
+        with xr.open_zarr(self.path) as cube:
+            self.grid = Grid(
+                crs=CRS.from_wkt(cube.attrs['crs_wkt']),
+                transform=Affine.from_gdal(*cube.attrs['geotransform']),
+                width=cube.sizes['x'],
+                height=cube.sizes['y']
+            )
+            self.bands = [str(band) for band in cube['band'].values]
+            self.pairs = {(str(s1_id), str(s2_id))
+                          for s1_id, s2_id in zip(cube['s1_id'].values, cube['s2_id'].values)}
+
+    def __len__(self) -> int:
+        return len(self.pairs)
+
+    def contains(self, pair: Dict) -> bool:
+        """Check whether a matched pair is already in the cube."""
+        return (pair['s1_id'], pair['s2_id']) in self.pairs
+
+    def append(self, pair: Dict, array: np.ndarray, bands: List[str], grid: Grid,
+               nodata: Optional[float] = None):
+        """
+        Append one pair along the time dimension.
+
+        Args:
+            pair: Matched pair from create_dataset(); its S2 acquisition time
+                becomes the time coordinate
+            array: (band, y, x) stack from read_pair_stack()
+            bands: Band names of array
+            grid: Grid of array
+            nodata: Nodata value of array, stored as an attribute (default: None)
+        """
+        import xarray as xr
+
+        if self.grid is not None:
+            if list(bands) != self.bands:
+                raise ValueError(f"Bands {list(bands)} do not match the cube bands {self.bands}")
+            if (grid.width, grid.height) != (self.grid.width, self.grid.height) \
+                    or grid.transform != self.grid.transform or grid.crs != self.grid.crs:
+                raise ValueError("Pair grid does not match the cube grid; pass the cube grid "
+                                 "to read_pair_stack()")
+
+        variables = {
+            'data': (('time', 'band', 'y', 'x'), array[np.newaxis]),
+            's1_id': (('time',), np.array([pair['s1_id']], dtype=object)),
+            's2_id': (('time',), np.array([pair['s2_id']], dtype=object)),
+            's1_time': (('time',), [_pair_time(pair, 's1')]),
+            'time_diff_days': (('time',), np.array([pair['time_diff_days']], dtype=np.float32)),
+            'overlap': (('time',), np.array([pair.get('overlap', np.nan)], dtype=np.float32))
+        }
+
+        if self.grid is None:
+            transform = grid.transform
+            x = transform.c + (np.arange(grid.width) + 0.5) * transform.a
+            y = transform.f + (np.arange(grid.height) + 0.5) * transform.e
+            cube = xr.Dataset(
+                variables,
+                coords={
+                    'time': [_pair_time(pair, 's2')],
+                    'band': list(bands),
+                    'y': y,
+                    'x': x
+                },
+                attrs=_grid_attrs(grid)
+            )
+            if nodata is not None:
+                cube['data'].attrs['nodata'] = nodata
+            chunks = (1, 1, min(self.chunk_size, grid.height), min(self.chunk_size, grid.width))
+            cube.to_zarr(self.path, mode='w', encoding={'data': {'chunks': chunks}})
+            self.grid = grid
+            self.bands = list(bands)
+        else:
+            # Appends rewrite the store attributes, so repeat the grid description
+            cube = xr.Dataset(variables, coords={'time': [_pair_time(pair, 's2')]},
+                              attrs=_grid_attrs(self.grid))
+            cube.to_zarr(self.path, append_dim='time')
+
+        self.pairs.add((pair['s1_id'], pair['s2_id']))
+
+
+def _grid_attrs(grid: Grid) -> Dict:
+    """Cube attributes describing the grid (readable by GDAL-aware tools)."""
+    return {'crs_wkt': grid.crs.to_wkt(), 'geotransform': list(grid.transform.to_gdal())}
+
+
+def _pair_time(pair: Dict, sensor: str) -> np.datetime64:
+    """Acquisition time of one scene of a pair as a naive UTC datetime64."""
+    return np.datetime64(int(pair[f'{sensor}_timestamp']), 'ms').astype('datetime64[ns]')